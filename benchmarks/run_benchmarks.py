@@ -0,0 +1,310 @@
+"""
+Benchmarks for the hot paths of groundwork-validation.
+
+All benchmarks run offline. Databases are in-memory SQLite databases and files are created inside a temporary folder.
+Results are stored as JSON, so that two runs can be compared::
+
+    python benchmarks/run_benchmarks.py --output baseline.json
+    # ... change something ...
+    python benchmarks/run_benchmarks.py --output current.json --compare baseline.json
+
+Use ``--quick`` for a short run with smaller sizes and ``--only`` to select benchmark groups.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, String
+
+import groundwork
+from groundwork_validation.patterns import GwDbValidatorsPattern, GwFileValidatorsPattern, GwCmdValidatorsPattern
+from groundwork_validation.version import __version__
+
+KB = 1024
+MB = 1024 * KB
+
+#: Sizes of the full run. --quick uses the first entries only.
+DB_ROWS = [1000, 10000, 100000]
+FILE_SIZES = [64 * KB, MB, 64 * MB]
+BLOCK_SIZES = [4 * KB, 64 * KB, MB, None]
+#: Algorithms, which are compared for file hashing in addition to the default algorithm
+ALGORITHMS = ["blake2b", "blake2s-128", "fast"]
+
+
+class Benchmark_Plugin(GwDbValidatorsPattern, GwFileValidatorsPattern, GwCmdValidatorsPattern):
+    def __init__(self, app, **kwargs):
+        self.name = "Benchmark_Plugin"
+        super(Benchmark_Plugin, self).__init__(app, **kwargs)
+
+    def activate(self):
+        pass
+
+    def deactivate(self):
+        pass
+
+
+ATTRIBUTES = ["name", "description", "owner", "status", "category", "location", "comment", "tag"]
+
+
+class Attributes:
+    def __init__(self, index):
+        for attribute in ATTRIBUTES:
+            setattr(self, attribute, "%s_%s" % (attribute, index))
+        self.number = index
+        self.ratio = index / 3.0
+
+
+def measure(function, repeat):
+    """
+    Executes function repeat times and returns statistics of the needed time.
+    The garbage collector is disabled during each execution.
+    """
+    times = []
+    for _ in range(repeat):
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    return {"repeat": repeat,
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+            "max": max(times)}
+
+
+def bench_validator(args):
+    """
+    Validator.hash on small and large objects and on attribute lists.
+    """
+    app = groundwork.App()
+    plugin = Benchmark_Plugin(app)
+    validator = plugin.validators.register("bench_validator", "benchmark validator")
+    attribute_validator = plugin.validators.register("bench_attribute_validator", "benchmark validator",
+                                                     attributes=ATTRIBUTES + ["number", "ratio"])
+
+    small = {"name": "small", "values": [1, 2, 3], "enabled": True}
+    large = [{"index": index, "name": "entry_%s" % index, "values": list(range(10))}
+             for index in range(1000 if args.quick else 10000)]
+    objects = [Attributes(index) for index in range(1000)]
+    values = [attribute_validator._extractor(data) for data in objects]
+
+    loops = 1000 if args.quick else 10000
+    results = {}
+    results["hash_small"] = _per_item(measure(lambda: [validator.hash(small) for _ in range(loops)], args.repeat),
+                                      loops)
+    results["hash_large"] = _per_item(measure(lambda: validator.hash(large), args.repeat), len(large))
+    results["hash_attributes"] = _per_item(
+        measure(lambda: [attribute_validator.hash(data) for data in objects], args.repeat), len(objects))
+    results["hash_values"] = _per_item(
+        measure(lambda: [attribute_validator.hash_values(row) for row in values], args.repeat), len(values))
+    return results
+
+
+def bench_db(args):
+    """
+    Insert, update and refresh of DbValidator-validated models, with hashes in the hash database and in a
+    hash column of the model.
+    """
+    results = {}
+    for hash_column, prefix in [(None, ""), ("row_hash", "column_")]:
+        for rows in DB_ROWS[:2] if args.quick else DB_ROWS:
+            app = groundwork.App()
+            plugin = Benchmark_Plugin(app)
+            db = app.databases.register("bench_db", "sqlite://", "benchmark database")
+
+            class Test(db.Base):
+                __tablename__ = "bench"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False)
+                value = Column(Integer)
+
+            Test = db.classes.register(Test)
+            plugin.validators.db.register("bench_db_validator", "benchmark db validator", Test,
+                                          hash_column=hash_column)
+            db.create_all()
+
+            # Insert and update change the database, so each operation is measured once per number of rows
+            entries = [Test(name="entry_%s" % index, value=index) for index in range(rows)]
+
+            def insert():
+                db.session.add_all(entries)
+                db.commit()
+
+            def update():
+                for entry in entries:
+                    entry.value += 1
+                db.commit()
+
+            def refresh():
+                # All entries are expired by commit and still referenced, so the query refreshes and validates them
+                db.query(Test).all()
+
+            insert_result = measure(insert, 1)
+            refresh_result = measure(refresh, 1)
+            update_result = measure(update, 1)
+            results["%sinsert_%s" % (prefix, rows)] = _per_item(insert_result, rows)
+            results["%srefresh_%s" % (prefix, rows)] = _per_item(refresh_result, rows)
+            results["%supdate_%s" % (prefix, rows)] = _per_item(update_result, rows)
+            db.session.close()
+    return results
+
+
+def bench_file(args):
+    """
+    File hashing throughput for different file and block sizes.
+    """
+    app = groundwork.App()
+    plugin = Benchmark_Plugin(app)
+    folder = tempfile.mkdtemp(prefix="gw_validation_bench_")
+    results = {}
+    try:
+        for size in FILE_SIZES[:2] if args.quick else FILE_SIZES:
+            path = os.path.join(folder, "file_%s" % size)
+            with open(path, "wb") as afile:
+                afile.write(os.urandom(size))
+
+            for blocksize in BLOCK_SIZES:
+                key = "hash_%s_block_%s" % (_format_size(size), _format_size(blocksize) if blocksize else "auto")
+                result = measure(lambda: plugin.validators.file.hash(path, blocksize=blocksize), args.repeat)
+                result["bytes_per_second"] = size / result["median"]
+                results[key] = result
+
+            key = "hash_%s_mmap" % _format_size(size)
+            result = measure(lambda: plugin.validators.file.hash(path, use_mmap=True), args.repeat)
+            result["bytes_per_second"] = size / result["median"]
+            results[key] = result
+
+            for algorithm in ALGORITHMS:
+                validator = plugin.validators.get("bench_%s" % algorithm)
+                if validator is None:
+                    validator = plugin.validators.register("bench_%s" % algorithm, "benchmark validator",
+                                                           algorithm=algorithm)
+                key = "hash_%s_%s" % (_format_size(size), validator.algorithm_name)
+                result = measure(lambda: plugin.validators.file.hash(path, validator=validator), args.repeat)
+                result["bytes_per_second"] = size / result["median"]
+                results[key] = result
+    finally:
+        shutil.rmtree(folder)
+    return results
+
+
+def bench_cmd(args):
+    """
+    Latency of command validations.
+    """
+    app = groundwork.App()
+    plugin = Benchmark_Plugin(app)
+    python = sys.executable
+    results = {}
+    results["shell"] = measure(lambda: plugin.validators.cmd.validate("echo benchmark", search="benchmark"),
+                               args.repeat)
+    results["argument_list"] = measure(
+        lambda: plugin.validators.cmd.validate(["echo", "benchmark"], search="benchmark"), args.repeat)
+    results["stream"] = measure(
+        lambda: plugin.validators.cmd.validate(["echo", "benchmark"], search="benchmark", stream=True), args.repeat)
+    results["python"] = measure(
+        lambda: plugin.validators.cmd.validate([python, "-c", "print('benchmark')"], search="benchmark"),
+        args.repeat)
+    results["cached"] = measure(
+        lambda: plugin.validators.cmd.validate("echo benchmark", search="benchmark", cache_ttl=60), args.repeat)
+    return results
+
+
+BENCHMARKS = [("validator", bench_validator),
+              ("db", bench_db),
+              ("file", bench_file),
+              ("cmd", bench_cmd)]
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of the median time of each benchmark compared to the baseline.
+
+    :return: List of benchmark names, which are slower than allowed by threshold
+    """
+    regressions = []
+    for group, group_results in sorted(results["results"].items()):
+        for name, result in sorted(group_results.items()):
+            old = baseline["results"].get(group, {}).get(name, None)
+            if old is None:
+                continue
+            change = result["median"] / old["median"] - 1 if old["median"] else 0
+            key = "%s.%s" % (group, name)
+            marker = ""
+            if change > threshold:
+                marker = "  <-- slower"
+                regressions.append(key)
+            print("%-40s %12.6f s %12.6f s %+8.1f %%%s" % (key, old["median"], result["median"], change * 100, marker))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for groundwork-validation")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to store the results")
+    parser.add_argument("--compare", help="JSON file of a previous run, which is used as baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Allowed slow down compared to the baseline (0.1 = 10%%)")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of executions per benchmark")
+    parser.add_argument("--quick", action="store_true", help="Use smaller sizes for a short run")
+    parser.add_argument("--only", action="append", choices=[name for name, _ in BENCHMARKS],
+                        help="Run only the given benchmark group. Can be used multiple times")
+    args = parser.parse_args(argv)
+
+    results = {"meta": {"version": __version__,
+                        "python": platform.python_version(),
+                        "implementation": platform.python_implementation(),
+                        "platform": platform.platform(),
+                        "date": datetime.datetime.now().isoformat(),
+                        "quick": args.quick,
+                        "repeat": args.repeat},
+               "results": {}}
+
+    for name, benchmark in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        print("Running %s benchmarks ..." % name)
+        results["results"][name] = benchmark(args)
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    print("Results stored in %s" % args.output)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("%s benchmarks are slower than the baseline" % len(regressions))
+            return 1
+    return 0
+
+
+def _per_item(result, items):
+    result["items"] = items
+    result["items_per_second"] = items / result["median"]
+    return result
+
+
+def _format_size(size):
+    if size >= MB and size % MB == 0:
+        return "%sMB" % (size // MB)
+    if size >= KB and size % KB == 0:
+        return "%sKB" % (size // KB)
+    return "%sB" % size
+
+
+if __name__ == "__main__":
+    sys.exit(main())
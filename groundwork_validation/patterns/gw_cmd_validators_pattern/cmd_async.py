@@ -0,0 +1,81 @@
+"""
+asyncio based execution of command validations.
+
+This module is only imported by :class:`~groundwork_validation.patterns.gw_cmd_validators_pattern.\
+gw_cmd_validators_pattern.CmdValidatorsPlugin`, if an async function is used.
+"""
+import asyncio
+
+from groundwork_validation.patterns.gw_cmd_validators_pattern.gw_cmd_validators_pattern import \
+    CommandTimeoutExpired, NotAllowedReturnCode, _OutputMatcher, _kill_process, _get_popen_arguments, \
+    _executable_errors, _get_executable_error_result
+
+
+async def validate_async(cmd_plugin, command, search=None, regex=None, timeout=2, allowed_return_codes=None,
+                         decode="utf-8", cache_ttl=None, cwd=None, env=None):
+    allowed_return_codes = cmd_plugin._prepare(search, regex, allowed_return_codes)
+    matcher = _OutputMatcher(search, regex)
+
+    cache_key, cached = cmd_plugin._get_cached(command, cache_ttl, cwd, env)
+    if cached is not None:
+        return_code, output = cached
+        return cmd_plugin._evaluate(command, output, return_code, matcher, allowed_return_codes, decode).found
+
+    arguments = _get_popen_arguments(command, cwd, env, new_session=True)
+    args = arguments.pop("args")
+    try:
+        if arguments.pop("shell"):
+            process = await asyncio.create_subprocess_shell(args, stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.STDOUT, **arguments)
+        else:
+            process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.STDOUT, **arguments)
+    except _executable_errors as e:
+        output, return_code = _get_executable_error_result(e)
+        return cmd_plugin._evaluate(command, output, return_code, matcher, allowed_return_codes, decode).found
+
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        _kill_process(process)
+        await process.wait()
+        raise CommandTimeoutExpired("Command '%s' timed out after %s seconds" % (command, timeout))
+    except asyncio.CancelledError:
+        _kill_process(process)
+        raise
+
+    cmd_plugin._set_cached(cache_key, process.returncode, output)
+    return cmd_plugin._evaluate(command, output, process.returncode, matcher, allowed_return_codes, decode).found
+
+
+async def validate_all(cmd_plugin, commands, concurrency=None, return_exceptions=False):
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def run(arguments):
+        arguments = dict(arguments)
+        command = arguments.pop("command")
+        try:
+            if semaphore is None:
+                return await validate_async(cmd_plugin, command, **arguments)
+            async with semaphore:
+                return await validate_async(cmd_plugin, command, **arguments)
+        except (CommandTimeoutExpired, NotAllowedReturnCode, Exception) as e:
+            return _Failure(e)
+
+    results = await asyncio.gather(*[run(arguments) for arguments in commands])
+
+    for index, result in enumerate(results):
+        if isinstance(result, _Failure):
+            if not return_exceptions:
+                raise result.exception
+            results[index] = result.exception
+    return results
+
+
+class _Failure:
+    """
+    Wraps exceptions of single commands. Needed, because the exceptions of this pattern are no subclasses of
+    Exception, which are not handled by asyncio tasks of all supported python versions.
+    """
+    def __init__(self, exception):
+        self.exception = exception
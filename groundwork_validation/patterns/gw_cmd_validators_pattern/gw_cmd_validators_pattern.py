@@ -1,5 +1,14 @@
+import codecs
+import os
+import shutil
+import signal
 import sys
-from re import finditer
+import threading
+import time
+import warnings
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from re import compile as compile_regex
 
 from groundwork_validation.patterns import GwValidatorsPattern
 
@@ -11,6 +20,17 @@ else:
     import subprocess
 
 
+#: Result of :func:`CmdValidatorsPlugin.validate`, if return_result is True.
+#: valid is True, if all expectations were found and no limit was exceeded. exceeded contains the names of the
+#: exceeded limits ("max_duration", "max_cpu", "max_rss"). duration, user_time and system_time are given in seconds,
+#: max_rss (peak resident set size) in bytes. Not measurable values are None.
+CommandResult = namedtuple("CommandResult", ["valid", "found", "return_code", "duration", "user_time", "system_time",
+                                             "max_rss", "exceeded"])
+
+#: Resource usage of an executed command
+_ResourceUsage = namedtuple("_ResourceUsage", ["return_code", "duration", "user_time", "system_time", "max_rss"])
+
+
 class GwCmdValidatorsPattern(GwValidatorsPattern):
     """
     Allows the validation of output, return code and execution time of a given command.
@@ -37,21 +57,151 @@ class GwCmdValidatorsPattern(GwValidatorsPattern):
         super(GwCmdValidatorsPattern, self).__init__(app, **kwargs)
         self.app = app
         self.validators.cmd = CmdValidatorsPlugin(self)
+        if not hasattr(self.app.validators, "cmd"):
+            self.app.validators.cmd = CmdValidatorsApplication(self.app)
+
+
+class CmdValidatorsApplication:
+    """
+    Cares about command validations on application level.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.cache_ttl = self.app.config.get("VALIDATION_CMD_CACHE_TTL", 0)
+        self.cache = CommandCache(self.app.config.get("VALIDATION_CMD_CACHE_SIZE", 256))
 
 
 class CmdValidatorsPlugin:
 
     def __init__(self, plugin):
         self.plugin = plugin
+        self.app = plugin.app
 
-    def validate(self, command, search=None, regex=None, timeout=2, allowed_return_codes=None, decode="utf-8"):
+    def validate(self, command, search=None, regex=None, timeout=2, allowed_return_codes=None, decode="utf-8",
+                 stream=False, stop_on_match=False, overlap=None, cache_ttl=None, cwd=None, env=None,
+                 max_duration=None, max_cpu=None, max_rss=None, return_result=False):
         """
         Validates the output of a given command.
 
         The validation can be based on a simple string search or on a complex regular expression.
         Also the return_code can be validated. As well as the execution duration by setting a timeout.
 
+        In stream mode the output is searched while it gets read, without storing the complete output.
+        Only the last characters of already read output are kept (see overlap), so that matches across
+        the borders of read blocks are found.
+
+        search and regex can also be lists. Then all given strings or regular expressions must match.
+        Use :func:`match` to get the result of each of them.
+
+        If command is a list of arguments (e.g. ['git', '--version']), the command is executed directly without a
+        shell, which avoids the start of an additional shell process.
+        If the executable can not be found, the return code is 127 (like for a shell).
+
+        The limits max_duration, max_cpu and max_rss let the validation fail (return False), if the command needs
+        more resources. CPU time and peak memory usage are measured by os.wait4, which is only available on posix
+        systems. The cache is not used, if a limit is set or return_result is True.
+
         :param command: string, which is used as command for a new subprocess. E.g. 'git -v'.
+                        Or list of arguments, which is executed without a shell.
+        :param search: string or list of strings, which shall be contained in the output of the command.
+                       Default is None
+        :param regex:  regular expression or list of regular expressions, which is tested against the command
+                       output. Default is None
+        :param timeout: Time ins seconds, after which the execution is stopped and the validation fails.
+                        Default is 2 seconds
+        :param allowed_return_codes: List of allowed return values. Default is []
+        :param decode: Format of the console encoding, which shall be used. Default is 'utf-8'
+        :param stream: If True, the output is searched while it gets read. Default is False
+        :param stop_on_match: If True, the command gets killed as soon as the output matches. Enables stream mode.
+                              Can not be used together with allowed_return_codes. Default is False
+        :param overlap: Number of characters, which are kept from already read output. Matches must not be
+                        longer than overlap + 1 characters. If None, len(search) - 1 is used for search and
+                        1024 for regex.
+        :param cache_ttl: Seconds, for which return code and output of the command are cached and reused by
+                          other validations of the same command, environment and working directory.
+                          If None, VALIDATION_CMD_CACHE_TTL of the application configuration is used (default 0).
+                          0 deactivates the cache. Not used in stream mode.
+        :param cwd: Working directory of the command. If None, the current working directory is used.
+        :param env: Dictionary with environment variables for the command. If None, the current environment is used.
+        :param max_duration: Max. allowed wall clock time in seconds. Default is None
+        :param max_cpu: Max. allowed CPU time (user + system) in seconds. Default is None
+        :param max_rss: Max. allowed peak resident set size in bytes. Default is None
+        :param return_result: If True, a :class:`CommandResult` with the measured resource usage is returned.
+        :return: True, if validation succeeded. Else False.
+        """
+        allowed_return_codes = self._prepare(search, regex, allowed_return_codes)
+        matcher = _OutputMatcher(search, regex, overlap)
+        limits = OrderedDict()
+        for name, limit in (("max_duration", max_duration), ("max_cpu", max_cpu), ("max_rss", max_rss)):
+            if limit is not None:
+                limits[name] = limit
+        measure = return_result or len(limits) > 0
+        matcher, usage = self._execute(command, matcher, timeout, allowed_return_codes, decode, stream,
+                                       stop_on_match, cache_ttl, cwd, env, measure)
+        if not measure:
+            if not matcher.found:
+                self._increment_metric("failed_validations")
+            return matcher.found
+
+        exceeded = _get_exceeded_limits(usage, limits)
+        for name in exceeded:
+            self.plugin.log.debug("Command '%s' exceeded %s (%s)" % (command, name, limits[name]))
+        valid = matcher.found and len(exceeded) == 0
+        if not valid:
+            self._increment_metric("failed_validations")
+        if not return_result:
+            return valid
+        if usage is None:
+            return CommandResult(valid, matcher.found, None, None, None, None, None, exceeded)
+        return CommandResult(valid, matcher.found, usage.return_code, usage.duration, usage.user_time,
+                             usage.system_time, usage.max_rss, exceeded)
+
+    def match(self, command, search=None, regex=None, timeout=2, allowed_return_codes=None, decode="utf-8",
+              stream=False, stop_on_match=False, overlap=None, cache_ttl=None, cwd=None, env=None):
+        """
+        Executes a command once and checks its output against multiple expectations.
+
+        In contrast to :func:`validate`, search and regex can be used together::
+
+            results = self.validators.cmd.match("git --version", search=["git", "version"], regex="[0-9]+[.][0-9]+")
+            # results = {"git": True, "version": True, "[0-9]+[.][0-9]+": True}
+
+        Each expectation is only searched till it is found. Regular expressions are compiled once and cached.
+
+        :param command: string, which is used as command for a new subprocess. E.g. 'git -v'.
+                        Or list of arguments, which is executed without a shell.
+        :param search: string or list of strings. Default is None
+        :param regex: regular expression or list of regular expressions. Default is None
+        :param timeout: Time ins seconds, after which the execution is stopped and the validation fails.
+                        Default is 2 seconds
+        :param allowed_return_codes: List of allowed return values. Default is []
+        :param decode: Format of the console encoding, which shall be used. Default is 'utf-8'
+        :param stream: If True, the output is searched while it gets read. Default is False
+        :param stop_on_match: If True, the command gets killed as soon as all expectations are found.
+        :param overlap: Number of characters, which are kept from already read output in stream mode.
+        :param cache_ttl: Seconds, for which return code and output of the command are cached.
+                          If None, VALIDATION_CMD_CACHE_TTL of the application configuration is used.
+        :param cwd: Working directory of the command. If None, the current working directory is used.
+        :param env: Dictionary with environment variables for the command. If None, the current environment is used.
+        :return: Ordered dictionary with each given search string and regular expression as key and True or False
+                 as value.
+        """
+        allowed_return_codes = self._prepare(search, regex, allowed_return_codes, allow_both=True)
+        matcher = _OutputMatcher(search, regex, overlap)
+        return self._execute(command, matcher, timeout, allowed_return_codes, decode, stream, stop_on_match,
+                             cache_ttl, cwd, env)[0].results
+
+    def validate_async(self, command, search=None, regex=None, timeout=2, allowed_return_codes=None,
+                       decode="utf-8", cache_ttl=None, cwd=None, env=None):
+        """
+        Validates the output of a given command without blocking the event loop.
+
+        Works like :func:`validate`, but returns a coroutine, which must be awaited (needs python 3.5 or newer)::
+
+            found = await self.validators.cmd.validate_async("git --version", search="git version")
+
+        :param command: string, which is used as command for a new subprocess. E.g. 'git -v'.
+                        Or list of arguments, which is executed without a shell.
         :param search: string, which shall be contained in the output of the command. Default is None
         :param regex:  regular expression, which is tested against the command output.
                        Default is None
@@ -59,11 +209,79 @@ class CmdValidatorsPlugin:
                         Default is 2 seconds
         :param allowed_return_codes: List of allowed return values. Default is []
         :param decode: Format of the console encoding, which shall be used. Default is 'utf-8'
-        :return: True, if validation succeeded. Else False.
+        :param cache_ttl: Seconds, for which return code and output of the command are cached.
+                          If None, VALIDATION_CMD_CACHE_TTL of the application configuration is used.
+        :param cwd: Working directory of the command. If None, the current working directory is used.
+        :param env: Dictionary with environment variables for the command. If None, the current environment is used.
+        :return: coroutine, which returns True, if validation succeeded. Else False.
+        """
+        # Imported here, because the module uses syntax, which is not available for all supported python versions
+        from groundwork_validation.patterns.gw_cmd_validators_pattern.cmd_async import validate_async
+        return validate_async(self, command, search=search, regex=regex, timeout=timeout,
+                              allowed_return_codes=allowed_return_codes, decode=decode, cache_ttl=cache_ttl,
+                              cwd=cwd, env=env)
+
+    def validate_all_async(self, commands, concurrency=None, return_exceptions=False):
+        """
+        Validates multiple commands concurrently.
+
+        Each command is given as dictionary, which contains the key "command" and all other needed arguments
+        of :func:`validate`::
+
+            results = await self.validators.cmd.validate_all_async([
+                {"command": "git --version", "search": "git version"},
+                {"command": "java -version", "regex": "version \"1[1-9]", "timeout": 5},
+            ], concurrency=10)
+
+        :param commands: List of dictionaries
+        :param concurrency: Max. number of commands, which are executed at the same time. If None, all
+                            commands are executed at the same time.
+        :param return_exceptions: If True, exceptions like
+                                  :class:`CommandTimeoutExpired` are returned as result of the related command.
+                                  Otherwise the first exception is raised, after all commands have finished.
+        :return: coroutine, which returns a list of validation results in the order of the given commands.
+        """
+        from groundwork_validation.patterns.gw_cmd_validators_pattern.cmd_async import validate_all
+        return validate_all(self, commands, concurrency=concurrency, return_exceptions=return_exceptions)
+
+    def validate_all(self, commands, concurrency=None, return_exceptions=False):
+        """
+        Validates multiple commands concurrently and waits till all commands have finished.
+
+        Same as :func:`validate_all_async`, but can be called without an event loop.
+        So the overall needed time is defined by the slowest command and not by the sum of all commands.
+
+        A new event loop is used as current event loop of the thread, while the commands are executed.
+        The prior event loop is restored afterwards. Needs python 3.5 or newer.
+
+        :param commands: List of dictionaries
+        :param concurrency: Max. number of commands, which are executed at the same time. If None, all
+                            commands are executed at the same time.
+        :param return_exceptions: If True, exceptions are returned as result of the related command.
+        :return: List of validation results in the order of the given commands.
+        """
+        import asyncio
+        previous_loop = _get_current_loop(asyncio)
+        loop = asyncio.new_event_loop()
+        # Before python 3.8 subprocesses can only be created by the current event loop of the main thread,
+        # to which the child watcher must be attached
+        asyncio.set_event_loop(loop)
+        _attach_child_watcher(asyncio, loop)
+        try:
+            return loop.run_until_complete(self.validate_all_async(commands, concurrency=concurrency,
+                                                                   return_exceptions=return_exceptions))
+        finally:
+            asyncio.set_event_loop(previous_loop)
+            _attach_child_watcher(asyncio, previous_loop)
+            loop.close()
+
+    def _prepare(self, search, regex, allowed_return_codes, allow_both=False):
+        """
+        Checks the validation arguments and returns the allowed return codes as list.
         """
         if search is None and regex is None:
             raise ValueError("Parameter search or regex must be set.")
-        if search is not None and regex is not None:
+        if search is not None and regex is not None and not allow_both:
             raise ValueError("Only search OR regex is allowed to be used. Not both!")
 
         if allowed_return_codes is None:
@@ -72,32 +290,430 @@ class CmdValidatorsPlugin:
             allowed_return_codes = [allowed_return_codes]
         if not isinstance(allowed_return_codes, list):
             raise TypeError("allowed_return_code must be a list of integers")
+        return allowed_return_codes
+
+    @property
+    def metrics_name(self):
+        """
+        Name, which is used for the collected metrics of the command validations of the current plugin.
+        """
+        return "cmd_validations_%s" % self.plugin.name
+
+    def _increment_metric(self, counter):
+        metrics = self.app.validators.metrics
+        if metrics is not None:
+            metrics.increment(self.metrics_name, counter)
+
+    def _execute(self, command, matcher, timeout, allowed_return_codes, decode, stream=False,
+                 stop_on_match=False, cache_ttl=None, cwd=None, env=None, measure=False):
+        """
+        Executes a command and feeds its output into the given matcher.
+
+        :return: tuple of matcher and resource usage. The resource usage is None, if measure is False.
+        """
+        metrics = self.app.validators.metrics
+        if metrics is None:
+            return self._execute_command(command, matcher, timeout, allowed_return_codes, decode, stream,
+                                         stop_on_match, cache_ttl, cwd, env, measure)
+
+        start = time.perf_counter()
+        try:
+            return self._execute_command(command, matcher, timeout, allowed_return_codes, decode, stream,
+                                         stop_on_match, cache_ttl, cwd, env, measure)
+        except CommandTimeoutExpired:
+            metrics.increment(self.metrics_name, "timeouts")
+            raise
+        finally:
+            metrics.increment(self.metrics_name, "executions")
+            metrics.observe(self.metrics_name, "execution_seconds", time.perf_counter() - start)
+
+    def _execute_command(self, command, matcher, timeout, allowed_return_codes, decode, stream=False,
+                         stop_on_match=False, cache_ttl=None, cwd=None, env=None, measure=False):
+        if stream or stop_on_match or measure:
+            if stop_on_match and len(allowed_return_codes) > 0:
+                raise ValueError("stop_on_match can not be used together with allowed_return_codes, because the "
+                                 "command gets killed before its return code is known.")
+            return self._execute_process(command, matcher, timeout, allowed_return_codes, decode, stream,
+                                         stop_on_match, cwd, env)
+
+        cache_key, cached = self._get_cached(command, cache_ttl, cwd, env)
+        if cached is not None:
+            return_code, output = cached
+            return self._evaluate(command, output, return_code, matcher, allowed_return_codes, decode), None
 
         try:
-            output = subprocess.check_output(command, stderr=subprocess.STDOUT, shell=True, timeout=timeout)
+            output = subprocess.check_output(stderr=subprocess.STDOUT, timeout=timeout,
+                                             **_get_popen_arguments(command, cwd, env))
             return_code = 0
         except subprocess.CalledProcessError as e:
             output = e.output
             return_code = e.returncode
         except subprocess.TimeoutExpired as e:
             raise CommandTimeoutExpired(e)
+        except _executable_errors as e:
+            output, return_code = _get_executable_error_result(e)
+
+        self._set_cached(cache_key, return_code, output)
+        return self._evaluate(command, output, return_code, matcher, allowed_return_codes, decode), None
+
+    def _get_cached(self, command, cache_ttl, cwd=None, env=None):
+        """
+        Returns the cache key and the cached (return_code, output) tuple of a command.
+        Both are None, if the cache is not used.
+        """
+        if cache_ttl is None:
+            cache_ttl = self.app.validators.cmd.cache_ttl
+        if not cache_ttl:
+            return None, None
+        cache_key = _get_cache_key(command, env, cwd)
+        cached = self.app.validators.cmd.cache.get(cache_key, cache_ttl)
+        if cached is not None:
+            self._increment_metric("cache_hits")
+            self.plugin.log.debug("Using cached result of '%s'" % command)
+        return cache_key, cached
+
+    def _set_cached(self, cache_key, return_code, output):
+        if cache_key is not None:
+            self.app.validators.cmd.cache.set(cache_key, return_code, output)
+
+    def _execute_process(self, command, matcher, timeout, allowed_return_codes, decode, stream=False,
+                         stop_on_match=False, cwd=None, env=None):
+        """
+        Executes a command, reads its output and measures its resource usage.
+
+        In stream mode the output is fed into the matcher while it gets read. Otherwise it is fed at once after
+        the command has finished.
+        """
+        stream = stream or stop_on_match
+        decoder = codecs.getincrementaldecoder(decode)()
+
+        start = time.time()
+        try:
+            process = subprocess.Popen(stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       **_get_popen_arguments(command, cwd, env, new_session=True))
+        except _executable_errors as e:
+            output, return_code = _get_executable_error_result(e)
+            return self._evaluate(command, output, return_code, matcher, allowed_return_codes, decode), None
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            _kill_process(process)
+
+        timer = threading.Timer(timeout, kill_on_timeout)
+        timer.start()
+        try:
+            output = []
+            fileno = process.stdout.fileno()
+            while True:
+                data = os.read(fileno, 65536)
+                if not data:
+                    if stream:
+                        matcher.feed(decoder.decode(b"", final=True))
+                    break
+                if not stream:
+                    output.append(data)
+                elif not matcher.found:
+                    matcher.feed(decoder.decode(data))
+                    if matcher.found and stop_on_match:
+                        break
+            if matcher.found and stop_on_match:
+                _kill_process(process)
+            usage = _wait(process, start)
+        finally:
+            timer.cancel()
+            process.stdout.close()
 
+        if matcher.found and stop_on_match:
+            self.plugin.log.debug("Stopped '%s' after all cmd validations were found" % command)
+            self._log_matches(matcher)
+            return matcher, usage
+
+        if timed_out.is_set():
+            raise CommandTimeoutExpired("Command '%s' timed out after %s seconds" % (command, timeout))
+
+        if stream:
+            self._check_return_code(command, usage.return_code, allowed_return_codes)
+            self._log_matches(matcher)
+            return matcher, usage
+        return self._evaluate(command, b"".join(output), usage.return_code, matcher, allowed_return_codes,
+                              decode), usage
+
+    def _check_return_code(self, command, return_code, allowed_return_codes):
         if len(allowed_return_codes) > 0 and return_code not in allowed_return_codes:
             raise NotAllowedReturnCode("For command %s got return code '%s', which is not in %s"
                                        % (command, return_code, allowed_return_codes))
 
         self.plugin.log.debug("Executed '%s' with return code: %s" % (command, return_code))
 
-        output = output.decode(decode)
-        found = False
-        if search is not None:
-            if search in output:
-                found = True
-        elif regex is not None:
-            for m in finditer(regex, output):
-                self.plugin.log.debug("Found cmd validation '%s' at %02d-%02d" % (m.group(0), m.start(), m.end()))
-                found = True
-        return found
+    def _evaluate(self, command, output, return_code, matcher, allowed_return_codes, decode):
+        """
+        Checks the return code and the output of an executed command.
+        """
+        self._check_return_code(command, return_code, allowed_return_codes)
+        matcher.feed(output.decode(decode))
+        self._log_matches(matcher)
+        return matcher
+
+    def _log_matches(self, matcher):
+        for expectation, match in matcher.matches:
+            self.plugin.log.debug("Found cmd validation '%s' for '%s'" % (match, expectation))
+
+
+def _wait(process, start):
+    """
+    Waits for the end of a process and returns its resource usage.
+    """
+    if not hasattr(os, "wait4"):
+        return_code = process.wait()
+        return _ResourceUsage(return_code, time.time() - start, None, None, None)
+
+    while True:
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+            break
+        except InterruptedError:
+            continue
+    duration = time.time() - start
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    # ru_maxrss is given in kilobytes on Linux, but in bytes on macOS
+    max_rss = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    return _ResourceUsage(process.returncode, duration, rusage.ru_utime, rusage.ru_stime, max_rss)
+
+
+def _get_exceeded_limits(usage, limits):
+    """
+    Returns the names of all limits, which are exceeded by the given resource usage.
+    Limits, whose values could not be measured, are not exceeded.
+    """
+    if usage is None:
+        return []
+    values = {"max_duration": usage.duration,
+              "max_rss": usage.max_rss,
+              "max_cpu": None if usage.user_time is None else usage.user_time + usage.system_time}
+    return [name for name, limit in limits.items() if values[name] is not None and values[name] > limit]
+
+
+class CommandCache:
+    """
+    Thread-safe LRU cache for return code and output of executed commands.
+
+    The time of the execution is stored for each entry, so that each validation can decide by its own ttl, if
+    a cached result is still valid.
+    """
+    def __init__(self, size=256):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl):
+        """
+        Returns the cached (return_code, output) tuple or None, if the key is unknown or its entry is older than ttl.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None or entry[0] + ttl < time.time():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key, return_code, output):
+        with self._lock:
+            self._entries[key] = (time.time(), return_code, output)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _get_cache_key(command, env=None, cwd=None):
+    """
+    Returns a key, which identifies the execution of a command by the command itself, its environment and its
+    working directory.
+    """
+    if env is None:
+        env = os.environ
+    if cwd is None:
+        cwd = os.getcwd()
+    if not isinstance(command, str):
+        command = tuple(command)
+    return command, tuple(sorted(env.items())), cwd
+
+
+class _OutputMatcher:
+    """
+    Searches for strings and regular expressions in text, which may be given block by block.
+
+    Each expectation is only searched till it is found.
+    The last overlap characters of the already given text are kept and searched together with the next block,
+    so that matches across the borders of blocks are found.
+
+    Plain strings are searched by ``in``. There is no combined regular expression for all expectations,
+    because groups and back references of the given expressions would not work anymore.
+    """
+    def __init__(self, search=None, regex=None, overlap=None):
+        searches = _as_list(search)
+        regexes = [(expression, _compile(expression)) for expression in _as_list(regex)]
+        if overlap is None:
+            overlap = 1024 if regexes else max([len(value) - 1 for value in searches] + [0])
+        self.overlap = overlap
+        self.results = OrderedDict((expectation, False) for expectation in searches + [e for e, _ in regexes])
+        #: List of (expectation, matched text) tuples
+        self.matches = []
+        self._searches = searches
+        self._regexes = regexes
+        self._tail = ""
+
+    @property
+    def found(self):
+        """
+        True, if all expectations were found.
+        """
+        return not self._searches and not self._regexes
+
+    def feed(self, text):
+        window = self._tail + text
+        if self._searches:
+            not_found = []
+            for value in self._searches:
+                if value in window:
+                    self.results[value] = True
+                    self.matches.append((value, value))
+                else:
+                    not_found.append(value)
+            self._searches = not_found
+        if self._regexes:
+            not_found = []
+            for expression, compiled in self._regexes:
+                match = compiled.search(window)
+                if match is not None:
+                    self.results[expression] = True
+                    self.matches.append((expression, match.group(0)))
+                else:
+                    not_found.append((expression, compiled))
+            self._regexes = not_found
+        if not self.found:
+            self._tail = window[len(window) - self.overlap:] if self.overlap > 0 else ""
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+@lru_cache(maxsize=256)
+def _compile_cached(expression):
+    return compile_regex(expression)
+
+
+def _compile(expression):
+    """
+    Returns a compiled regular expression. Compiled expressions of strings are cached.
+    """
+    if isinstance(expression, str):
+        return _compile_cached(expression)
+    return expression
+
+
+#: Errors of Popen, if the executable of an argument list can not be executed
+_executable_errors = (FileNotFoundError, PermissionError)
+
+
+def _get_popen_arguments(command, cwd=None, env=None, new_session=False):
+    """
+    Returns the keyword arguments for subprocess.Popen to execute the given command.
+
+    Strings are executed by a shell. Argument lists are executed directly: The executable gets resolved to an
+    absolute path and file descriptors are not closed (they are not inheritable anyway), so that subprocess can
+    use posix_spawn or vfork instead of fork + exec (if no cwd is given).
+
+    :param new_session: If True, the command is started in its own session on posix systems, so that all its
+                        child processes can be killed (see :func:`_kill_process`). Needed, if the output is read
+                        until the pipe gets closed, but prevents the usage of posix_spawn.
+    """
+    if isinstance(command, str):
+        return {"args": command, "shell": True, "cwd": cwd, "env": env,
+                "start_new_session": new_session and os.name == "posix"}
+
+    args = list(command)
+    if os.path.dirname(args[0]) == "":
+        path = env.get("PATH", os.defpath) if env is not None else None
+        executable = shutil.which(args[0], path=path)
+        if executable is not None:
+            args[0] = executable
+    arguments = {"args": args, "shell": False, "cwd": cwd, "env": env, "close_fds": False}
+    if new_session and os.name == "posix":
+        arguments["start_new_session"] = True
+    return arguments
+
+
+def _get_executable_error_result(error):
+    """
+    Returns output and return code for an argument list, whose executable can not be executed.
+    The same return codes as used by a shell are returned.
+    """
+    return_code = 127 if isinstance(error, FileNotFoundError) else 126
+    return str(error).encode("utf-8"), return_code
+
+
+def _kill_process(process):
+    """
+    Kills a started command including all its child processes.
+
+    On posix systems commands, whose output is read until the pipe gets closed, are started in their own session,
+    so that the whole process group can be killed. Otherwise childs of the command would keep the output pipe open.
+    """
+    try:
+        if os.name == "posix" and _is_group_leader(process):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        # Already finished
+        pass
+
+
+def _is_group_leader(process):
+    try:
+        return os.getpgid(process.pid) == process.pid
+    except OSError:
+        return False
+
+
+def _get_current_loop(asyncio):
+    """
+    Returns the current event loop of the thread or None, if no event loop is set.
+    """
+    with warnings.catch_warnings():
+        # Newer python versions warn, if get_event_loop() is called without a running event loop
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            return asyncio.get_event_loop()
+        except RuntimeError:
+            return None
+
+
+def _attach_child_watcher(asyncio, loop):
+    """
+    Attaches the child watcher to the given event loop.
+    Needed only before python 3.8, which added a child watcher without any event loop dependency.
+    """
+    if sys.version_info >= (3, 8) or sys.platform == "win32":
+        return
+    if threading.current_thread() is threading.main_thread():
+        asyncio.get_child_watcher().attach_loop(loop)
 
 
 class NotAllowedReturnCode(BaseException):
@@ -1,7 +1,35 @@
-from sqlalchemy import Column, Integer, String, inspect, event
+import json
+import os
+import threading
+import time
+from binascii import hexlify, unhexlify
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from operator import itemgetter
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, inspect, event, bindparam, tuple_, func, and_
+from sqlalchemy import select
+from sqlalchemy.dialects.oracle import RAW
+from sqlalchemy.orm import object_session, Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.types import VARBINARY
 from groundwork_database.patterns import GwSqlPattern
 from groundwork_validation.patterns import GwValidatorsPattern
-from groundwork.util import gw_get
+from groundwork_validation.patterns.gw_validators_pattern.gw_validators_pattern import ValidatorRegistry, Validator
+from groundwork_validation.patterns.gw_validators_pattern.algorithms import format_hash, split_hash
+
+#: Progress and result of :func:`DbValidator.backfill`.
+#: rows is the number of read rows, inserted/updated the number of written hashes and skipped the number of rows,
+#: which already had a hash. last_key is the primary key of the last handled row as tuple.
+BackfillProgress = namedtuple("BackfillProgress", ["rows", "inserted", "updated", "skipped", "last_key"])
+
+#: Progress and result of :func:`DbValidator.scan`.
+#: rows is the number of checked rows. mismatched and missing are lists of primary key tuples of rows, whose stored
+#: hash is not valid or does not exist. orphaned is a list of hash ids, whose rows do not exist anymore.
+#: last_key is the primary key of the last checked row as tuple.
+ScanResult = namedtuple("ScanResult", ["rows", "mismatched", "missing", "orphaned", "last_key"])
 
 
 class GwDbValidatorsPattern(GwSqlPattern, GwValidatorsPattern):
@@ -27,23 +55,39 @@ class DbValidatorsPlugin:
         self.plugin = plugin
         self.app = plugin.app
 
-    def register(self, name, description, db_class):
+    def register(self, name, description, db_class, batch_size=None, algorithm=None, hash_column=None):
         """
         Registers a new database model and starts its validation.
 
         :param name: Unique name
         :param description: Meaningful description
         :param db_class: sqlalchemy based database model
+        :param batch_size: Max. number of hashes, which are requested from the hash database by a single query.
+                           If None, the application configuration HASH_DB_BATCH_SIZE is used.
+                           If 0, each refreshed row is validated on its own.
+        :param algorithm: Name of the hash algorithm (e.g. "blake2b-128" or "fast").
+                          If None, VALIDATION_DEFAULT_ALGORITHM of the application configuration is used.
+        :param hash_column: Name of a column of db_class, which stores the hash of each row instead of the hash
+                            database. If the model has no such column, it gets added to the model.
+                            If None, the hash database is used.
 
         :return: Instance of DbValidator
         """
-        return self.app.validators.db.register(name, description, db_class, self.plugin)
+        return self.app.validators.db.register(name, description, db_class, self.plugin, batch_size=batch_size,
+                                               algorithm=algorithm, hash_column=hash_column)
 
     def unregister(self, name):
         self.app.validators.db.unregister(name)
 
-    def get(self, name):
-        self.app.validators.db.get(name, self.plugin)
+    def get(self, name=None):
+        """
+        Returns a single or a list of database validators, which were registered by the current plugin.
+
+        :param name: Name of the database validator. If None, all database validators of the current plugin are
+                     returned.
+        :return: Single DbValidator instance or dictionary of DbValidator instances
+        """
+        return self.app.validators.db.get(name, self.plugin)
 
 
 class DbValidatorsApplication:
@@ -52,22 +96,62 @@ class DbValidatorsApplication:
         """
     def __init__(self, app):
         self.app = app
-        self._db_validators = {}
+        self._db_validators = ValidatorRegistry()
 
         self.db = self.app.databases.register("hash_db",
                                               self.app.config.get("HASH_DB", "sqlite://"),
                                               "database for hash values")
 
-        class Hashes(self.db.Base):
-            __tablename__ = "hashes"
-            id = Column(Integer, primary_key=True)
-            hash_id = Column(String(512), nullable=False, unique=True)
-            hash = Column(String(2048), nullable=False)
+        self.schema = self.app.config.get("HASH_DB_SCHEMA", "default")
+        if self.schema not in ("default", "compact"):
+            raise ValueError("HASH_DB_SCHEMA must be 'default' or 'compact', not '%s'" % self.schema)
+
+        self.Hashes = None
+        self.HashValidators = None
+        self.RowHashes = None
+        if self.schema == "compact":
+            class HashValidators(self.db.Base):
+                __tablename__ = "hash_validators"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
 
-        self.Hashes = self.db.classes.register(Hashes)
+            class RowHashes(self.db.Base):
+                __tablename__ = "row_hashes"
+                validator_id = Column(Integer, ForeignKey("hash_validators.id"), primary_key=True,
+                                      autoincrement=False)
+                row_key = Column(_binary(512), primary_key=True)
+                algorithm = Column(String(64))
+                digest = Column(_binary(64), nullable=False)
+
+            self.HashValidators = self.db.classes.register(HashValidators)
+            self.RowHashes = self.db.classes.register(RowHashes)
+        else:
+            class Hashes(self.db.Base):
+                __tablename__ = "hashes"
+                id = Column(Integer, primary_key=True)
+                hash_id = Column(String(512), nullable=False, unique=True)
+                hash = Column(String(2048), nullable=False)
+
+            self.Hashes = self.db.classes.register(Hashes)
         self.db.create_all()
 
-    def register(self, name, description, db_class, plugin):
+        self.batch_size = self.app.config.get("HASH_DB_BATCH_SIZE", 500)
+
+        cache_size = self.app.config.get("HASH_DB_CACHE_SIZE", 0)
+        if cache_size:
+            self.hash_cache = HashCache(cache_size, ttl=self.app.config.get("HASH_DB_CACHE_TTL", None))
+        else:
+            self.hash_cache = None
+
+        if self.schema == "compact":
+            self.hash_store = CompactHashStore(self.db, self.RowHashes, self.HashValidators,
+                                               batch_size=self.batch_size, cache=self.hash_cache,
+                                               metrics=self.app.validators.metrics)
+        else:
+            self.hash_store = HashStore(self.db, self.Hashes, batch_size=self.batch_size, cache=self.hash_cache,
+                                        metrics=self.app.validators.metrics)
+
+    def register(self, name, description, db_class, plugin, batch_size=None, algorithm=None, hash_column=None):
         """
                 Registers a new database model and starts its validation.
 
@@ -75,29 +159,49 @@ class DbValidatorsApplication:
                 :param description: Meaningful description
                 :param db_class: sqlalchemy based database model
                 :param plugin: Plugin, which registers the DbValidator
+                :param batch_size: Max. number of hashes, which are requested by a single query.
+                                   If None, HASH_DB_BATCH_SIZE from the application configuration is used.
+                :param algorithm: Name of the hash algorithm. If None, VALIDATION_DEFAULT_ALGORITHM from the
+                                  application configuration is used.
+                :param hash_column: Name of a column of db_class, which stores the hash of each row.
+                                    If None, the hash database is used.
 
                 :return: Instance of DbValidator
                 """
-        if name in self._db_validators.keys():
+        if name in self._db_validators:
             raise KeyError("Database validator %s already registered" % name)
 
-        self._db_validators[name] = DbValidator(name,
-                                                description=description,
-                                                db_class=db_class,
-                                                db=self.db,
-                                                hash_model=self.Hashes,
-                                                plugin=plugin)
+        if batch_size is None:
+            batch_size = self.batch_size
 
-        return self._db_validators[name]
+        db_validator = DbValidator(name,
+                                   description=description,
+                                   db_class=db_class,
+                                   db=self.db,
+                                   hash_model=self.hash_store.hash_model,
+                                   plugin=plugin,
+                                   batch_size=batch_size,
+                                   hash_store=self.hash_store,
+                                   algorithm=algorithm,
+                                   hash_column=hash_column)
+        if not self._db_validators.add(name, db_validator):
+            raise KeyError("Database validator %s already registered" % name)
+        return db_validator
 
     def unregister(self, name):
-        if name in self._db_validators.keys():
-            del (self._db_validators[name])
-        else:
+        if not self._db_validators.remove(name):
             raise KeyError("Database validator %s does not exist" % name)
 
-    def get(self, name, plugin):
-        gw_get(self._db_validators, name, plugin)
+    def get(self, name=None, plugin=None):
+        """
+        Returns a single or a list of database validators.
+
+        :param name: Name of the database validator. If None, all database validators are returned.
+        :param plugin: Plugin instance, which has registered the requested database validator.
+                       If None, database validators of all plugins are returned.
+        :return: Single DbValidator instance or dictionary of DbValidator instances
+        """
+        return self._db_validators.get(name, plugin)
 
 
 class DbValidator:
@@ -105,7 +209,8 @@ class DbValidator:
     Class for storing a database validator.
     For each registered database validator an instance of this class gets created and configured.
     """
-    def __init__(self, name, description, db_class, db, hash_model, plugin=None):
+    def __init__(self, name, description, db_class, db, hash_model, plugin=None, batch_size=500, hash_store=None,
+                 algorithm=None, hash_column=None):
         """
 
         :param name: Unique name
@@ -114,6 +219,19 @@ class DbValidator:
         :param db: Database
         :param hash_model: Database model, which is used to store the hashes
         :param plugin: Plugin, which has registered the DbValidator
+        :param batch_size: Max. number of hashes, which are requested from the hash database by a single query.
+                           All rows of a query result get collected and validated together.
+                           If 0 or None, each row gets validated directly after it was refreshed.
+        :param hash_store: :class:`HashStore`, which reads and writes the hashes. If None, a new one is created
+                           for db and hash_model.
+        :param algorithm: Name of the hash algorithm. If None, the default algorithm of the application is used.
+                          Stored hashes of other algorithms are still validated by their own algorithm.
+        :param hash_column: Name of a column of db_class, which stores the hash of each row. The hash gets
+                            written by the same transaction as the row and gets checked without any query, after a
+                            row is loaded or refreshed. All columns except the hash column are hashed.
+                            If the model has no such column, a string column gets added to the model, which must be
+                            created in the database (e.g. by create_all() for new tables).
+                            If None, hashes are stored in the hash database.
         """
         self.name = name
         self.description = description
@@ -122,44 +240,1167 @@ class DbValidator:
         self.db_class = db_class
         self.tablename = db_class.__tablename__
         self.hash_id = ".".join([self.name, self.tablename])
-        self.attributes = inspect(self.db_class).columns.keys()  # Only columns/attributes, which were defined by user
+        self._mapper = inspect(self.db_class)
+        self.hash_column = hash_column
+        if hash_column is None:
+            self.attributes = self._mapper.columns.keys()  # Only columns/attributes, which were defined by user
+        else:
+            if hash_column not in self._mapper.columns.keys():
+                setattr(self.db_class, hash_column, Column(hash_column, String(256)))
+            # The primary key is hashed as well, so that a row and its hash can not be copied to another row
+            self.attributes = [attribute for attribute in self._mapper.columns.keys() if attribute != hash_column]
+            self._hash_update = self._create_hash_update()
         self.plugin = plugin
+        self.batch_size = batch_size
+        if hash_store is None:
+            hash_store = HashStore(db, hash_model, batch_size=batch_size or 500)
+        self.hash_store = hash_store
+        self.hash_store.register_validator(self.hash_id)
 
-        self.validator = plugin.validators.register(self.hash_id, description, attributes=self.attributes)
+        # Column values are read directly from the instance dictionary, which is filled by SQLAlchemy.
+        self._column_getter = itemgetter(*self.attributes) if len(self.attributes) > 1 else None
+
+        self.validator = plugin.validators.register(self.hash_id, description, algorithm=algorithm,
+                                                    attributes=self.attributes, extractor=self._extract_values)
 
         # http://docs.sqlalchemy.org/en/latest/orm/events.html#instance-events
         # Calls _check_hash, if given database model instance is refreshed from a query
         event.listen(self.db_class, "refresh", self._check_hash)
 
-        # Calls _store_hash, if given database model instance was updated by user
-        event.listen(self.db_class, "after_update", self._store_hash)
-        event.listen(self.db_class, "after_insert", self._store_hash)
+        if hash_column is None:
+            # Calls _store_hash, if given database model instance was updated by user
+            event.listen(self.db_class, "after_update", self._store_hash)
+            event.listen(self.db_class, "after_insert", self._store_hash)
+        else:
+            # The stored hash is loaded together with the row, so also new loaded instances can be checked
+            event.listen(self.db_class, "load", self._check_loaded_hash)
+            # The hash gets written after the row, when column defaults and new primary keys are known
+            event.listen(self.db_class, "after_update", self._set_column_hash)
+            event.listen(self.db_class, "after_insert", self._set_column_hash)
 
     def _check_hash(self, target, context, attrs):
-        hash_id = self._calculate_hash_id(target)
-        hash_row = self.db.query(self.hash_model).filter_by(hash_id=hash_id).first()
-        hash_current = hash_row.hash
+        # Expired attributes of changed instances get refreshed during the flush, before the changes are written.
+        # The changed values do not belong to the stored hash, they get a new one by the flush.
+        committed_state = inspect(target).committed_state
+        if committed_state and any(attribute in committed_state for attribute in self.attributes):
+            return
+        # SQLAlchemy calls all post load handlers of a query context, after a chunk of rows was fetched and
+        # before the first row is returned to the caller.
+        # So we collect all refreshed instances there and check them together.
+        post_load_paths = getattr(context, "post_load_paths", None)
+        if not self.batch_size or post_load_paths is None or self.hash_column is not None:
+            return self.check_hashes([target])
+
+        pending_key = ("groundwork_validation", self.hash_id)
+        pending = post_load_paths.get(pending_key, None)
+        if pending is None:
+            pending = post_load_paths[pending_key] = _PendingHashChecks(self)
+        pending.add(target)
+
+    def check_hashes(self, targets):
+        """
+        Validates the given model instances against their stored hashes.
+        The stored hashes are requested with as few queries as possible.
+        If a hash column is used, no query is needed.
+
+        :param targets: List of model instances
+        :return: None
+        """
+        hash_ids = [self._calculate_hash_id(target) for target in targets]
+        if self.hash_column is None:
+            stored_hashes = self.hash_store.get(hash_ids, batch_size=self.batch_size or None,
+                                                model_session=object_session(targets[0]) if targets else None,
+                                                name=self.validator.name)
+        else:
+            stored_hashes = dict((hash_id, getattr(target, self.hash_column))
+                                 for hash_id, target in zip(hash_ids, targets))
 
-        if not self.validator.validate(target, hash_current):
-            raise ValidationError("Stored hash %s not valid. Calculated %s " % (hash_current,
-                                                                                self.validator.hash(target)))
+        metrics = self.validator.metrics
+        if metrics is not None:
+            metrics.increment(self.validator.name, "checked_rows", len(targets))
+
+        for hash_id, target in zip(hash_ids, targets):
+            hash_current = stored_hashes.get(hash_id, None)
+            if hash_current is None:
+                if metrics is not None:
+                    metrics.increment(self.validator.name, "missing_hashes")
+                raise ValidationError("No stored hash found for %s" % hash_id)
+
+            if not self.validator.validate(target, hash_current):
+                if self.hash_column is None and self.hash_store.cache is not None:
+                    # The cached hash may be outdated, because another process has updated the row
+                    hash_current = self.hash_store.refresh([hash_id], name=self.validator.name).get(hash_id, None)
+                    if hash_current is not None and self.validator.validate(target, hash_current):
+                        continue
+                    if hash_current is None:
+                        raise ValidationError("No stored hash found for %s" % hash_id)
+                self._check_algorithm(hash_id, hash_current)
+                raise ValidationError("Stored hash %s not valid. Calculated %s " % (hash_current,
+                                                                                    self.validator.hash(target)))
+
+    def _check_algorithm(self, hash_id, hash_value):
+        """
+        Raises a ValidationError, if the algorithm of a stored hash is not available (e.g. xxh64 without the
+        package xxhash), because the hash can not be validated then.
+        """
+        try:
+            self.validator.for_hash(hash_value)
+        except KeyError:
+            raise ValidationError("Stored hash for %s was created by algorithm %s, which is not available"
+                                  % (hash_id, split_hash(hash_value)[0]))
 
     def _store_hash(self, mapper, connection, target):
         new_hash = self.validator.hash(target)
-        hash_id = self._calculate_hash_id(target)
-        current_hash_row = self.db.query(self.hash_model).filter_by(hash_id=hash_id).first()
-        if current_hash_row is None:
-            current_hash_row = self.hash_model(hash_id=hash_id, hash=new_hash)
+        hash_id = self._calculate_hash_id(target, current=True)
+        # The hash gets written together with all other hashes of the current flush.
+        self.hash_store.add(object_session(target), hash_id, new_hash, name=self.validator.name)
+
+    def _check_loaded_hash(self, target, context):
+        self.check_hashes([target])
+
+    def _set_column_hash(self, mapper, connection, target):
+        key = self._mapper.primary_key_from_instance(target)
+        state = inspect(target)
+        if any(attribute in state.expired_attributes or attribute not in state.dict for attribute in self.attributes):
+            # Values of server defaults are not known by the instance, so the written row is requested
+            columns = [self._mapper.columns[attribute] for attribute in self.attributes]
+            key_columns = list(self._mapper.primary_key)
+            values = tuple(connection.execute(select(columns).where(
+                and_(*[column == value for column, value in zip(key_columns, key)]))).first())
         else:
-            current_hash_row.hash = new_hash
+            values = self._column_getter(state.dict) if self._column_getter is not None \
+                else (state.dict[self.attributes[0]],)
+        new_hash = self.validator.hash_values(values)
+        params = dict(("b_key_%s" % index, value) for index, value in enumerate(key))
+        params["b_hash"] = new_hash
+        connection.execute(self._hash_update, params)
+        # The hash is already written, so the instance must not write it again
+        set_committed_value(target, self.hash_column, new_hash)
+
+    def backfill(self, batch_size=1000, start_after=None, checkpoint=None, progress=None, workers=None,
+                 overwrite=False):
+        """
+        Creates hashes for all rows, which already exist in the table of the validated model.
+
+        Rows are read in batches ordered by primary key. Each batch is requested by its own query, which starts
+        after the last key of the previous batch (keyset pagination), so that no batch gets slower for big tables
+        and no long running read transaction is needed. The hashes of each batch are written by bulk statements
+        and committed by an own session of the hash database, before the next batch gets requested.
+
+        An interrupted backfill can be resumed by start_after or by a checkpoint file::
+
+            db_validator.backfill(checkpoint="/path/to/backfill.json",
+                                  progress=lambda state: print("%s rows hashed" % state.rows))
+
+        :param batch_size: Number of rows, which are read, hashed and written together. Default is 1000.
+        :param start_after: Primary key (single value or tuple for composite keys), after which the backfill
+                            starts. If None, the backfill starts with the first row or at the key stored in the
+                            checkpoint file.
+        :param checkpoint: Path of a JSON file, which stores the key of the last committed batch. It gets deleted,
+                           after all rows are handled. Primary key values must be JSON serialisable.
+        :param progress: Function, which gets called with a :class:`BackfillProgress` after each batch.
+        :param workers: Number of processes, which hash the rows. If None or 1, rows are hashed by the current
+                        process. Needs a validator with a registered algorithm and encoder.
+        :param overwrite: If True, existing hashes get overwritten. Otherwise only missing hashes are added,
+                          so that hashes of manipulated rows stay detectable. Default is False.
+        :return: :class:`BackfillProgress` of the complete backfill
+        """
+        if start_after is None and checkpoint is not None:
+            start_after = _read_checkpoint(checkpoint, self.hash_id)
+        last_key = _as_key(start_after)
+        rows = inserted = updated = skipped = 0
+
+        with closing(self._iter_batches(batch_size, start_after=last_key, workers=workers)) as batches:
+            for keys, values, hashes, column_hashes in batches:
+                if self.hash_column is None:
+                    new_hashes = OrderedDict((self._get_hash_id(key), hash_value)
+                                             for key, hash_value in zip(keys, hashes))
+                    # Written by an own session, so that no other hashes of the hash database session are committed
+                    batch_inserted, batch_updated = self.hash_store.write_committed(new_hashes, update=overwrite,
+                                                                                    name=self.validator.name)
+                else:
+                    batch_inserted, batch_updated = self._write_column_hashes(keys, hashes, column_hashes,
+                                                                              overwrite)
+
+                rows += len(keys)
+                inserted += batch_inserted
+                updated += batch_updated
+                skipped += len(keys) - batch_inserted - batch_updated
+                last_key = keys[-1]
+                state = BackfillProgress(rows, inserted, updated, skipped, last_key)
+                if checkpoint is not None:
+                    _write_checkpoint(checkpoint, self.hash_id, state)
+                if progress is not None:
+                    progress(state)
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return BackfillProgress(rows, inserted, updated, skipped, last_key)
+
+    def scan(self, batch_size=1000, start_after=None, end_at=None, max_rows_per_second=None, progress=None,
+             workers=None, orphans=None):
+        """
+        Checks all rows of the validated model against their stored hashes, without the need to request the rows
+        by the application.
+
+        Rows are read in batches ordered by primary key (keyset pagination, like :func:`backfill`), the hashes of
+        each batch are recalculated and their stored hashes are requested by a single IN (...) query.
+        So neither the table nor the hashes are loaded completely into memory and no long running read transaction
+        is needed. Nothing gets written and no :class:`ValidationError` is raised, all findings are reported by the
+        returned :class:`ScanResult`.
+
+        The scan can be throttled by max_rows_per_second, so that it can run beside the normal load of a
+        production database. Big tables can be split by :func:`split_key_ranges` and scanned by several processes::
+
+            for start_after, end_at in db_validator.split_key_ranges(4):
+                # e.g. scheduled as own process or job
+                result = db_validator.scan(start_after=start_after, end_at=end_at, max_rows_per_second=5000)
+
+        :param batch_size: Number of rows, which are read and checked together. Default is 1000.
+        :param start_after: Primary key (single value or tuple for composite keys), after which the scan starts.
+                            If None, the scan starts with the first row.
+        :param end_at: Primary key of the last row, which gets scanned. If None, the scan ends with the last row.
+        :param max_rows_per_second: Max. number of rows, which are read per second. If None, the scan is not
+                                    throttled.
+        :param progress: Function, which gets called with the current :class:`ScanResult` after each batch.
+        :param workers: Number of processes, which hash the rows. If None or 1, rows are hashed by the current
+                        process. Needs a validator with a registered algorithm and encoder.
+        :param orphans: If True, stored hashes of this validator, whose rows do not exist anymore, are searched
+                        after all rows are checked. If None, orphans are searched only if the complete table gets
+                        scanned (no start_after and no end_at).
+        :return: :class:`ScanResult`
+        """
+        if orphans is None:
+            orphans = start_after is None and end_at is None
+        start_time = time.perf_counter()
+        result = ScanResult(0, [], [], [], _as_key(start_after))
+
+        # Stored hashes are read by an own session, so that the session of the hash database is not affected
+        hash_session = Session(bind=self.hash_store.db.engine)
+        try:
+            with closing(self._iter_batches(batch_size, start_after=start_after, end_at=end_at,
+                                            workers=workers)) as batches:
+                for keys, values, hashes, column_hashes in batches:
+                    hash_ids = [self._get_hash_id(key) for key in keys]
+                    if self.hash_column is None:
+                        # Stored hashes are read from the database, even if they are cached
+                        stored_hashes = self.hash_store.get(hash_ids, use_cache=False, session=hash_session,
+                                                            name=self.validator.name)
+                        hash_session.rollback()
+                    else:
+                        stored_hashes = dict(zip(hash_ids, column_hashes))
+
+                    for key, hash_id, row_values, hash_value in zip(keys, hash_ids, values, hashes):
+                        stored_hash = stored_hashes.get(hash_id, None)
+                        if stored_hash is None:
+                            result.missing.append(key)
+                        elif not self._matches(row_values, hash_value, stored_hash):
+                            result.mismatched.append(key)
+
+                    result = result._replace(rows=result.rows + len(keys), last_key=keys[-1])
+                    if progress is not None:
+                        progress(result)
+                    _throttle(start_time, result.rows, max_rows_per_second)
+        finally:
+            hash_session.close()
+
+        # Hashes of a hash column are deleted together with their rows
+        if orphans and self.hash_column is None:
+            result.orphaned.extend(self._find_orphans(batch_size, max_rows_per_second))
+
+        metrics = self.validator.metrics
+        if metrics is not None:
+            metrics.increment(self.validator.name, "scanned_rows", result.rows)
+            metrics.increment(self.validator.name, "missing_hashes", len(result.missing))
+            metrics.increment(self.validator.name, "failed_validations", len(result.mismatched))
+        return result
+
+    def split_key_ranges(self, count):
+        """
+        Splits the primary keys of the validated model into ranges with nearly the same number of rows.
+
+        Each range is a tuple of (start_after, end_at), which can be used for :func:`scan`.
+        start_after of the first and end_at of the last range are None, so that rows, which are added later,
+        are part of the ranges as well.
+
+        :param count: Number of ranges
+        :return: List of (start_after, end_at) tuples. Contains less than count ranges, if the table has less rows.
+        """
+        key_columns = self._get_key_columns()
+        session = Session(bind=self.db_class.query.session.get_bind())
+        try:
+            total = session.query(func.count()).select_from(self.db_class).scalar()
+            boundaries = []
+            for index in range(1, count):
+                offset = total * index // count
+                if offset == 0 or (boundaries and offset == boundaries[-1][0]):
+                    continue
+                row = session.query(*key_columns).order_by(*key_columns).offset(offset - 1).limit(1).first()
+                boundaries.append((offset, tuple(row)))
+        finally:
+            session.close()
+
+        ranges = []
+        start_after = None
+        for _, end_at in boundaries:
+            ranges.append((start_after, end_at))
+            start_after = end_at
+        ranges.append((start_after, None))
+        return ranges
+
+    def _iter_batches(self, batch_size, start_after=None, end_at=None, workers=None):
+        """
+        Reads the rows of the validated model in batches ordered by primary key and yields a tuple of
+        (primary keys, attribute values, hashes, hash column values) for each batch.
+        The hash column values are None, if no hash column is used.
+        """
+        if workers is not None and workers > 1 and self.validator.algorithm_name is None:
+            raise ValueError("Hashing by multiple workers needs a validator with a registered algorithm")
+
+        key_columns = self._get_key_columns()
+        value_columns = [getattr(self.db_class, attribute) for attribute in self.attributes]
+        if self.hash_column is not None:
+            value_columns.append(getattr(self.db_class, self.hash_column))
+        key_length = len(key_columns)
+        value_end = key_length + len(self.attributes)
+        last_key = _as_key(start_after)
+        end_at = _as_key(end_at)
+
+        executor = ProcessPoolExecutor(workers) if workers is not None and workers > 1 else None
+        # A separate session is used, so that the session of the model is not affected.
+        # self.db is the hash database, the database of the model is bound to the query property of the model.
+        session = Session(bind=self.db_class.query.session.get_bind())
+        try:
+            pending = None
+            while True:
+                query = session.query(*(key_columns + value_columns))
+                if last_key is not None:
+                    query = query.filter(_compare_key(key_columns, last_key, ">"))
+                if end_at is not None:
+                    query = query.filter(_compare_key(key_columns, end_at, "<="))
+                batch = query.order_by(*key_columns).limit(batch_size).yield_per(batch_size).all()
+                session.rollback()
+
+                # The next batch gets read, while the workers hash the current one
+                if batch:
+                    keys = [tuple(row[:key_length]) for row in batch]
+                    values = [tuple(row[key_length:value_end]) for row in batch]
+                    column_hashes = [row[value_end] for row in batch] if self.hash_column is not None else None
+                    if executor is not None:
+                        hashes = executor.submit(_hash_rows, self.validator.algorithm_name,
+                                                 self.validator.encoder.name, values)
+                    else:
+                        hashes = [self.validator.hash_values(row_values) for row_values in values]
+                    last_key = keys[-1]
+                    current = (keys, values, hashes, column_hashes)
+                else:
+                    current = None
+
+                if pending is not None:
+                    keys, values, hashes, column_hashes = pending
+                    if executor is not None:
+                        hashes = hashes.result()
+                    yield keys, values, hashes, column_hashes
+
+                if current is None:
+                    break
+                pending = current
+        finally:
+            session.close()
+            if executor is not None:
+                executor.shutdown()
+
+    def _write_column_hashes(self, keys, hashes, column_hashes, overwrite):
+        """
+        Writes the hashes of a batch of rows into the hash column by a single bulk statement and commits them.
+
+        :return: tuple of the number of new and the number of updated hashes
+        """
+        inserted = updated = 0
+        params = []
+        for key, hash_value, column_hash in zip(keys, hashes, column_hashes):
+            if column_hash is None:
+                inserted += 1
+            elif column_hash != hash_value and overwrite:
+                updated += 1
+            else:
+                continue
+            entry = dict(("b_key_%s" % index, value) for index, value in enumerate(key))
+            entry["b_hash"] = hash_value
+            params.append(entry)
+
+        if params:
+            with self.db_class.query.session.get_bind().begin() as connection:
+                connection.execute(self._hash_update, params)
+        return inserted, updated
+
+    def _create_hash_update(self):
+        """
+        Returns the statement, which updates the hash column of a single row.
+        """
+        key_columns = list(self._mapper.primary_key)
+        table = self._mapper.local_table
+        # Columns with update defaults keep their values, because they are part of the hash
+        values = dict((column.name, column) for column in table.columns
+                      if column.onupdate is not None or column.server_onupdate is not None)
+        values[self._mapper.columns[self.hash_column].name] = bindparam("b_hash")
+        return table.update()\
+            .where(and_(*[column == bindparam("b_key_%s" % index) for index, column in enumerate(key_columns)]))\
+            .values(values)
+
+    def _find_orphans(self, batch_size, max_rows_per_second=None):
+        """
+        Returns the hash ids of all stored hashes of this validator, whose rows do not exist anymore.
+        """
+        key_columns = self._get_key_columns()
+        start_time = time.perf_counter()
+        checked = 0
+        orphaned = []
 
-        self.db.add(current_hash_row)
-        self.db.commit()
+        session = Session(bind=self.db_class.query.session.get_bind())
+        try:
+            for key_ids in self.hash_store.iter_key_ids(self.hash_id, batch_size):
+                keys = OrderedDict()
+                for key_id in key_ids:
+                    key = self._parse_key_id(key_id)
+                    if key is None:
+                        orphaned.append(".".join([self.hash_id, key_id]))
+                    else:
+                        keys[key_id] = key
+                if keys:
+                    if len(key_columns) == 1:
+                        condition = key_columns[0].in_([key[0] for key in keys.values()])
+                    else:
+                        condition = tuple_(*key_columns).in_(list(keys.values()))
+                    existing = set(_get_key_id(row) for row in session.query(*key_columns).filter(condition))
+                    session.rollback()
+                    orphaned.extend(".".join([self.hash_id, key_id]) for key_id in keys.keys()
+                                    if key_id not in existing)
 
-    def _calculate_hash_id(self, target):
+                checked += len(key_ids)
+                _throttle(start_time, checked, max_rows_per_second)
+        finally:
+            session.close()
+        return orphaned
+
+    def _matches(self, values, hash_value, stored_hash):
+        """
+        Compares a recalculated hash with a stored one. Stored hashes of other algorithms get recalculated by
+        their own algorithm.
+        """
+        if stored_hash == hash_value:
+            return True
+        try:
+            validator = self.validator.for_hash(stored_hash)
+        except KeyError:
+            return False
+        if validator is self.validator:
+            return False
+        return validator.hash_values(values, return_hash_object=True).hexdigest() == split_hash(stored_hash)[1]
+
+    def _get_key_columns(self):
+        return [getattr(self.db_class, self._mapper.get_property_by_column(column).key)
+                for column in self._mapper.primary_key]
+
+    def _extract_values(self, target):
+        if self._column_getter is not None:
+            try:
+                return self._column_getter(target.__dict__)
+            except KeyError:
+                pass
+        # Some columns are not loaded (e.g. expired or deferred), so let SQLAlchemy load them
+        return tuple([getattr(target, attribute, None) for attribute in self.attributes])
+
+    def _get_hash_id(self, key):
+        """
+        Returns the hash id for a primary key tuple.
+        """
+        return self.hash_store.get_hash_id(self.hash_id, _get_key_id(key))
+
+    def _parse_key_id(self, key_id):
+        """
+        Returns the primary key tuple of a key id or None, if the key id does not belong to a valid key.
+        Components, which can not be converted to the python type of their column, are returned as string.
+        """
+        columns = self._mapper.primary_key
+        components = [key_id] if len(columns) == 1 else _split_key_id(key_id)
+        if len(components) != len(columns):
+            return None
+        key = []
+        for column, component in zip(columns, components):
+            try:
+                key.append(column.type.python_type(component))
+            except (NotImplementedError, TypeError, ValueError):
+                key.append(component)
+        return tuple(key)
+
+    def _calculate_hash_id(self, target, current=False):
         # We need a unique id, which identifies our hash value inside the database.
         # But the ID must not be related to the content of the db model itself, as this will change.
-        return ".".join([self.hash_id, str(target.id)])
+        # The identity key of loaded instances is used directly. New instances get it after the flush only and
+        # changed primary keys are part of it after the flush only, so current values are read for storing.
+        key = None if current else inspect(target).identity
+        if key is None:
+            key = self._mapper.primary_key_from_instance(target)
+        return self._get_hash_id(key)
+
+
+class HashStore:
+    """
+    Reads and writes hashes from/to the hash database.
+
+    New hashes are collected for each session, which flushes validated models.
+    Each of these sessions gets its own session on the hash database. When the session commits its transaction,
+    all collected hashes are written by bulk statements and committed by its own hash database session.
+    So a commit or rollback of one session does not affect the hashes of other sessions.
+    Until then, the collected hashes are only visible for validations of the same session.
+
+    If a :class:`HashCache` is given, hashes are read from it first and all written hashes are stored in it.
+
+    If a :class:`~groundwork_validation.patterns.gw_validators_pattern.metrics.ValidationMetrics` instance is given,
+    the number of queries and hashes and the needed time for reading and writing are collected for the name
+    "hash_db". If the name of a validator is given, they are collected for this name as well.
+    """
+    #: Name, which is used for the collected metrics
+    metrics_name = "hash_db"
+
+    def __init__(self, db, hash_model, batch_size=500, cache=None, metrics=None):
+        """
+        :param db: Hash database
+        :param hash_model: Database model, which is used to store the hashes
+        :param batch_size: Max. number of hash ids, which are used in a single IN (...) query
+        :param cache: :class:`HashCache` instance or None
+        :param metrics: ValidationMetrics instance or None
+        """
+        self.db = db
+        self.hash_model = hash_model
+        self.batch_size = batch_size
+        self.cache = cache
+        self.metrics = metrics
+        self._pending = WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+        self._insert, self._update = self._create_statements()
+
+    def register_validator(self, validator_hash_id):
+        """
+        Prepares the store for the hashes of a new database validator.
+
+        :param validator_hash_id: hash_id of the DbValidator
+        :return: None
+        """
+        pass
+
+    def get_hash_id(self, validator_hash_id, key_id):
+        """
+        Returns the id, which is used to store the hash of a single row.
+
+        :param validator_hash_id: hash_id of the DbValidator
+        :param key_id: Primary key of the row as string
+        :return: hash id as string "<validator_hash_id>.<key_id>"
+        """
+        return ".".join([validator_hash_id, key_id])
+
+    def iter_key_ids(self, validator_hash_id, batch_size=None):
+        """
+        Yields lists with the key ids of all stored hashes of a database validator.
+        The hashes are requested by an own session, so that the session of the hash database is not affected.
+
+        :param validator_hash_id: hash_id of the DbValidator
+        :param batch_size: Max. number of key ids per list and query. If None, the batch_size of the store is used.
+        """
+        hash_id_column = self.hash_model.hash_id
+        # All hash ids of the validator start with "<validator_hash_id>." and are smaller than "<validator_hash_id>/"
+        prefix = validator_hash_id + "."
+        upper_bound = validator_hash_id + chr(ord(".") + 1)
+        last_hash_id = prefix
+        session = Session(bind=self.db.engine)
+        try:
+            while True:
+                query = session.query(hash_id_column)\
+                    .filter(hash_id_column > last_hash_id, hash_id_column < upper_bound)
+                hash_ids = [row[0] for row in query.order_by(hash_id_column).limit(batch_size or self.batch_size)]
+                session.rollback()
+                if not hash_ids:
+                    break
+                last_hash_id = hash_ids[-1]
+                yield [hash_id[len(prefix):] for hash_id in hash_ids]
+        finally:
+            session.close()
+
+    def get(self, hash_ids, batch_size=None, use_cache=True, session=None, model_session=None, name=None):
+        """
+        Requests the stored hashes for the given hash ids.
+
+        :param hash_ids: List of hash ids
+        :param batch_size: Max. number of hash ids per query. If None, the batch_size of the store is used.
+        :param use_cache: If False, all hashes are requested from the hash database and the cache is not updated.
+        :param session: Session of the hash database, which is used for the queries.
+                        If None, an own session is used, which gets closed after the queries. So no read
+                        transaction is left open, which would hide hashes committed later on.
+        :param model_session: Session of the validated models. Its not yet committed hashes are returned as well.
+        :param name: Name of the validator, for which the metrics are collected in addition to "hash_db".
+        :return: dictionary with hash_id as key and the stored hash as value
+        """
+        stored_hashes = {}
+        unique_ids = list(set(hash_ids))
+        state = self._pending.get(model_session, None) if model_session is not None else None
+        if state is not None and state.hashes:
+            for hash_id in unique_ids:
+                if hash_id in state.hashes:
+                    stored_hashes[hash_id] = state.hashes[hash_id]
+            unique_ids = [hash_id for hash_id in unique_ids if hash_id not in stored_hashes]
+        cache = self.cache if use_cache else None
+        if cache is not None:
+            unique_ids = [hash_id for hash_id in unique_ids if not cache.lookup(hash_id, stored_hashes)]
+
+        if self.metrics is not None and unique_ids:
+            start_time = time.perf_counter()
+
+        batch_size = batch_size or self.batch_size or len(unique_ids) or 1
+        read_session = session if session is not None or not unique_ids else Session(bind=self.db.engine)
+        try:
+            for start in range(0, len(unique_ids), batch_size):
+                for hash_id, hash_value in self._read(unique_ids[start:start + batch_size], read_session):
+                    stored_hashes[hash_id] = hash_value
+                    if cache is not None:
+                        cache.set(hash_id, hash_value)
+        finally:
+            if read_session is not session:
+                read_session.close()
+
+        if self.metrics is not None and unique_ids:
+            duration = time.perf_counter() - start_time
+            for metrics_name in self._get_metrics_names(name):
+                self.metrics.increment(metrics_name, "read_queries", (len(unique_ids) + batch_size - 1) // batch_size)
+                self.metrics.increment(metrics_name, "hashes_read", len(unique_ids))
+                self.metrics.observe(metrics_name, "read_seconds", duration)
+        return stored_hashes
+
+    def refresh(self, hash_ids, name=None):
+        """
+        Requests the given hashes from the hash database, even if they are cached, and updates the cache.
+        Cached hashes, which do not exist anymore, are removed from the cache.
+
+        :param hash_ids: List of hash ids
+        :param name: Name of the validator, for which the metrics are collected in addition to "hash_db".
+        :return: dictionary with hash_id as key and the stored hash as value
+        """
+        stored_hashes = self.get(hash_ids, use_cache=False, name=name)
+        if self.cache is not None:
+            for hash_id in hash_ids:
+                if hash_id in stored_hashes:
+                    self.cache.set(hash_id, stored_hashes[hash_id])
+                else:
+                    self.cache.invalidate(hash_id)
+        return stored_hashes
+
+    def add(self, session, hash_id, hash_value, name=None):
+        """
+        Adds a new hash, which gets written when the given session commits its transaction.
+
+        :param session: Session, which flushes the validated model instance.
+                        If None, the hash gets written and committed directly.
+        :param hash_id: hash id
+        :param hash_value: new hash
+        :param name: Name of the validator, for which the metrics are collected in addition to "hash_db".
+        :return: None
+        """
+        if session is None:
+            self.write_committed({hash_id: hash_value}, name=name)
+            return
+
+        state = self._pending.get(session, None)
+        if state is None:
+            with self._lock:
+                state = self._pending.get(session, None)
+                if state is None:
+                    state = self._pending[session] = _SessionHashes(Session(bind=self.db.engine))
+                    event.listen(session, "after_flush", self._after_flush)
+                    event.listen(session, "after_commit", self._after_commit)
+                    event.listen(session, "after_transaction_end", self._after_transaction_end)
+        state.added[hash_id] = hash_value
+        state.names[hash_id] = name
+
+    def write_committed(self, hashes, update=True, name=None):
+        """
+        Writes the given hashes by an own session of the hash database and commits them.
+        Other sessions of the hash database are not affected.
+
+        :param hashes: dictionary with hash_id as key and the new hash as value
+        :param update: If False, existing hashes are not updated. Default is True.
+        :param name: Name of the validator, for which the metrics are collected in addition to "hash_db".
+        :return: tuple of the number of inserted and the number of updated hashes
+        """
+        session = Session(bind=self.db.engine)
+        try:
+            result = self.write(hashes, update=update, session=session, name=name)
+            self._commit(session, hashes.keys())
+        finally:
+            session.close()
+        return result
+
+    def write(self, hashes, update=True, session=None, name=None):
+        """
+        Writes the given hashes to the hash database.
+        Existing hashes get updated, all others get inserted. The hash database does not get committed.
+
+        :param hashes: dictionary with hash_id as key and the new hash as value
+        :param update: If False, existing hashes are not updated. Default is True.
+        :param session: Session of the hash database, which executes the statements.
+                        If None, the session of the hash database is used.
+        :param name: Name of the validator, for which the metrics are collected in addition to "hash_db".
+        :return: tuple of the number of inserted and the number of updated hashes
+        """
+        if self.metrics is not None:
+            start_time = time.perf_counter()
+
+        if session is None:
+            session = self.db.session
+        existing = self.get(list(hashes.keys()), session=session, name=name)
+        inserts = []
+        updates = []
+        for hash_id, hash_value in hashes.items():
+            if hash_id in existing:
+                if existing[hash_id] != hash_value:
+                    if not update:
+                        continue
+                    updates.append((hash_id, hash_value))
+            else:
+                inserts.append((hash_id, hash_value))
+
+        if inserts:
+            session.execute(self._insert, [self._get_params(*entry) for entry in inserts])
+        if updates:
+            session.execute(self._update, [self._get_params(*entry) for entry in updates])
+
+        if self.cache is not None:
+            for hash_id, hash_value in inserts + updates:
+                self.cache.set(hash_id, hash_value)
+
+        if self.metrics is not None:
+            duration = time.perf_counter() - start_time
+            for metrics_name in self._get_metrics_names(name):
+                self.metrics.increment(metrics_name, "hashes_inserted", len(inserts))
+                self.metrics.increment(metrics_name, "hashes_updated", len(updates))
+                self.metrics.observe(metrics_name, "write_seconds", duration)
+        return len(inserts), len(updates)
+
+    def _get_metrics_names(self, name):
+        """
+        Returns the names, for which the metrics of a read or write are collected.
+        """
+        return [self.metrics_name] if name is None else [self.metrics_name, name]
+
+    def _create_statements(self):
+        """
+        Returns the bulk insert and update statements for the hash model.
+        """
+        table = self.hash_model.__table__
+        insert = table.insert().values(hash_id=bindparam("b_hash_id"), hash=bindparam("b_hash"))
+        update = table.update().where(table.c.hash_id == bindparam("b_hash_id")).values(hash=bindparam("b_hash"))
+        return insert, update
+
+    def _read(self, hash_ids, session):
+        """
+        Requests the stored hashes for a single chunk of hash ids by a single query.
+
+        :return: Iterable of (hash_id, hash) tuples
+        """
+        return session.query(self.hash_model.hash_id, self.hash_model.hash)\
+            .filter(self.hash_model.hash_id.in_(hash_ids))
+
+    def _get_params(self, hash_id, hash_value):
+        """
+        Returns the bind parameters of the insert and update statements.
+        """
+        return {"b_hash_id": hash_id, "b_hash": hash_value}
+
+    def _commit(self, session, hash_ids):
+        """
+        Commits the given hash database session. Written hashes are removed from the cache, if the commit fails.
+        """
+        try:
+            session.commit()
+        except BaseException:
+            session.rollback()
+            if self.cache is not None:
+                for hash_id in hash_ids:
+                    self.cache.invalidate(hash_id)
+            raise
+
+    def _after_flush(self, session, flush_context):
+        state = self._pending.get(session, None)
+        if state is None or not state.added:
+            return
+        # Hashes of the flush are kept until the transaction of the session ends. Writing them directly would
+        # lock the hash database (e.g. SQLite) for the complete transaction.
+        state.hashes.update(state.added)
+        state.added.clear()
+
+    def _after_commit(self, session):
+        state = self._pending.get(session, None)
+        if state is None or not state.hashes:
+            return
+        hashes = OrderedDict(state.hashes)
+        state.hashes.clear()
+        # Hashes are written per validator, so that the metrics can be collected for each of them
+        validator_hashes = OrderedDict()
+        for hash_id, hash_value in hashes.items():
+            validator_hashes.setdefault(state.names.pop(hash_id, None), OrderedDict())[hash_id] = hash_value
+        try:
+            for name, entries in validator_hashes.items():
+                self.write(entries, session=state.session, name=name)
+            self._commit(state.session, hashes.keys())
+        finally:
+            state.session.close()
+
+    def _after_transaction_end(self, session, transaction):
+        # Called for commits, rollbacks and closed sessions. Committed hashes are already written by _after_commit.
+        if transaction.parent is not None:
+            return
+        state = self._pending.get(session, None)
+        if state is not None:
+            state.added.clear()
+            state.hashes.clear()
+            state.names.clear()
+
+
+class CompactHashStore(HashStore):
+    """
+    :class:`HashStore` for the compact schema, which is used if the application configuration **HASH_DB_SCHEMA**
+    is "compact".
+
+    Each database validator gets an integer id by the table ``hash_validators``. The hashes are stored in the table
+    ``row_hashes`` with the composite primary key (validator_id, row_key), where row_key is the primary key of the
+    row as UTF-8 encoded string. The hash is stored as raw digest together with the name of its algorithm
+    (NULL for hashes without prefix).
+
+    Hash ids of this store are tuples of (validator_id, row_key). All other functions work like the ones of
+    :class:`HashStore` and get and return hashes as strings.
+    """
+    def __init__(self, db, hash_model, validator_model, batch_size=500, cache=None, metrics=None):
+        """
+        :param db: Hash database
+        :param hash_model: Database model, which is used to store the hashes
+        :param validator_model: Database model, which is used to store the ids of the validators
+        :param batch_size: Max. number of hash ids, which are used in a single IN (...) query
+        :param cache: :class:`HashCache` instance or None
+        :param metrics: ValidationMetrics instance or None
+        """
+        super(CompactHashStore, self).__init__(db, hash_model, batch_size=batch_size, cache=cache, metrics=metrics)
+        self.validator_model = validator_model
+        self._validator_ids = {}
+
+    def register_validator(self, validator_hash_id):
+        """
+        Requests the id of a database validator and creates it, if the validator is new.
+
+        :param validator_hash_id: hash_id of the DbValidator
+        :return: None
+        """
+        with self._lock:
+            if validator_hash_id in self._validator_ids:
+                return
+            # An own session is committed, so that no other hashes of the hash database session are committed
+            session = Session(bind=self.db.engine)
+            try:
+                row = session.query(self.validator_model.id)\
+                    .filter(self.validator_model.name == validator_hash_id).first()
+                if row is None:
+                    result = session.execute(self.validator_model.__table__.insert().values(name=validator_hash_id))
+                    session.commit()
+                    validator_id = result.inserted_primary_key[0]
+                else:
+                    validator_id = row[0]
+            finally:
+                session.close()
+            self._validator_ids[validator_hash_id] = validator_id
+
+    def get_hash_id(self, validator_hash_id, key_id):
+        """
+        Returns the id, which is used to store the hash of a single row.
+
+        :param validator_hash_id: hash_id of the DbValidator
+        :param key_id: Primary key of the row as string
+        :return: tuple of (validator_id, row_key)
+        """
+        return self._validator_ids[validator_hash_id], key_id.encode("utf-8")
+
+    def iter_key_ids(self, validator_hash_id, batch_size=None):
+        """
+        Yields lists with the key ids of all stored hashes of a database validator.
+
+        :param validator_hash_id: hash_id of the DbValidator
+        :param batch_size: Max. number of key ids per list and query. If None, the batch_size of the store is used.
+        """
+        validator_id = self._validator_ids[validator_hash_id]
+        row_key_column = self.hash_model.row_key
+        last_row_key = None
+        session = Session(bind=self.db.engine)
+        try:
+            while True:
+                query = session.query(row_key_column).filter(self.hash_model.validator_id == validator_id)
+                if last_row_key is not None:
+                    query = query.filter(row_key_column > last_row_key)
+                row_keys = [row[0] for row in query.order_by(row_key_column).limit(batch_size or self.batch_size)]
+                session.rollback()
+                if not row_keys:
+                    break
+                last_row_key = row_keys[-1]
+                yield [row_key.decode("utf-8") for row_key in row_keys]
+        finally:
+            session.close()
+
+    def _create_statements(self):
+        table = self.hash_model.__table__
+        insert = table.insert().values(validator_id=bindparam("b_validator_id"), row_key=bindparam("b_row_key"),
+                                       algorithm=bindparam("b_algorithm"), digest=bindparam("b_digest"))
+        update = table.update()\
+            .where(and_(table.c.validator_id == bindparam("b_validator_id"),
+                        table.c.row_key == bindparam("b_row_key")))\
+            .values(algorithm=bindparam("b_algorithm"), digest=bindparam("b_digest"))
+        return insert, update
+
+    def _read(self, hash_ids, session):
+        row_keys = OrderedDict()
+        for validator_id, row_key in hash_ids:
+            row_keys.setdefault(validator_id, []).append(row_key)
+
+        for validator_id, keys in row_keys.items():
+            rows = session.query(self.hash_model.row_key, self.hash_model.algorithm, self.hash_model.digest)\
+                .filter(self.hash_model.validator_id == validator_id, self.hash_model.row_key.in_(keys))
+            for row_key, algorithm, digest in rows:
+                yield (validator_id, bytes(row_key)), format_hash(algorithm, hexlify(digest).decode("ascii"))
+
+    def _get_params(self, hash_id, hash_value):
+        algorithm, hexdigest = split_hash(hash_value)
+        return {"b_validator_id": hash_id[0], "b_row_key": hash_id[1], "b_algorithm": algorithm,
+                "b_digest": unhexlify(hexdigest)}
+
+
+class HashCache:
+    """
+    Bounded LRU cache for stored hashes, which is used to avoid requests on the hash database.
+
+    Entries can expire after a given time to live. Cache hits and misses are counted.
+    """
+    def __init__(self, size=10000, ttl=None):
+        """
+        :param size: Max. number of cached hashes. If the limit is reached, the least recently used hash is removed.
+        :param ttl: Time in seconds, after which a cached hash expires. If None, hashes do not expire.
+        """
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, hash_id, result):
+        """
+        Looks up a cached hash and stores it inside the given result dictionary.
+
+        :param hash_id: hash id
+        :param result: dictionary, which gets the cached hash for hash_id
+        :return: True, if hash was found in cache. Else False
+        """
+        with self._lock:
+            entry = self._entries.get(hash_id, None)
+            if entry is not None and self.ttl is not None and entry[1] < time.time():
+                del self._entries[hash_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(hash_id)
+            self.hits += 1
+        result[hash_id] = entry[0]
+        return True
+
+    def get(self, hash_id):
+        """
+        Returns the cached hash for hash_id or None.
+        """
+        result = {}
+        self.lookup(hash_id, result)
+        return result.get(hash_id, None)
+
+    def set(self, hash_id, hash_value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[hash_id] = (hash_value, expires)
+            self._entries.move_to_end(hash_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, hash_id):
+        with self._lock:
+            self._entries.pop(hash_id, None)
+
+    def clear(self):
+        """
+        Removes all cached hashes and resets the hit/miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _SessionHashes:
+    """
+    Hashes of a single session of validated models, which are not committed yet.
+
+    added contains the hashes of the current flush, hashes the ones of all finished flushes of the current
+    transaction. names contains the name of the validator of each hash. session is the own session of the hash
+    database, which writes and commits them.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.added = OrderedDict()
+        self.hashes = OrderedDict()
+        self.names = {}
+
+
+class _PendingHashChecks:
+    """
+    Collects the refreshed instances of a single query result, so that their hashes can be
+    requested and validated together.
+
+    Gets registered as post load handler on the SQLAlchemy query context.
+    """
+    def __init__(self, db_validator):
+        self.db_validator = db_validator
+        self.targets = OrderedDict()
+
+    def add(self, target):
+        self.targets[id(target)] = target
+
+    def invoke(self, context, path):
+        if not self.targets:
+            return
+        targets = list(self.targets.values())
+        self.targets.clear()
+        self.db_validator.check_hashes(targets)
+
+
+def _binary(length):
+    """
+    Returns a binary column type with the given max. length.
+    LargeBinary is a BLOB type for some databases, which can not be used as primary key, so VARBINARY or RAW is
+    used for them.
+    """
+    return LargeBinary(length)\
+        .with_variant(VARBINARY(length), "mysql")\
+        .with_variant(VARBINARY(length), "mssql")\
+        .with_variant(RAW(length), "oracle")
+
+
+def _hash_rows(algorithm, encoder, rows):
+    """
+    Hashes the attribute values of the given rows. Gets executed by the worker processes of a backfill.
+    """
+    validator = _worker_validators.get((algorithm, encoder), None)
+    if validator is None:
+        validator = _worker_validators[(algorithm, encoder)] = Validator("backfill", "Backfill validator",
+                                                                         algorithm=algorithm, encoder=encoder)
+    return [validator.hash_values(values) for values in rows]
+
+
+#: Validators of a worker process, indexed by algorithm and encoder name
+_worker_validators = {}
+
+
+def _read_checkpoint(checkpoint, hash_id):
+    """
+    Returns the last key of a backfill checkpoint file or None, if the file does not exist.
+    """
+    if not os.path.exists(checkpoint):
+        return None
+    with open(checkpoint) as checkpoint_file:
+        state = json.load(checkpoint_file)
+    if state["validator"] != hash_id:
+        raise ValueError("Checkpoint %s was created for %s, not for %s" % (checkpoint, state["validator"], hash_id))
+    return tuple(state["last_key"])
+
+
+def _write_checkpoint(checkpoint, hash_id, state):
+    temporary_file = checkpoint + ".tmp"
+    with open(temporary_file, "w") as checkpoint_file:
+        json.dump({"validator": hash_id, "last_key": list(state.last_key), "rows": state.rows}, checkpoint_file)
+    os.replace(temporary_file, checkpoint)
+
+
+def _get_key_id(key):
+    """
+    Returns the string representation of a primary key tuple, which is part of the hash id.
+
+    Keys of a single column are represented by the string of their value, so "5" for the integer key 5.
+    Components of composite keys are separated by ".". Each "." and "\\" inside a component gets escaped by "\\",
+    so that keys like ("a.b", "c") and ("a", "b.c") get different ids.
+    """
+    if len(key) == 1:
+        return str(key[0])
+    return ".".join([str(value).replace("\\", "\\\\").replace(".", "\\.") for value in key])
+
+
+def _split_key_id(key_id):
+    """
+    Splits the key id of a composite key into its unescaped components.
+    """
+    components = []
+    current = []
+    escaped = False
+    for character in key_id:
+        if escaped:
+            current.append(character)
+            escaped = False
+        elif character == "\\":
+            escaped = True
+        elif character == ".":
+            components.append("".join(current))
+            current = []
+        else:
+            current.append(character)
+    components.append("".join(current))
+    return components
+
+
+def _as_key(key):
+    """
+    Returns a primary key as tuple. Single values are used as key of a single column.
+    """
+    if key is None or isinstance(key, tuple):
+        return key
+    if isinstance(key, list):
+        return tuple(key)
+    return (key,)
+
+
+def _compare_key(key_columns, key, operator):
+    """
+    Returns a condition, which compares the primary key columns with the given key tuple by ">" or "<=".
+    """
+    if len(key_columns) == 1:
+        columns, key = key_columns[0], key[0]
+    else:
+        columns, key = tuple_(*key_columns), tuple_(*key)
+    return columns > key if operator == ">" else columns <= key
+
+
+def _throttle(start_time, rows, max_rows_per_second):
+    """
+    Sleeps as long as needed to not exceed max_rows_per_second since start_time.
+    """
+    if not max_rows_per_second:
+        return
+    delay = rows / float(max_rows_per_second) - (time.perf_counter() - start_time)
+    if delay > 0:
+        time.sleep(delay)
 
 
 class ValidationError(BaseException):
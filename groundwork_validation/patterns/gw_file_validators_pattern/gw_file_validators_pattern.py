@@ -1,4 +1,34 @@
+import binascii
+import fnmatch
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 from groundwork_validation.patterns import GwValidatorsPattern
+from groundwork_validation.patterns.gw_validators_pattern.algorithms import format_hash, split_hash, SEPARATOR
+
+#: Result of :func:`FileValidatorsPlugin.hash_many` for a single file. error is None, if hashing was successful.
+FileHashResult = namedtuple("FileHashResult", ["file", "hash", "error"])
+
+#: Result of :func:`FileValidatorsPlugin.validate_many` for a single file. error is None, if hashing was successful.
+FileValidationResult = namedtuple("FileValidationResult", ["file", "valid", "hash", "error"])
+
+#: Result of :func:`FileValidatorsPlugin.verify_tree`. Each entry is a sorted list of relative file paths.
+TreeVerificationResult = namedtuple("TreeVerificationResult", ["added", "removed", "modified"])
+
+#: Merkle tree of a file, created by :func:`FileValidatorsPlugin.hash_chunked`.
+#: leaves contains the hex digest of each chunk, root the hex digest of the complete tree.
+MerkleTree = namedtuple("MerkleTree", ["algorithm", "chunk_size", "size", "root", "leaves"])
+
+#: Result of :func:`FileValidatorsPlugin.verify_chunked`.
+#: changed is a sorted list of (start, end) tuples of changed byte ranges. end is exclusive.
+ChunkVerificationResult = namedtuple("ChunkVerificationResult", ["valid", "changed"])
 
 
 class GwFileValidatorsPattern(GwValidatorsPattern):
@@ -23,48 +53,90 @@ class GwFileValidatorsPattern(GwValidatorsPattern):
         super(GwFileValidatorsPattern, self).__init__(app, **kwargs)
         self.app = app
         self.validators.file = FileValidatorsPlugin(self)
+        if not hasattr(self.app.validators, "file"):
+            self.app.validators.file = FileValidatorsApplication(self.app)
+
+
+class FileValidatorsApplication:
+    """
+    Cares about file validation on application level.
+    """
+    def __init__(self, app):
+        self.app = app
+        cache_file = self.app.config.get("VALIDATION_FILE_CACHE", None)
+        if cache_file is not None:
+            self.cache = FileHashCache(cache_file)
+        else:
+            self.cache = None
 
 
 class FileValidatorsPlugin:
     def __init__(self, plugin):
         self.plugin = plugin
+        self.app = plugin.app
         self._validator = None
 
-    def hash(self, file, validator=None, hash_file=None, blocksize=65536, return_hash_object=False):
+    def hash(self, file, validator=None, hash_file=None, blocksize=None, return_hash_object=False, use_mmap=False,
+             rehash=False):
         """
         Creates a hash of a given file.
 
+        The file content is read into a reused buffer and fed directly into the hash object of the validator.
+        So the hash is equal to the one of common tools like sha256sum.
+        Validators, which use the legacy "pickle" encoder, hash each pickled file block instead, so that hashes
+        of groundwork-validation <= 0.1.5 are still valid.
+
         :param file: file path of the hashable file
         :param validator: validator, which shall be used. If none is given, a default validator will be used.
                           validator should be registered be the GwValidatorsPattern. Default is None
         :param hash_file: Path to a file, which is used to store the calculated hash value. Default is None
-        :param blocksize: Size of each file block, which is used to update the hash. Default is 65536
+        :param blocksize: Size of each file block, which is used to update the hash.
+                          If None, the size is chosen based on the file size.
         :param return_hash_object: Returns the hash object instead of the hash itself. Default is False
+        :param use_mmap: If True, the file gets memory mapped instead of read. Default is False
+        :param rehash: If True, the file gets hashed even if a valid hash is stored in the file hash cache.
+                       Default is False
         :return: string, which represents the hash (hexdigest)
         """
-        if validator is None:
-            if self._validator is None:
-                self._validator = self.plugin.validators.register("cmd_validator_%s" % self.plugin.name,
-                                                                  "CMD validator for plugin %s" % self.plugin.name)
-            validator = self._validator
+        validator = self._get_validator(validator)
+        hash_object = validator.get_hash_object()
+        legacy = validator.encoder.name == "pickle"
 
-        with open(file, 'rb') as afile:
-            buf = afile.read(blocksize)
-            hash_object = validator.get_hash_object()
-            while len(buf) > 0:
-                hash_object = validator.hash(buf, hash_object=hash_object, return_hash_object=True)
-                buf = afile.read(blocksize)
+        cache = self.app.validators.file.cache
+        if cache is None or legacy or return_hash_object:
+            hash_value = None
+            cache = None
+        else:
+            path = os.path.abspath(file)
+            file_stat = os.stat(path)
+            hash_value = None if rehash else cache.get(path, validator.get_algorithm_name(), file_stat)
 
-        if hash_file is not None:
-            with open(hash_file, "w") as hfile:
-                hfile.write(hash_object.hexdigest())
+        metrics = validator.metrics
+        if hash_value is None:
+            if legacy:
+                # Measured by the validator itself
+                self._update_legacy(file, validator, hash_object, blocksize or 65536)
+            elif metrics is None:
+                self._update(file, hash_object, blocksize, use_mmap)
+            else:
+                start = time.perf_counter()
+                size = self._update(file, hash_object, blocksize, use_mmap)
+                metrics.increment(validator.name, "file_hash_calls")
+                metrics.increment(validator.name, "bytes_hashed", size)
+                metrics.observe(validator.name, "file_hash_seconds", time.perf_counter() - start)
+            if return_hash_object:
+                return self._write_hash_file(hash_file, hash_object)
+            hash_value = validator.format_hash(hash_object.hexdigest())
 
-        if return_hash_object:
-            return hash_object
-        else:
-            return hash_object.hexdigest()
+            if cache is not None:
+                cache.set(path, validator.get_algorithm_name(), file_stat, hash_value)
+        elif metrics is not None:
+            metrics.increment(validator.name, "file_cache_hits")
+
+        return self._write_hash_file(hash_file, hash_value)
 
-    def validate(self, file, hash_value=None, hash_file=None, validator=None, blocksize=65536):
+    def validate(self, file, hash_value=None, hash_file=None, validator=None, blocksize=None, use_mmap=False,
+                 rehash=False):
         """
         Validates a file against a given hash.
         The given hash can be a string or a hash file, which must contain the hash on the first row.
@@ -74,7 +146,10 @@ class FileValidatorsPlugin:
         :param hash_file:  file, which contains a hash value
         :param validator: groundwork validator, which shall be used. If None is given, a default one is used.
         :param blocksize: Size of each file block, which is used to update the hash.
-        :return: True, if validation is correct. Otherwise False
+                          If None, the size is chosen based on the file size.
+        :param use_mmap: If True, the file gets memory mapped instead of read. Default is False
+        :param rehash: If True, the file gets hashed even if a valid hash is stored in the file hash cache.
+        :return: True, if validation is correct. Otherwise False, also if the algorithm of the hash is not available.
         """
         if hash_value is None and hash_file is None:
             raise ValueError("hash_value or hash_file must be set.")
@@ -85,7 +160,618 @@ class FileValidatorsPlugin:
             with open(hash_file) as hfile:
                 hash_value = hfile.readline()
 
-        current_hash = self.hash(file, validator=validator, blocksize=blocksize)
-        if current_hash == hash_value:
+        validator = self._get_validator(validator)
+        try:
+            # The hash may be created by another algorithm than the one of the validator
+            validator = validator.for_hash(hash_value)
+        except KeyError:
+            current_hash = None
+        else:
+            current_hash = self.hash(file, validator=validator, blocksize=blocksize, use_mmap=use_mmap,
+                                     rehash=rehash)
+        if current_hash is not None and _equal_hashes(current_hash, hash_value):
             return True
+        if validator.metrics is not None:
+            validator.metrics.increment(validator.name, "failed_validations")
         return False
+
+    def hash_many(self, files, validator=None, blocksize=None, workers=None):
+        """
+        Creates hashes for multiple files in parallel.
+
+        The files are hashed by a pool of threads. Results are returned as soon as a file is hashed, so their order
+        may differ from the given order. Errors (e.g. a missing file) are stored inside the result of the
+        affected file and do not stop the hashing of other files.
+
+        Usage::
+
+            for result in self.validators.file.hash_many(["/path/to/file_1.txt", "/path/to/file_2.txt"]):
+                if result.error is None:
+                    print("%s: %s" % (result.file, result.hash))
+
+        :param files: Iterable of file paths
+        :param validator: validator, which shall be used. If none is given, a default validator will be used.
+        :param blocksize: Size of each file block. If None, the size is chosen based on the file size.
+        :param workers: Number of threads. If None, the number of CPUs + 4 is used (max. 32).
+        :return: Generator of :class:`FileHashResult`
+        """
+        validator = self._get_validator(validator)
+
+        def hash_file(file):
+            try:
+                return FileHashResult(file, self.hash(file, validator=validator, blocksize=blocksize), None)
+            except Exception as e:
+                return FileHashResult(file, None, e)
+
+        return self._run_parallel(hash_file, files, workers)
+
+    def validate_many(self, files, validator=None, blocksize=None, workers=None, rehash=False):
+        """
+        Validates multiple files in parallel.
+
+        Works like :func:`hash_many`, but compares the calculated hashes against the given ones.
+
+        :param files: Dictionary with file path as key and the expected hash as value
+        :param validator: validator, which shall be used. If none is given, a default validator will be used.
+        :param blocksize: Size of each file block. If None, the size is chosen based on the file size.
+        :param workers: Number of threads. If None, the number of CPUs + 4 is used (max. 32).
+        :param rehash: If True, all files get hashed even if valid hashes are stored in the file hash cache.
+        :return: Generator of :class:`FileValidationResult`
+        """
+        validator = self._get_validator(validator)
+
+        def validate_file(item):
+            file, hash_value = item
+            try:
+                current_hash = self.hash(file, validator=validator.for_hash(hash_value), blocksize=blocksize,
+                                         rehash=rehash)
+            except Exception as e:
+                return FileValidationResult(file, False, None, e)
+            return FileValidationResult(file, _equal_hashes(current_hash, hash_value), current_hash, None)
+
+        return self._run_parallel(validate_file, files.items(), workers)
+
+    def hash_tree(self, root, include=None, exclude=None, manifest=None, format="sha256sum", validator=None,
+                  blocksize=None, workers=None):
+        """
+        Creates hashes for all files of a directory tree and stores them inside a single manifest file.
+
+        Files are selected by glob patterns (see fnmatch), which are matched against the file path relative to root.
+        Paths use "/" as separator on all platforms. Directories, which match an exclude pattern, are not walked.
+
+        Usage::
+
+            hashes = self.validators.file.hash_tree("/path/to/assets", include=["*.png", "*.json"],
+                                                    exclude=["tmp/*"], manifest="/path/to/assets.sha256")
+
+        :param root: Path of the directory
+        :param include: Glob pattern or list of glob patterns. If None, all files are included.
+        :param exclude: Glob pattern or list of glob patterns. If None, no files are excluded.
+        :param manifest: Path of the manifest file. If None, no manifest gets written.
+        :param format: "sha256sum" for a file, which can be checked by tools like "sha256sum -c", or "json".
+        :param validator: validator, which shall be used. If none is given, a default validator will be used.
+        :param blocksize: Size of each file block. If None, the size is chosen based on the file size.
+        :param workers: Number of threads. If None, the number of CPUs + 4 is used (max. 32).
+        :return: Dictionary with relative file path as key and hash as value
+        """
+        if format not in _manifest_formats:
+            raise ValueError("Unknown manifest format %s. Available formats: %s"
+                             % (format, ", ".join(_manifest_formats)))
+        validator = self._get_validator(validator)
+        ignore = [manifest] if manifest is not None else []
+        files = dict((os.path.join(root, path), path) for path in _walk(root, include, exclude, ignore))
+
+        hashes = {}
+        for result in self.hash_many(files.keys(), validator=validator, blocksize=blocksize, workers=workers):
+            if result.error is not None:
+                raise result.error
+            hashes[files[result.file]] = result.hash
+
+        if manifest is not None:
+            with open(manifest, "w", encoding="utf-8", newline="\n") as manifest_file:
+                _manifest_formats[format][0](manifest_file, hashes, validator.get_algorithm_name())
+        return hashes
+
+    def verify_tree(self, root, manifest, include=None, exclude=None, format=None, validator=None, blocksize=None,
+                    workers=None, rehash=False):
+        """
+        Verifies a directory tree against a manifest, which was created by :func:`hash_tree`.
+
+        Only files, which are listed inside the manifest, are hashed. Added files are detected by walking the tree,
+        so include and exclude should be the same as for the creation of the manifest.
+
+        :param root: Path of the directory
+        :param manifest: Path of the manifest file
+        :param include: Glob pattern or list of glob patterns. If None, all files are included.
+        :param exclude: Glob pattern or list of glob patterns. If None, no files are excluded.
+        :param format: "sha256sum" or "json". If None, "json" is used for manifests with extension ".json".
+        :param validator: validator, which shall be used. If none is given, a default validator will be used.
+        :param blocksize: Size of each file block. If None, the size is chosen based on the file size.
+        :param workers: Number of threads. If None, the number of CPUs + 4 is used (max. 32).
+        :param rehash: If True, all files get hashed even if valid hashes are stored in the file hash cache.
+        :return: :class:`TreeVerificationResult`
+        """
+        if format is None:
+            format = "json" if manifest.lower().endswith(".json") else "sha256sum"
+        if format not in _manifest_formats:
+            raise ValueError("Unknown manifest format %s. Available formats: %s"
+                             % (format, ", ".join(_manifest_formats)))
+        validator = self._get_validator(validator)
+        with open(manifest, encoding="utf-8", newline="\n") as manifest_file:
+            expected_hashes = _manifest_formats[format][1](manifest_file, validator.get_algorithm_name())
+
+        current_files = set(_walk(root, include, exclude, [manifest]))
+        added = sorted(current_files.difference(expected_hashes))
+        removed = sorted(set(expected_hashes).difference(current_files))
+
+        files = dict((os.path.join(root, path), path) for path in current_files.intersection(expected_hashes))
+        modified = []
+        for result in self.validate_many(dict((file, expected_hashes[path]) for file, path in files.items()),
+                                         validator=validator, blocksize=blocksize, workers=workers, rehash=rehash):
+            if result.error is not None:
+                raise result.error
+            if not result.valid:
+                modified.append(files[result.file])
+
+        return TreeVerificationResult(added, removed, sorted(modified))
+
+    def hash_chunked(self, file, chunk_size=4 * 1024 * 1024, tree_file=None, validator=None, workers=None):
+        """
+        Creates a Merkle tree for a file by hashing fixed-size chunks in parallel.
+
+        Each chunk is a leaf of the tree. So a later verification can check the chunks in parallel, stop at the
+        first changed chunk and report the changed byte ranges.
+
+        The tree gets stored as JSON file next to the hashed file, if tree_file is not set.
+
+        :param file: file path of the hashable file
+        :param chunk_size: Size of each chunk in bytes. Default is 4 MiB.
+        :param tree_file: Path of the file, which stores the tree. If None, "<file>.merkle" is used.
+                          If False, the tree is not stored.
+        :param validator: validator, which shall be used. If none is given, a default validator will be used.
+        :param workers: Number of threads. If None, the number of CPUs + 4 is used (max. 32).
+        :return: :class:`MerkleTree`
+        """
+        validator = self._get_validator(validator)
+        size = os.stat(file).st_size
+        chunks = range(_get_chunk_count(size, chunk_size))
+        leaves = self._hash_chunks(file, chunks, chunk_size, validator, workers)
+        tree = _create_merkle_tree(validator, chunk_size, size, [leaves[index] for index in chunks])
+        self._write_tree_file(file, tree_file, tree)
+        return tree
+
+    def verify_chunked(self, file, tree_file=None, stop_early=True, validator=None, workers=None):
+        """
+        Verifies a file against a Merkle tree, which was created by :func:`hash_chunked`.
+
+        :param file: file path
+        :param tree_file: Path of the file, which stores the tree. If None, "<file>.merkle" is used.
+                          Can also be a :class:`MerkleTree` instance.
+        :param stop_early: If True, the verification stops after the first changed chunk is found. So only
+                           the changed byte ranges of already hashed chunks are reported.
+        :param validator: validator, which shall be used. If none is given, a default validator will be used.
+        :param workers: Number of threads. If None, the number of CPUs + 4 is used (max. 32).
+        :return: :class:`ChunkVerificationResult`
+        """
+        tree, validator = self._read_tree_file(file, tree_file, self._get_validator(validator))
+        size = os.stat(file).st_size
+        chunk_size = tree.chunk_size
+        chunk_count = _get_chunk_count(size, chunk_size)
+        known_chunks = min(chunk_count, len(tree.leaves))
+
+        changed = set()
+        if size != tree.size:
+            # The last known chunk may be incomplete and all following bytes are new or removed
+            changed.update(range(min(size, tree.size) // chunk_size, max(chunk_count, len(tree.leaves))))
+            known_chunks = min(known_chunks, min(size, tree.size) // chunk_size)
+            if stop_early:
+                return ChunkVerificationResult(False, _get_changed_ranges(changed, chunk_size, max(size, tree.size)))
+
+        results = self._run_parallel(lambda index: (index, self._hash_chunk(file, index, chunk_size, validator)),
+                                     range(known_chunks), workers)
+        try:
+            for index, leaf in results:
+                if leaf != tree.leaves[index]:
+                    changed.add(index)
+                    if stop_early:
+                        break
+        finally:
+            results.close()
+
+        return ChunkVerificationResult(len(changed) == 0,
+                                       _get_changed_ranges(changed, chunk_size, max(size, tree.size)))
+
+    def rehash_chunked(self, file, chunks=None, tree_file=None, validator=None, workers=None):
+        """
+        Updates a stored Merkle tree by hashing only the given chunks of a file.
+
+        If the file size has changed, new chunks get hashed and removed chunks are deleted from the tree.
+
+        :param file: file path
+        :param chunks: Indexes of the changed chunks. If None, all changed chunks are detected by
+                       :func:`verify_chunked`.
+        :param tree_file: Path of the file, which stores the tree. If None, "<file>.merkle" is used.
+        :param validator: validator, which shall be used. If none is given, a default validator will be used.
+        :param workers: Number of threads. If None, the number of CPUs + 4 is used (max. 32).
+        :return: Updated :class:`MerkleTree`
+        """
+        tree, validator = self._read_tree_file(file, tree_file, self._get_validator(validator))
+        size = os.stat(file).st_size
+        chunk_size = tree.chunk_size
+        chunk_count = _get_chunk_count(size, chunk_size)
+
+        if chunks is None:
+            result = self.verify_chunked(file, tree, stop_early=False, validator=validator, workers=workers)
+            chunks = set()
+            for start, end in result.changed:
+                chunks.update(range(start // chunk_size, _get_chunk_count(end, chunk_size)))
+        else:
+            chunks = set(chunks)
+        if size != tree.size:
+            chunks.update(range(min(size, tree.size) // chunk_size, chunk_count))
+        chunks = [index for index in chunks if index < chunk_count]
+
+        leaves = list(tree.leaves[:chunk_count]) + [None] * max(chunk_count - len(tree.leaves), 0)
+        for index, leaf in self._hash_chunks(file, chunks, chunk_size, validator, workers).items():
+            leaves[index] = leaf
+
+        tree = _create_merkle_tree(validator, chunk_size, size, leaves)
+        self._write_tree_file(file, tree_file, tree)
+        return tree
+
+    def _hash_chunks(self, file, chunks, chunk_size, validator, workers=None):
+        """
+        Hashes the given chunks in parallel and returns a dictionary with the chunk index as key.
+        """
+        return dict(self._run_parallel(lambda index: (index, self._hash_chunk(file, index, chunk_size, validator)),
+                                       chunks, workers))
+
+    def _hash_chunk(self, file, index, chunk_size, validator):
+        with open(file, "rb", buffering=0) as afile:
+            afile.seek(index * chunk_size)
+            data = afile.read(chunk_size)
+        hash_object = validator.get_hash_object()
+        hash_object.update(b"\x00")
+        hash_object.update(data)
+        return hash_object.hexdigest()
+
+    def _write_tree_file(self, file, tree_file, tree):
+        if tree_file is False:
+            return
+        if tree_file is None:
+            tree_file = "%s.merkle" % file
+        with open(tree_file, "w") as tfile:
+            json.dump(tree._asdict(), tfile)
+
+    def _read_tree_file(self, file, tree_file, validator):
+        """
+        Returns the stored tree and a validator, which uses the algorithm of the tree.
+        """
+        if isinstance(tree_file, MerkleTree):
+            tree = tree_file
+        else:
+            if tree_file is None:
+                tree_file = "%s.merkle" % file
+            with open(tree_file) as tfile:
+                tree = MerkleTree(**json.load(tfile))
+        if tree.algorithm != validator.get_algorithm_name():
+            try:
+                validator = validator.for_algorithm(tree.algorithm)
+            except KeyError:
+                raise ValueError("Merkle tree was created by algorithm %s, which is not available"
+                                 % tree.algorithm)
+        return tree, validator
+
+    def _write_hash_file(self, hash_file, result):
+        if hash_file is not None:
+            with open(hash_file, "w") as hfile:
+                hfile.write(result if isinstance(result, str) else result.hexdigest())
+        return result
+
+    def _update(self, file, hash_object, blocksize=None, use_mmap=False):
+        """
+        Feeds the content of file into hash_object without allocating new memory for each block.
+
+        :return: Size of the file in bytes
+        """
+        with open(file, "rb", buffering=0) as afile:
+            size = os.fstat(afile.fileno()).st_size
+            if blocksize is None:
+                blocksize = _get_blocksize(size)
+
+            if use_mmap and size > 0:
+                with closing(mmap.mmap(afile.fileno(), 0, access=mmap.ACCESS_READ)) as mapped_file:
+                    view = memoryview(mapped_file)
+                    try:
+                        for start in range(0, len(view), blocksize):
+                            hash_object.update(view[start:start + blocksize])
+                    finally:
+                        view.release()
+                return size
+
+            buf = bytearray(blocksize)
+            view = memoryview(buf)
+            readinto = afile.readinto
+            update = hash_object.update
+            length = readinto(buf)
+            total = 0
+            while length:
+                update(view[:length])
+                total += length
+                length = readinto(buf)
+            return total
+
+    def _update_legacy(self, file, validator, hash_object, blocksize):
+        """
+        Hashes each file block by the given validator. Used for validators with the legacy "pickle" encoder.
+        """
+        with open(file, 'rb') as afile:
+            buf = afile.read(blocksize)
+            while len(buf) > 0:
+                validator.hash(buf, hash_object=hash_object)
+                buf = afile.read(blocksize)
+
+    def _get_validator(self, validator):
+        if validator is None:
+            if self._validator is None:
+                self._validator = self.plugin.validators.register("cmd_validator_%s" % self.plugin.name,
+                                                                  "CMD validator for plugin %s" % self.plugin.name)
+            validator = self._validator
+        return validator
+
+    def _run_parallel(self, function, items, workers=None):
+        """
+        Executes function for each item inside a thread pool and yields the results in order of their completion.
+        Only a limited number of items is submitted at once, so that items can be a long running generator.
+        """
+        if workers is None:
+            workers = min(32, (os.cpu_count() or 1) + 4)
+
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = set()
+            try:
+                while True:
+                    for item in items:
+                        running.add(executor.submit(function, item))
+                        if len(running) >= workers * 2:
+                            break
+                    if not running:
+                        break
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                for future in running:
+                    future.cancel()
+
+
+class FileHashCache:
+    """
+    Persistent cache for file hashes, which is stored inside a SQLite database.
+
+    A stored hash is only used, if size, modification time and inode of the file are still the same as during
+    its hashing. Files, which were modified shortly before they got hashed, are not stored, because a second
+    modification inside the resolution of the file system timestamps would not be detected.
+    """
+    #: Files, which were modified less than this number of seconds before they got hashed, are not cached.
+    racy_seconds = 2
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS file_hashes ("
+                                     "path TEXT NOT NULL, "
+                                     "algorithm TEXT NOT NULL, "
+                                     "size INTEGER NOT NULL, "
+                                     "mtime_ns INTEGER NOT NULL, "
+                                     "inode INTEGER NOT NULL, "
+                                     "hash TEXT NOT NULL, "
+                                     "PRIMARY KEY (path, algorithm))")
+            self._connection.commit()
+
+    def get(self, path, algorithm, file_stat):
+        """
+        Returns the stored hash of a file, if the file has not changed since its hashing.
+
+        :param path: Absolute file path
+        :param algorithm: Name of the hash algorithm
+        :param file_stat: Current os.stat() result of the file
+        :return: hash as string or None
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT size, mtime_ns, inode, hash FROM file_hashes "
+                                           "WHERE path = ? AND algorithm = ?", (path, algorithm)).fetchone()
+        if row is None:
+            return None
+        if tuple(row[:3]) != (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino):
+            return None
+        return row[3]
+
+    def set(self, path, algorithm, file_stat, hash_value):
+        """
+        Stores the hash of a file, if the file has not changed during its hashing.
+
+        :param path: Absolute file path
+        :param algorithm: Name of the hash algorithm
+        :param file_stat: os.stat() result of the file, which was taken before the file got hashed
+        :param hash_value: hash as string
+        :return: True, if the hash got stored. Otherwise False
+        """
+        if file_stat.st_mtime_ns >= (time.time() - self.racy_seconds) * 1e9:
+            return False
+        current_stat = os.stat(path)
+        if (current_stat.st_size, current_stat.st_mtime_ns, current_stat.st_ino) != \
+                (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino):
+            return False
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?)",
+                                     (path, algorithm, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino,
+                                      hash_value))
+            self._connection.commit()
+        return True
+
+    def invalidate(self, path):
+        """
+        Deletes all stored hashes of a file.
+
+        :param path: Absolute file path
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM file_hashes WHERE path = ?", (path,))
+            self._connection.commit()
+
+    def clear(self):
+        """
+        Deletes all stored hashes.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM file_hashes")
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+
+
+def _walk(root, include=None, exclude=None, ignore=None):
+    """
+    Yields the relative paths of all files below root, which match the given include and exclude patterns.
+    """
+    if isinstance(include, str):
+        include = [include]
+    if isinstance(exclude, str):
+        exclude = [exclude]
+    exclude = exclude or []
+    ignore = set(os.path.abspath(path) for path in ignore or [])
+
+    def excluded(path):
+        return any(fnmatch.fnmatchcase(path, pattern) for pattern in exclude)
+
+    for directory, dirs, files in os.walk(root):
+        relative_directory = os.path.relpath(directory, root)
+        prefix = "" if relative_directory == os.curdir else relative_directory.replace(os.sep, "/") + "/"
+
+        dirs[:] = [name for name in dirs if not excluded(prefix + name) and not excluded(prefix + name + "/")]
+        dirs.sort()
+        for name in sorted(files):
+            path = prefix + name
+            if include is not None and not any(fnmatch.fnmatchcase(path, pattern) for pattern in include):
+                continue
+            if excluded(path):
+                continue
+            if ignore and os.path.abspath(os.path.join(directory, name)) in ignore:
+                continue
+            yield path
+
+
+def _write_checksum_manifest(manifest_file, hashes, algorithm):
+    # Tools like sha256sum or b2sum expect plain hexdigests, so the name of the algorithm is not written
+    # Same escaping as used by GNU coreutils for file names with backslashes or line breaks
+    for path in sorted(hashes):
+        hexdigest = split_hash(hashes[path])[1]
+        if "\\" in path or "\n" in path:
+            manifest_file.write("\\%s  %s\n" % (hexdigest, path.replace("\\", "\\\\").replace("\n", "\\n")))
+        else:
+            manifest_file.write("%s  %s\n" % (hexdigest, path))
+
+
+def _read_checksum_manifest(manifest_file, algorithm):
+    hashes = {}
+    for line in manifest_file:
+        line = line.rstrip("\n")
+        if not line:
+            continue
+        escaped = line.startswith("\\")
+        if escaped:
+            line = line[1:]
+        hash_value, path = line.split(" ", 1)
+        # The second separator character is a space or "*", which marks files hashed in binary mode
+        path = path[1:]
+        if escaped:
+            path = path.replace("\\\\", "\0").replace("\\n", "\n").replace("\0", "\\")
+        # Plain hexdigests were created by the algorithm of the verifying validator
+        hashes[path] = hash_value if SEPARATOR in hash_value else format_hash(algorithm, hash_value)
+    return hashes
+
+
+def _write_json_manifest(manifest_file, hashes, algorithm):
+    json.dump({"algorithm": algorithm, "files": hashes}, manifest_file, indent=2, sort_keys=True)
+    manifest_file.write("\n")
+
+
+def _read_json_manifest(manifest_file, algorithm):
+    return json.load(manifest_file)["files"]
+
+
+#: Writer and reader functions of the supported manifest formats
+_manifest_formats = {
+    "sha256sum": (_write_checksum_manifest, _read_checksum_manifest),
+    "json": (_write_json_manifest, _read_json_manifest),
+}
+
+
+def _equal_hashes(hash_value, expected_hash):
+    """
+    Compares two hashes of the same algorithm. Only one of them may contain the name of the algorithm
+    (e.g. "sha256:<hex>" and "<hex>").
+    """
+    return hash_value == expected_hash or split_hash(hash_value)[1] == split_hash(expected_hash)[1]
+
+
+def _get_chunk_count(size, chunk_size):
+    return (size + chunk_size - 1) // chunk_size
+
+
+def _create_merkle_tree(validator, chunk_size, size, leaves):
+    """
+    Calculates the root of a Merkle tree. Leaves are hashed as H(0x00 || chunk), inner nodes as
+    H(0x01 || left || right), so that a leaf can not be mistaken for an inner node.
+    The last node of a level gets promoted to the next level, if the level has an odd number of nodes.
+    """
+    nodes = [bytes.fromhex(leaf) for leaf in leaves]
+    if not nodes:
+        nodes = [validator.get_hash_object().digest()]
+    while len(nodes) > 1:
+        next_nodes = []
+        for index in range(0, len(nodes) - 1, 2):
+            hash_object = validator.get_hash_object()
+            hash_object.update(b"\x01" + nodes[index] + nodes[index + 1])
+            next_nodes.append(hash_object.digest())
+        if len(nodes) % 2:
+            next_nodes.append(nodes[-1])
+        nodes = next_nodes
+    return MerkleTree(validator.get_algorithm_name(), chunk_size, size, binascii.hexlify(nodes[0]).decode("ascii"),
+                      list(leaves))
+
+
+def _get_changed_ranges(chunks, chunk_size, size):
+    """
+    Merges the given chunk indexes to a sorted list of (start, end) byte ranges.
+    """
+    ranges = []
+    for index in sorted(chunks):
+        start = index * chunk_size
+        end = min(start + chunk_size, size)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def _get_blocksize(size):
+    """
+    Returns a block size for reading a file of the given size.
+    Bigger blocks reduce the number of read and update calls for big files.
+    """
+    if size < 1024 * 1024:
+        return 64 * 1024
+    if size < 64 * 1024 * 1024:
+        return 256 * 1024
+    return 1024 * 1024
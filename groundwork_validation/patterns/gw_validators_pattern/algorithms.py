@@ -0,0 +1,200 @@
+"""
+Hash algorithms, which can be selected by their name during validator registration or by the application
+configuration **VALIDATION_DEFAULT_ALGORITHM**.
+
+The following algorithms are available:
+
+* **sha256** (default), **sha512** and all other algorithms of ``hashlib.algorithms_available`` (e.g. ``md5``).
+* **blake2b** and **blake2s** with their maximum digest size. The digest size can be set in bits by a suffix,
+  e.g. ``blake2b-128`` or ``blake2s-64``.
+* **xxh64**, **xxh3_64** and **xxh3_128**, if the package ``xxhash`` is installed.
+* **crc32**: Fast checksum based on ``zlib.crc32``. Detects accidental corruption only.
+* **fast**: Alias for the fastest available non-cryptographic algorithm (``xxh3_64``, ``xxh64`` or ``crc32``).
+  So it depends on the installation of ``xxhash``, which algorithm gets used.
+
+Only use non-cryptographic algorithms to detect accidental corruption, not to detect manipulations.
+
+Hashes of all algorithms except sha256 are stored as ``<algorithm>:<hexdigest>``, so that the used algorithm can
+be detected during validation. Hashes without prefix are sha256 hashes (or hashes of a custom hashlib compliant
+function), which keeps them compatible to tools like ``sha256sum`` and to hashes of older versions.
+"""
+import hashlib
+import struct
+import zlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+#: Name of the algorithm, which is used if no other is configured. Its hashes are stored without prefix.
+DEFAULT_ALGORITHM = "sha256"
+
+#: Separator between algorithm name and hexdigest
+SEPARATOR = ":"
+
+
+class Crc32:
+    """
+    hashlib compliant wrapper of ``zlib.crc32``.
+    """
+    name = "crc32"
+    digest_size = 4
+    block_size = 1
+
+    def __init__(self, data=b""):
+        self._crc = zlib.crc32(data) if data else 0
+
+    def update(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def digest(self):
+        return struct.pack(">I", self._crc)
+
+    def hexdigest(self):
+        return "%08x" % self._crc
+
+    def copy(self):
+        other = Crc32()
+        other._crc = self._crc
+        return other
+
+
+def _blake2(function, bits):
+    def algorithm(data=b""):
+        return function(data, digest_size=bits // 8)
+    return algorithm
+
+
+_algorithms = {
+    "sha256": hashlib.sha256,
+    "sha512": hashlib.sha512,
+    Crc32.name: Crc32,
+}
+
+#: Max. digest size in bits of the blake2 algorithms
+_blake2_bits = {}
+
+# blake2 is available since Python 3.6
+if hasattr(hashlib, "blake2b"):
+    _algorithms["blake2b"] = hashlib.blake2b
+    _algorithms["blake2s"] = hashlib.blake2s
+    _blake2_bits = {"blake2b": 512, "blake2s": 256}
+
+if xxhash is not None:
+    _algorithms["xxh64"] = xxhash.xxh64
+    if hasattr(xxhash, "xxh3_64"):
+        _algorithms["xxh3_64"] = xxhash.xxh3_64
+        _algorithms["xxh3_128"] = xxhash.xxh3_128
+
+#: Aliases, which are resolved to the name of an available algorithm
+_aliases = {
+    "fast": "xxh3_64" if "xxh3_64" in _algorithms else "xxh64" if "xxh64" in _algorithms else Crc32.name,
+}
+
+
+def get_algorithm_name(name):
+    """
+    Returns the normalised name of an algorithm. Aliases get resolved and blake2 digest sizes, which are equal to
+    the maximum digest size, get removed (``blake2b-512`` gets ``blake2b``).
+
+    :param name: Name of an algorithm
+    :return: Normalised name
+    """
+    name = _aliases.get(name.lower(), name.lower())
+    base, _, bits = name.partition("-")
+    if bits and base in _blake2_bits and bits == str(_blake2_bits[base]):
+        return base
+    return name
+
+
+def get_algorithm(name=None):
+    """
+    Returns a hashlib compliant function of an algorithm.
+
+    :param name: Name of an algorithm. If None, sha256 is returned.
+    :return: Function, which returns a new hash object
+    """
+    if name is None:
+        name = DEFAULT_ALGORITHM
+    name = get_algorithm_name(name)
+    algorithm = _algorithms.get(name, None)
+    if algorithm is not None:
+        return algorithm
+
+    base, _, bits = name.partition("-")
+    if base in _blake2_bits and bits:
+        if not bits.isdigit() or int(bits) % 8 or not 8 <= int(bits) <= _blake2_bits[base]:
+            raise KeyError("Digest size of %s must be a multiple of 8 between 8 and %s bits"
+                           % (base, _blake2_bits[base]))
+        algorithm = _algorithms[name] = _blake2(_algorithms[base], int(bits))
+        return algorithm
+
+    if name in hashlib.algorithms_available:
+        algorithm = _algorithms[name] = _new_hashlib(name)
+        return algorithm
+
+    raise KeyError("Hash algorithm %s does not exist. Available algorithms: %s"
+                   % (name, ", ".join(sorted(list(_algorithms.keys()) + list(_aliases.keys())))))
+
+
+def find_algorithm_name(algorithm):
+    """
+    Returns the name of a registered hashlib compliant function.
+
+    :param algorithm: Function, which returns a new hash object
+    :return: Name of the algorithm or None, if the function is not registered.
+    """
+    for name, registered in _algorithms.items():
+        if registered is algorithm:
+            return name
+    return None
+
+
+def register_algorithm(name, algorithm):
+    """
+    Registers a hashlib compliant function, so that it can be selected by its name.
+
+    :param name: Name of the algorithm. Must not contain ":".
+    :param algorithm: Function, which returns a new hash object with the functions update, digest and hexdigest.
+    :return: None
+    """
+    name = name.lower()
+    if SEPARATOR in name:
+        raise ValueError("Name of an algorithm must not contain '%s'" % SEPARATOR)
+    if name in _algorithms.keys() or name in _aliases.keys():
+        raise KeyError("Hash algorithm %s already registered" % name)
+    _algorithms[name] = algorithm
+
+
+def format_hash(name, hexdigest):
+    """
+    Adds the name of the algorithm to a hexdigest. Hashes of sha256 and of not registered algorithms
+    (name is None) are returned unchanged.
+
+    :param name: Name of the algorithm or None
+    :param hexdigest: hexdigest as string
+    :return: hash as string
+    """
+    if name is None or name == DEFAULT_ALGORITHM:
+        return hexdigest
+    return name + SEPARATOR + hexdigest
+
+
+def split_hash(hash_string):
+    """
+    Splits a hash into the name of its algorithm and its hexdigest.
+
+    :param hash_string: hash as string
+    :return: tuple of algorithm name (None for hashes without prefix) and hexdigest
+    """
+    name, separator, hexdigest = hash_string.rpartition(SEPARATOR)
+    if not separator:
+        return None, hash_string
+    return get_algorithm_name(name), hexdigest
+
+
+def _new_hashlib(name):
+    def algorithm(data=b""):
+        return hashlib.new(name, data)
+    return algorithm
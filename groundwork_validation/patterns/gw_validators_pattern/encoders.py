@@ -0,0 +1,241 @@
+"""
+Encoders build the binary representation of python objects, which is fed into the hash objects of validators.
+
+Two encoders are available:
+
+* **canonical** (default): Writes a type tagged, length prefixed representation of the given data into the
+  hash object, without serialising each value by pickle.
+  For all supported types the output is independent of the used Python version.
+* **pickle**: Uses ``pickle.dumps``. Its output may change between Python versions, but it is needed to validate
+  hashes, which were created by older versions of groundwork-validation.
+"""
+import datetime
+import pickle
+import uuid
+from decimal import Decimal
+
+
+class Encoder:
+    """
+    Base class for all encoders.
+    """
+    #: Name, which is used to select the encoder during validator registration
+    name = None
+
+    def encode(self, data, update):
+        """
+        Feeds the binary representation of data into the given update function.
+
+        :param data: Python object
+        :param update: Function, which gets called with bytes. E.g. the update function of a hashlib object.
+        :return: None
+        """
+        raise NotImplementedError
+
+    def encode_values(self, values, update):
+        """
+        Feeds the binary representation of each given value into the given update function.
+
+        :param values: Iterable of python objects
+        :param update: Function, which gets called with bytes.
+        :return: None
+        """
+        encode = self.encode
+        for value in values:
+            encode(value, update)
+
+
+class PickleEncoder(Encoder):
+    """
+    Legacy encoder, which uses pickle to serialise the given data.
+    """
+    name = "pickle"
+
+    def encode(self, data, update):
+        update(pickle.dumps(data))
+
+
+class CanonicalEncoder(Encoder):
+    """
+    Encoder, which creates a stable binary representation for common python types.
+
+    Each value starts with a tag character. Values with a variable length contain their length as decimal number.
+    Dictionaries and sets are sorted, so that their order does not matter.
+    Objects of unknown types are serialised by pickle.
+
+    The representation of all values is collected as text and fed into the update function as UTF-8 by a single call.
+    Bytes are represented by their latin-1 decoded text, so that each byte is a single character.
+    """
+    name = "canonical"
+
+    def __init__(self):
+        self._writers = {
+            type(None): self._write_none,
+            bool: self._write_bool,
+            int: self._write_int,
+            float: self._write_float,
+            str: self._write_str,
+            bytes: self._write_bytes,
+            bytearray: self._write_bytes,
+            memoryview: self._write_bytes,
+            Decimal: self._write_decimal,
+            datetime.datetime: self._write_datetime,
+            datetime.date: self._write_date,
+            datetime.time: self._write_time,
+            datetime.timedelta: self._write_timedelta,
+            uuid.UUID: self._write_uuid,
+            tuple: self._write_tuple,
+            list: self._write_list,
+            dict: self._write_dict,
+            set: self._write_set,
+            frozenset: self._write_set,
+        }
+
+    def encode(self, data, update):
+        parts = []
+        self._write(data, parts.append)
+        update("".join(parts).encode("utf-8", "surrogatepass"))
+
+    def encode_values(self, values, update):
+        parts = []
+        self._write_values(values, parts.append)
+        update("".join(parts).encode("utf-8", "surrogatepass"))
+
+    def _write(self, data, write):
+        writer = self._writers.get(type(data), None)
+        if writer is None:
+            writer = self._find_writer(data)
+        writer(data, write)
+
+    def _write_values(self, values, write):
+        writers = self._writers
+        for value in values:
+            # Fast path for the most common column/attribute types
+            value_type = type(value)
+            if value_type is str:
+                write("s" + str(len(value)) + ":" + value)
+            elif value_type is int:
+                write("i" + str(value) + ";")
+            elif value is None:
+                write("N")
+            elif value_type is float:
+                write("f" + repr(value) + ";")
+            else:
+                writer = writers.get(value_type, None)
+                if writer is None:
+                    writer = self._find_writer(value)
+                writer(value, write)
+
+    def _find_writer(self, data):
+        # Subclasses of supported types (e.g. OrderedDict or named tuples)
+        for data_type in type(data).__mro__[1:]:
+            writer = self._writers.get(data_type, None)
+            if writer is not None:
+                return writer
+        return self._write_pickle
+
+    def _write_none(self, data, write):
+        write("N")
+
+    def _write_bool(self, data, write):
+        write("T" if data else "F")
+
+    def _write_int(self, data, write):
+        write("i" + str(int(data)) + ";")
+
+    def _write_float(self, data, write):
+        write("f" + repr(float(data)) + ";")
+
+    def _write_str(self, data, write):
+        write("s" + str(len(data)) + ":" + str.__str__(data))
+
+    def _write_bytes(self, data, write):
+        write("b%d:%s" % (len(data), bytes(data).decode("latin-1")))
+
+    def _write_decimal(self, data, write):
+        write("D%s;" % data)
+
+    def _write_datetime(self, data, write):
+        write("t%s;" % data.isoformat())
+
+    def _write_date(self, data, write):
+        write("a%s;" % data.isoformat())
+
+    def _write_time(self, data, write):
+        write("h%s;" % data.isoformat())
+
+    def _write_timedelta(self, data, write):
+        write("e%d;%d;%d;" % (data.days, data.seconds, data.microseconds))
+
+    def _write_uuid(self, data, write):
+        write("u%s;" % data.hex)
+
+    def _write_tuple(self, data, write):
+        write("(%d:" % len(data))
+        self._write_values(data, write)
+
+    def _write_list(self, data, write):
+        write("[%d:" % len(data))
+        self._write_values(data, write)
+
+    def _write_dict(self, data, write):
+        write("{%d:" % len(data))
+        try:
+            keys = sorted(data)
+        except TypeError:
+            # Keys of different types, which can not be compared. So we sort by their representation.
+            keys = sorted(data, key=self._representation)
+        for key in keys:
+            self._write(key, write)
+            self._write(data[key], write)
+
+    def _write_set(self, data, write):
+        write("<%d:" % len(data))
+        try:
+            items = sorted(data)
+        except TypeError:
+            items = sorted(data, key=self._representation)
+        self._write_values(items, write)
+
+    def _write_pickle(self, data, write):
+        self._write_bytes(pickle.dumps(data), write)
+
+    def _representation(self, data):
+        parts = []
+        self._write(data, parts.append)
+        return "".join(parts)
+
+
+_encoders = {
+    CanonicalEncoder.name: CanonicalEncoder(),
+    PickleEncoder.name: PickleEncoder(),
+}
+
+
+def get_encoder(encoder=None):
+    """
+    Returns an encoder instance.
+
+    :param encoder: Name of a registered encoder or an instance of :class:`Encoder`.
+                    If None, the canonical encoder is returned.
+    :return: Instance of :class:`Encoder`
+    """
+    if encoder is None:
+        encoder = CanonicalEncoder.name
+    if isinstance(encoder, Encoder):
+        return encoder
+    if encoder not in _encoders.keys():
+        raise KeyError("Encoder %s does not exist. Available encoders: %s" % (encoder, ", ".join(_encoders.keys())))
+    return _encoders[encoder]
+
+
+def register_encoder(encoder):
+    """
+    Registers an encoder instance, so that it can be selected by its name.
+
+    :param encoder: Instance of :class:`Encoder`
+    :return: None
+    """
+    if encoder.name in _encoders.keys():
+        raise KeyError("Encoder %s already registered" % encoder.name)
+    _encoders[encoder.name] = encoder
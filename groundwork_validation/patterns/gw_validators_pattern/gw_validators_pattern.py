@@ -1,8 +1,13 @@
-import hashlib
-import pickle
+import threading
+import time
+from operator import attrgetter
 
 from groundwork.patterns import GwBasePattern
-from groundwork.util import gw_get
+
+from groundwork_validation.patterns.gw_validators_pattern.algorithms import DEFAULT_ALGORITHM, get_algorithm, \
+    get_algorithm_name, find_algorithm_name, format_hash, split_hash
+from groundwork_validation.patterns.gw_validators_pattern.encoders import get_encoder
+from groundwork_validation.patterns.gw_validators_pattern.metrics import ValidationMetrics
 
 
 class GwValidatorsPattern(GwBasePattern):
@@ -16,7 +21,9 @@ class GwValidatorsPattern(GwBasePattern):
 
         self.validators = ValidatorsPlugin(self)
         if not hasattr(self.app, "validators"):
-            self.app.validators = ValidatorsApplication(self)
+            self.app.validators = ValidatorsApplication(self.app)
+            if self.app.validators.metrics is not None:
+                self.app.validators.metrics.register_signal(self)
 
 
 class ValidatorsPlugin:
@@ -28,32 +35,47 @@ class ValidatorsPlugin:
         self.plugin = plugin
         self.app = plugin.app
 
-    def register(self, name, description, algorithm=None, attributes=None):
+    def register(self, name, description, algorithm=None, attributes=None, encoder=None, extractor=None):
         """
         Registers a new validator on plugin level.
 
         :param name: Unique name of the validator
         :param description: Helpful description of the validator
-        :param algorithm: A hashlib compliant function. If None, hashlib.sha256 is taken.
+        :param algorithm: Name of a hash algorithm (e.g. "blake2b-128" or "fast", see
+                          :mod:`~groundwork_validation.patterns.gw_validators_pattern.algorithms`) or a hashlib
+                          compliant function. If None, VALIDATION_DEFAULT_ALGORITHM of the application configuration
+                          is used. If this is not set, sha256 is taken.
         :param attributes: List of attributes, for which the hash must be created. If None, all contained
                            attributes are used.
+        :param encoder: Name or instance of an encoder, which builds the hashed binary representation of the data.
+                        If None, VALIDATION_DEFAULT_ENCODER of the application configuration is used.
+                        Use "pickle" to validate hashes, which were created by groundwork-validation <= 0.1.5.
+        :param extractor: Function, which returns a tuple with the values of all configured attributes of given data.
+                          If None, an extractor based on operator.attrgetter is used.
         :return: Validator instance
         """
-        if algorithm is None:
-            algorithm = hashlib.sha256
-        return self.app.validators.register(name, description, self.plugin, algorithm=algorithm, attributes=attributes)
+        return self.app.validators.register(name, description, self.plugin, algorithm=algorithm, attributes=attributes,
+                                            encoder=encoder, extractor=extractor)
 
     def unregister(self, name):
         self.app.validators.unregister(name)
 
-    def get(self, name):
+    def get(self, name=None):
         """
         Returns a single or a list of validator instance, which were registered by the current plugin.
 
         :param name: Name of the validator. If None, all validators of the current plugin are returned.
-        :return: Single or list of Validator instances
+        :return: Single Validator instance or dictionary of Validator instances
+        """
+        return self.app.validators.get(name, self.plugin)
+
+    def get_metrics(self, name=None):
+        """
+        Returns collected metrics of validators.
+
+        See :func:`ValidatorsApplication.get_metrics`.
         """
-        self.app.validators.get(name, self.plugin)
+        return self.app.validators.get_metrics(name)
 
 
 class ValidatorsApplication:
@@ -62,78 +84,211 @@ class ValidatorsApplication:
     """
     def __init__(self, app):
         self.app = app
-        self._validators = {}
-
-    def register(self, name, description, plugin, algorithm=None, attributes=None):
+        self._validators = ValidatorRegistry()
+        self.default_encoder = self.app.config.get("VALIDATION_DEFAULT_ENCODER", None)
+        self.default_algorithm = self.app.config.get("VALIDATION_DEFAULT_ALGORITHM", DEFAULT_ALGORITHM)
+        # Fail early for not existing algorithms
+        get_algorithm(self.default_algorithm)
+
+        #: :class:`~groundwork_validation.patterns.gw_validators_pattern.metrics.ValidationMetrics` instance, if
+        #: VALIDATION_METRICS is True. Otherwise None.
+        self.metrics = None
+        if self.app.config.get("VALIDATION_METRICS", False):
+            self.metrics = ValidationMetrics(self.app)
+
+    def register(self, name, description, plugin, algorithm=None, attributes=None, encoder=None, extractor=None):
         """
         Registers a new validator on application level.
 
         :param name: Unique name of the validator
         :param description: Helpful description of the validator
-        :param algorithm: A hashlib compliant function. If None, hashlib.sha256 is taken.
+        :param algorithm: Name of a hash algorithm or a hashlib compliant function. If None,
+                          VALIDATION_DEFAULT_ALGORITHM of the application configuration is used.
+                          If this is not set, sha256 is taken.
         :param attributes: List of attributes, for which the hash must be created. If None, all contained
                            attributes are used.
         :param plugin: Plugin instance, for which the validator gets registered.
+        :param encoder: Name or instance of an encoder. If None, VALIDATION_DEFAULT_ENCODER of the application
+                        configuration is used. If this is not set, the canonical encoder is used.
+        :param extractor: Function, which returns a tuple with the values of all configured attributes of given data.
         :return: Validator instance
         """
-        if name in self._validators.keys():
+        if name in self._validators:
             raise KeyError("Validator %s already registered" % name)
 
         if algorithm is None:
-            algorithm = hashlib.sha256
-
-        self._validators[name] = Validator(name, description,
-                                           algorithm=algorithm,
-                                           attributes=attributes,
-                                           plugin=plugin)
-
-        return self._validators[name]
+            algorithm = self.default_algorithm
+
+        if encoder is None:
+            encoder = self.default_encoder
+
+        validator = Validator(name, description,
+                              algorithm=algorithm,
+                              attributes=attributes,
+                              plugin=plugin,
+                              encoder=encoder,
+                              extractor=extractor,
+                              metrics=self.metrics)
+        if not self._validators.add(name, validator):
+            raise KeyError("Validator %s already registered" % name)
+        return validator
 
     def unregister(self, name):
-        if name in self._validators.keys():
-            del(self._validators[name])
-        else:
+        if not self._validators.remove(name):
             raise KeyError("Validator %s does not exist" % name)
 
-    def get(self, name, plugin):
+    def get(self, name=None, plugin=None):
         """
         Returns a single or a list of validator instance
 
         :param name: Name of the validator. If None, all validators are returned.
         :param plugin: Plugin instance, which has registered the requested validator.
                        If None, all validators are returned.
-        :return: Single or list of Validator instances
+        :return: Single Validator instance or dictionary of Validator instances
+        """
+        return self._validators.get(name, plugin)
+
+    def get_metrics(self, name=None):
+        """
+        Returns collected metrics of all or a single validator.
+
+        :param name: Name of the validator. If None, metrics of all validators are returned.
+        :return: dictionary. Empty, if VALIDATION_METRICS is not activated.
+        """
+        if self.metrics is None:
+            return {}
+        return self.metrics.get(name)
+
+
+class ValidatorRegistry:
+    """
+    Thread-safe storage of validators, which are indexed by their name and by their plugin.
+
+    Changes are made under a lock. Lookups of single validators do not need a lock, because single dictionary
+    operations are atomic. Lists of validators are returned as copies, so that they do not change during their
+    usage.
+
+    get() works like groundwork.util.gw_get, but needs O(1) for single validators and O(k) for the k validators
+    of a plugin.
+    """
+    def __init__(self):
+        self._by_name = {}
+        self._by_plugin = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, validator):
+        """
+        Adds a validator. Its plugin is taken from validator.plugin.
+
+        :return: False, if a validator with the given name already exists. Otherwise True
+        """
+        with self._lock:
+            if name in self._by_name:
+                return False
+            self._by_name[name] = validator
+            self._by_plugin.setdefault(validator.plugin, {})[name] = validator
+        return True
+
+    def remove(self, name):
+        """
+        Removes a validator.
+
+        :return: False, if no validator with the given name exists. Otherwise True
+        """
+        with self._lock:
+            validator = self._by_name.pop(name, None)
+            if validator is None:
+                return False
+            plugin_validators = self._by_plugin.get(validator.plugin, {})
+            plugin_validators.pop(name, None)
+            if not plugin_validators:
+                self._by_plugin.pop(validator.plugin, None)
+        return True
+
+    def get(self, name=None, plugin=None):
+        """
+        Returns validators by name and/or plugin.
+
+        :param name: Name of the validator. If None, all validators (of the given plugin) are returned.
+        :param plugin: Plugin instance. If None, validators of all plugins are used.
+        :return: None, single validator or dictionary of validators
         """
-        gw_get(self._validators, name, plugin)
+        if name is not None:
+            validator = self._by_name.get(name, None)
+            if validator is None or (plugin is not None and validator.plugin != plugin):
+                return None
+            return validator
+
+        with self._lock:
+            if plugin is None:
+                return dict(self._by_name)
+            return dict(self._by_plugin.get(plugin, {}))
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __len__(self):
+        return len(self._by_name)
 
 
 class Validator:
     """
     Represent the final validator, which provides functions to hash a given python object and to validate a
     python object against a given hash.
+
+    Hashes of all algorithms except sha256 get the name of the algorithm as prefix (e.g. "blake2b-128:<hex>").
+    So a hash can be validated, even if the validator is configured to use another algorithm meanwhile.
     """
-    def __init__(self, name, description, algorithm=None, attributes=None, plugin=None):
+    def __init__(self, name, description, algorithm=None, attributes=None, plugin=None, encoder=None,
+                 extractor=None, metrics=None):
         self.name = name
         self.description = description
         self.plugin = plugin
         if algorithm is None:
-            algorithm = hashlib.sha256
-        self.algorithm = algorithm
+            algorithm = DEFAULT_ALGORITHM
+        if isinstance(algorithm, str):
+            #: Name of the algorithm. None for hashlib compliant functions, which are not registered.
+            self.algorithm_name = get_algorithm_name(algorithm)
+            self.algorithm = get_algorithm(self.algorithm_name)
+        else:
+            self.algorithm_name = find_algorithm_name(algorithm)
+            self.algorithm = algorithm
         self.attributes = attributes
+        self.encoder = get_encoder(encoder)
+
+        # The extractor gets compiled once, so that hash() does not need to loop over the attributes.
+        if extractor is None and attributes is not None:
+            extractor = _compile_extractor(attributes)
+        self._extractor = extractor
+
+        # ValidationMetrics instance or None, if no metrics shall be collected
+        self.metrics = metrics
+
+        # Validators for other algorithms, which are needed to validate hashes of these algorithms
+        self._variants = {}
 
     def validate(self, data, hash_string, no_pickle=False):
         """
         Validates a python object against a given hash
 
         :param data: Python object
-        :param hash_string: hash as string, which must be compliant to the configured hash algorithm of
-                            the used validator.
+        :param hash_string: hash as string. Hashes without algorithm prefix are validated by sha256 (or by the
+                            configured hashlib compliant function, if it is not a registered algorithm).
         :param no_pickle: If True data is not pickled before hash is calculated.
                           Helpful, if data is already serialised (like file inputs)
-        :return: True, if object got validated by hash. Else False
+        :return: True, if object got validated by hash. Else False, also if the algorithm of the hash is not
+                 available (e.g. xxh64 without the package xxhash).
         """
-        if self.hash(data, no_pickle=no_pickle) == hash_string:
+        name, hexdigest = split_hash(hash_string)
+        try:
+            validator = self.for_algorithm(name)
+        except KeyError:
+            validator = None
+        if validator is not None and \
+                validator.hash(data, return_hash_object=True, no_pickle=no_pickle).hexdigest() == hexdigest:
             return True
+        if self.metrics is not None:
+            self.metrics.increment(self.name, "failed_validations")
         return False
 
     def hash(self, data, hash_object=None, return_hash_object=False, strict=False, no_pickle=False):
@@ -146,29 +301,46 @@ class Validator:
         :param hash_object: An existing  hash object, which will be updated. Instead of creating a new one.
         :param strict: If True, all configured attributes **must** exist in the given data, otherwise an exception
                        is thrown.
-        :param no_pickle: If True data is not pickled before hash is calculated.
+        :param no_pickle: If True data is not encoded before hash is calculated.
                           Helpful, if data is already serialised (like file inputs)
-        :return: hash as string
+        :return: hash as string, which contains the name of the algorithm (except for sha256)
         """
         if hash_object is None:
             current_hash = self.get_hash_object()
         else:
             current_hash = hash_object
 
-        if self.attributes is None:
-            if not no_pickle:
-                current_hash.update(pickle.dumps(data))
-            else:
-                current_hash.update(data)
+        if self.metrics is None:
+            self._feed(data, current_hash.update, strict, no_pickle)
         else:
-            for attribute in self.attributes:
-                if strict and hasattr(data, attribute) is False:
-                    raise AttributeError("Data has no attribute called %s" % attribute)
-                current_hash.update(pickle.dumps(getattr(data, attribute, None)))
+            self._feed_measured(lambda update: self._feed(data, update, strict, no_pickle), current_hash)
 
         if return_hash_object:
             return current_hash
-        return current_hash.hexdigest()
+        return format_hash(self.algorithm_name, current_hash.hexdigest())
+
+    def hash_values(self, values, hash_object=None, return_hash_object=False):
+        """
+        Generates a hash of already extracted attribute values.
+
+        The result is the same as for :func:`hash`, if values contains the values of all configured attributes
+        in the configured order. Helpful, if the data is not available as object (e.g. rows of a database query).
+
+        :param values: List or tuple of attribute values
+        :param hash_object: An existing  hash object, which will be updated. Instead of creating a new one.
+        :param return_hash_object: If true, the complete hashlib object is returned
+                                   instead of a hexdigest representation as string.
+        :return: hash as string, which contains the name of the algorithm (except for sha256)
+        """
+        if hash_object is None:
+            hash_object = self.get_hash_object()
+        if self.metrics is None:
+            self.encoder.encode_values(values, hash_object.update)
+        else:
+            self._feed_measured(lambda update: self.encoder.encode_values(values, update), hash_object)
+        if return_hash_object:
+            return hash_object
+        return format_hash(self.algorithm_name, hash_object.hexdigest())
 
     def get_hash_object(self):
         """
@@ -177,3 +349,113 @@ class Validator:
         :return: An unused hash object
         """
         return self.algorithm()
+
+    def get_algorithm_name(self):
+        """
+        Returns the name of the used algorithm. For not registered hashlib compliant functions the name of their
+        hash objects is returned.
+        """
+        if self.algorithm_name is not None:
+            return self.algorithm_name
+        return self.get_hash_object().name
+
+    def format_hash(self, hexdigest):
+        """
+        Returns the hash string for a hexdigest of the used algorithm.
+
+        :param hexdigest: hexdigest of a hash object, which was created by :func:`get_hash_object`
+        :return: hash as string, which contains the name of the algorithm (except for sha256)
+        """
+        return format_hash(self.algorithm_name, hexdigest)
+
+    def for_algorithm(self, name):
+        """
+        Returns a validator with the same configuration, which uses the given algorithm.
+
+        :param name: Name of an algorithm. None selects the algorithm of hashes without prefix.
+        :return: Validator instance. The current one, if it already uses the given algorithm.
+        """
+        if name is None:
+            if self.algorithm_name is None or self.algorithm_name == DEFAULT_ALGORITHM:
+                return self
+            name = DEFAULT_ALGORITHM
+        elif name == self.algorithm_name:
+            return self
+
+        validator = self._variants.get(name, None)
+        if validator is None:
+            validator = Validator(self.name, self.description, algorithm=name, attributes=self.attributes,
+                                  plugin=self.plugin, encoder=self.encoder, extractor=self._extractor,
+                                  metrics=self.metrics)
+            self._variants[name] = validator
+        return validator
+
+    def for_hash(self, hash_string):
+        """
+        Returns a validator with the same configuration, which uses the algorithm of the given hash.
+
+        :param hash_string: hash as string
+        :return: Validator instance
+        """
+        return self.for_algorithm(split_hash(hash_string)[0])
+
+    def _feed(self, data, update, strict, no_pickle):
+        if self.attributes is None:
+            if not no_pickle:
+                self.encoder.encode(data, update)
+            else:
+                update(data)
+        else:
+            if strict:
+                for attribute in self.attributes:
+                    if hasattr(data, attribute) is False:
+                        raise AttributeError("Data has no attribute called %s" % attribute)
+            self.encoder.encode_values(self._extractor(data), update)
+
+    def _feed_measured(self, feed, hash_object):
+        """
+        Encodes the data by the given feed function and updates the hash object afterwards, so that the needed
+        time for encoding and for hashing can be measured separately.
+        """
+        chunks = []
+        start = time.perf_counter()
+        feed(chunks.append)
+        encoded = time.perf_counter()
+        size = 0
+        for chunk in chunks:
+            hash_object.update(chunk)
+            size += len(chunk)
+        end = time.perf_counter()
+
+        self.metrics.increment(self.name, "hash_calls")
+        self.metrics.increment(self.name, "bytes_hashed", size)
+        self.metrics.observe(self.name, "encode_seconds", encoded - start)
+        self.metrics.observe(self.name, "hash_seconds", end - encoded)
+
+
+def _compile_extractor(attributes):
+    """
+    Creates a function, which returns the values of the given attributes as tuple.
+    Not existing attributes get the value None.
+
+    :param attributes: List of attribute names
+    :return: function
+    """
+    attributes = tuple(attributes)
+    if len(attributes) == 0:
+        return lambda data: ()
+
+    getter = attrgetter(*attributes)
+    if len(attributes) == 1:
+        single_getter = getter
+
+        def getter(data):
+            return (single_getter(data),)
+
+    def extract(data):
+        try:
+            return getter(data)
+        except AttributeError:
+            # At least one attribute is missing. Missing attributes are hashed as None.
+            return tuple([getattr(data, attribute, None) for attribute in attributes])
+    return extract
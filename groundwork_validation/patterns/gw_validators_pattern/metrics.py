@@ -0,0 +1,160 @@
+"""
+Collection of counters and latency histograms for validators.
+
+Metrics are only collected, if the application configuration **VALIDATION_METRICS** is True.
+Otherwise no :class:`ValidationMetrics` instance gets created and all validators skip the collection by a single
+check against None.
+"""
+import math
+import threading
+
+#: Name of the groundwork signal, which is sent by :func:`ValidationMetrics.report`
+METRICS_SIGNAL = "validation_metrics"
+
+#: Upper bound of the first histogram bucket in seconds. Each following bucket doubles the upper bound.
+HISTOGRAM_BASE = 0.000001
+
+#: Number of histogram buckets. The last bucket contains all values, which are bigger than the previous ones.
+HISTOGRAM_BUCKETS = 32
+
+
+class ValidationMetrics:
+    """
+    Thread-safe storage of counters and histograms per validator name.
+
+    Usage::
+
+        metrics = self.app.validators.metrics
+        if metrics is not None:
+            print(metrics.get("my_validator")["counters"]["hash_calls"])
+    """
+    def __init__(self, app=None):
+        self.app = app
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._signal_registered = False
+
+    def increment(self, name, counter, value=1):
+        """
+        Increases a counter.
+
+        :param name: Name of the validator
+        :param counter: Name of the counter
+        :param value: Value, which gets added. Default is 1
+        """
+        with self._lock:
+            counters = self._get_entry(name)[0]
+            counters[counter] = counters.get(counter, 0) + value
+
+    def observe(self, name, histogram, seconds):
+        """
+        Adds a measured duration to a histogram.
+
+        :param name: Name of the validator
+        :param histogram: Name of the histogram
+        :param seconds: Measured duration in seconds
+        """
+        with self._lock:
+            histograms = self._get_entry(name)[1]
+            values = histograms.get(histogram, None)
+            if values is None:
+                values = histograms[histogram] = _Histogram()
+            values.add(seconds)
+
+    def get(self, name=None):
+        """
+        Returns a copy of the collected metrics.
+
+        Each validator has a dictionary with the keys "counters" and "histograms".
+        Each histogram is a dictionary with the keys "count", "sum", "min", "max" and "buckets".
+        "buckets" is a list of (upper bound in seconds, count) tuples for all not empty buckets.
+        The upper bound of the last bucket is infinity.
+
+        :param name: Name of the validator. If None, metrics of all validators are returned.
+        :return: dictionary. Empty, if nothing was collected for the given validator.
+        """
+        with self._lock:
+            if name is not None:
+                entry = self._metrics.get(name, None)
+                return _export(entry) if entry is not None else {}
+            return dict((key, _export(entry)) for key, entry in self._metrics.items())
+
+    def reset(self):
+        """
+        Deletes all collected metrics.
+        """
+        with self._lock:
+            self._metrics.clear()
+
+    def register_signal(self, plugin):
+        """
+        Registers the signal :data:`METRICS_SIGNAL` for the given plugin, if it is not registered yet.
+        """
+        if not self._signal_registered and self.app is not None:
+            self.app.signals.register(METRICS_SIGNAL, plugin, "Sends collected metrics of all validators")
+            self._signal_registered = True
+            self._signal_plugin = plugin
+
+    def report(self):
+        """
+        Sends the signal :data:`METRICS_SIGNAL` with the current metrics of all validators as argument "metrics".
+
+        :return: Current metrics of all validators
+        """
+        metrics = self.get()
+        if self._signal_registered:
+            self.app.signals.send(METRICS_SIGNAL, self._signal_plugin, metrics=metrics)
+        return metrics
+
+    def _get_entry(self, name):
+        entry = self._metrics.get(name, None)
+        if entry is None:
+            entry = self._metrics[name] = ({}, {})
+        return entry
+
+
+class _Histogram:
+    """
+    Histogram with logarithmic buckets.
+    """
+    __slots__ = ("count", "sum", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.buckets[_get_bucket(value)] += 1
+
+    def export(self):
+        buckets = []
+        for index, count in enumerate(self.buckets):
+            if count:
+                upper_bound = HISTOGRAM_BASE * 2 ** index if index < HISTOGRAM_BUCKETS - 1 else float("inf")
+                buckets.append((upper_bound, count))
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max, "buckets": buckets}
+
+
+def _get_bucket(value):
+    if value <= HISTOGRAM_BASE:
+        return 0
+    # frexp returns the exponent e with value = m * 2 ** e and 0.5 <= m < 1
+    mantissa, exponent = math.frexp(value / HISTOGRAM_BASE)
+    if mantissa == 0.5:
+        exponent -= 1
+    return min(exponent, HISTOGRAM_BUCKETS - 1)
+
+
+def _export(entry):
+    counters, histograms = entry
+    return {"counters": dict(counters),
+            "histograms": dict((key, histogram.export()) for key, histogram in histograms.items())}
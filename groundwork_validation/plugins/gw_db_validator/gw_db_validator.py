@@ -1,9 +1,18 @@
+import os
+
+import click
+from click import Option
+from groundwork.patterns import GwCommandsPattern
+
 from groundwork_validation.patterns import GwDbValidatorsPattern
 
 
-class GwDbValidator(GwDbValidatorsPattern):
+class GwDbValidator(GwDbValidatorsPattern, GwCommandsPattern):
     """
     Automatically adds and activate validation to eahc database model.
+
+    Provides the command ``validation_backfill``, which creates hashes for rows, which existed before the
+    validation was activated.
     """
 
     def __init__(self, app, **kwargs):
@@ -28,6 +37,19 @@ class GwDbValidator(GwDbValidatorsPattern):
                              function=self._receiver_db_validation,
                              description="Setups the validations checks for newly registered database classes")
 
+        self.commands.register("validation_backfill",
+                               "Creates missing hashes for already existing rows of validated database models",
+                               self._backfill_command,
+                               params=[Option(("--validator", "-v"), default=None,
+                                              help="Name of the database validator. Default: all"),
+                                       Option(("--batch-size", "-b"), type=int, default=1000,
+                                              help="Number of rows, which are hashed and written together"),
+                                       Option(("--workers", "-w"), type=int, default=None,
+                                              help="Number of processes, which hash the rows"),
+                                       Option(("--checkpoint-dir", "-c"), default=None,
+                                              help="Folder for checkpoint files, which allow to resume an "
+                                                   "interrupted backfill")])
+
     def deactivate(self):
         """
         Currently nothing happens here *sigh*
@@ -54,6 +76,34 @@ class GwDbValidator(GwDbValidatorsPattern):
 
         self._register_db_model(database, db_class)
 
+    def _backfill_command(self, validator=None, batch_size=1000, workers=None, checkpoint_dir=None):
+        """
+        Executes
+        :func:`~groundwork_validation.patterns.gw_db_validators_pattern.gw_db_validators_pattern.DbValidator.backfill`
+        for one or all database validators of this plugin.
+        """
+        if validator is None:
+            db_validators = self.validators.db.get()
+        else:
+            db_validator = self.validators.db.get(validator)
+            if db_validator is None:
+                click.echo("Database validator %s does not exist" % validator, err=True)
+                return
+            db_validators = {validator: db_validator}
+
+        for name in sorted(db_validators.keys()):
+            checkpoint = None
+            if checkpoint_dir is not None:
+                checkpoint = os.path.join(checkpoint_dir, "%s.backfill.json" % name)
+
+            def progress(state):
+                click.echo("%s: %s rows read, %s hashes added" % (name, state.rows, state.inserted))
+
+            result = db_validators[name].backfill(batch_size=batch_size, checkpoint=checkpoint, progress=progress,
+                                                  workers=workers)
+            click.echo("%s: finished. %s hashes added, %s rows already had a hash"
+                       % (name, result.inserted, result.skipped))
+
     def _register_db_model(self, database, db_class):
         """
         Registers a new database validator for the given db model.
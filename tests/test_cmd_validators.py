@@ -1,9 +1,14 @@
+import asyncio
 import os
+import re
+import subprocess
+import sys
+import time
 import pytest
 import groundwork
 from groundwork_validation.patterns import GwCmdValidatorsPattern
 from groundwork_validation.patterns.gw_cmd_validators_pattern.gw_cmd_validators_pattern \
-    import NotAllowedReturnCode, CommandTimeoutExpired
+    import NotAllowedReturnCode, CommandTimeoutExpired, CommandResult
 
 
 def test_cmd_validator_init():
@@ -194,6 +199,287 @@ def test_cmd_validator_timeout():
         plugin.validators.cmd.validate(_sleep(1), search="", timeout=0.5)
 
 
+def test_cmd_validator_validate_all():
+    """
+    .. test:: GwCmdValidators concurrent validation test
+       :tags: gwcmdvalidators
+    """
+    class My_Plugin(GwCmdValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    start = time.time()
+    results = plugin.validators.cmd.validate_all([
+        {"command": _sleep(1) + " && echo first", "search": "first"},
+        {"command": _sleep(1) + " && echo second", "regex": "sec.nd"},
+        {"command": _sleep(1) + " && echo third", "search": "NO_KNOWN_OUTPUT"},
+        {"command": "exit 2", "search": "", "allowed_return_codes": [0]},
+        {"command": _sleep(3), "search": "", "timeout": 1},
+    ], concurrency=5, return_exceptions=True)
+    assert time.time() - start < 2.5
+    assert results[:3] == [True, True, False]
+    assert isinstance(results[3], NotAllowedReturnCode)
+    assert isinstance(results[4], CommandTimeoutExpired)
+
+    with pytest.raises(CommandTimeoutExpired):
+        plugin.validators.cmd.validate_all([{"command": _sleep(3), "search": "", "timeout": 0.5}])
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(plugin.validators.cmd.validate_async("echo async", search="async")) is True
+
+        # The current event loop of the thread is restored after the validation
+        asyncio.set_event_loop(loop)
+        assert plugin.validators.cmd.validate_all([{"command": "echo async", "search": "async"}]) == [True]
+        assert asyncio.get_event_loop() is loop
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_cmd_validator_stream():
+    """
+    .. test:: GwCmdValidators streaming test
+       :tags: gwcmdvalidators
+    """
+    class My_Plugin(GwCmdValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    # Marker is split between two read blocks
+    command = "%s -c \"import sys; sys.stdout.write('a' * 65533 + 'MARKER' + 'b' * 100000)\"" % sys.executable
+    assert plugin.validators.cmd.validate(command, search="MARKER", stream=True) is True
+    assert plugin.validators.cmd.validate(command, regex="a{3}MAR?KER", stream=True) is True
+    assert plugin.validators.cmd.validate(command, search="NO_KNOWN_OUTPUT", stream=True) is False
+    assert plugin.validators.cmd.validate("exit 2", search="", stream=True, allowed_return_codes=[2]) is True
+    with pytest.raises(NotAllowedReturnCode):
+        plugin.validators.cmd.validate("exit 2", search="", stream=True, allowed_return_codes=[0])
+
+    start = time.time()
+    assert plugin.validators.cmd.validate("echo READY && " + _sleep(5), search="READY", stop_on_match=True,
+                                          timeout=10) is True
+    assert time.time() - start < 4
+
+    with pytest.raises(CommandTimeoutExpired):
+        plugin.validators.cmd.validate("echo READY && " + _sleep(5), search="NOT_READY", stop_on_match=True,
+                                       timeout=0.5)
+
+    with pytest.raises(ValueError):
+        plugin.validators.cmd.validate("dir", search="test", stop_on_match=True, allowed_return_codes=[0])
+
+
+def test_cmd_validator_match():
+    """
+    .. test:: GwCmdValidators multiple expectations test
+       :tags: gwcmdvalidators
+    """
+    class My_Plugin(GwCmdValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    command = "echo tool version 1.2.3"
+    results = plugin.validators.cmd.match(command, search=["tool", "NO_KNOWN_OUTPUT"],
+                                          regex=["version [0-9]+", re.compile("(\\d)\\.\\1")])
+    assert list(results.values()) == [True, False, True, False]
+    assert results["tool"] is True
+    assert results["version [0-9]+"] is True
+
+    assert plugin.validators.cmd.validate(command, search=["tool", "version"]) is True
+    assert plugin.validators.cmd.validate(command, search=["tool", "NO_KNOWN_OUTPUT"]) is False
+    assert plugin.validators.cmd.validate(command, regex=["[0-9][.][0-9]", "^tool"]) is True
+    assert plugin.validators.cmd.validate(command, regex=["[0-9][.][0-9]", "^version"]) is False
+    assert plugin.validators.cmd.match(command, search=["tool", "1.2"], stream=True) == {"tool": True, "1.2": True}
+
+
+def test_cmd_validator_cache(tmpdir):
+    """
+    .. test:: GwCmdValidators result cache test
+       :tags: gwcmdvalidators
+    """
+    class My_Plugin(GwCmdValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    class My_Plugin_2(My_Plugin):
+        def __init__(self, app, **kwargs):
+            super(My_Plugin_2, self).__init__(app, **kwargs)
+            self.name = "My_Plugin_2"
+
+    counter = tmpdir.join("counter.txt").strpath
+    # Each execution adds a line to the counter file and prints the number of executions
+    command = "echo x >> %s && wc -l < %s" % (counter, counter)
+
+    app = groundwork.App()
+    app.config.set("VALIDATION_CMD_CACHE_TTL", 60)
+    plugin = My_Plugin(app)
+    plugin_2 = My_Plugin_2(app)
+
+    assert plugin.validators.cmd.validate(command, regex="^ *1$") is True
+    assert plugin.validators.cmd.validate(command, regex="^ *1$") is True
+    assert plugin_2.validators.cmd.validate(command, regex="^ *1$") is True
+    assert plugin.validators.cmd.validate(command, regex="^ *2$", cache_ttl=0) is True
+    assert len(app.validators.cmd.cache) == 1
+
+    time.sleep(0.2)
+    assert plugin.validators.cmd.validate(command, regex="^ *1$", cache_ttl=60) is True
+    assert plugin.validators.cmd.validate(command, regex="^ *3$", cache_ttl=0.1) is True
+    assert plugin.validators.cmd.validate(command, regex="^ *3$") is True
+
+    # Cached return codes are checked again
+    assert plugin.validators.cmd.validate("exit 2", search="", allowed_return_codes=[2]) is True
+    with pytest.raises(NotAllowedReturnCode):
+        plugin.validators.cmd.validate("exit 2", search="", allowed_return_codes=[0])
+
+    # Timeouts are not cached
+    with pytest.raises(CommandTimeoutExpired):
+        plugin.validators.cmd.validate(_sleep(2), search="", timeout=0.5)
+    assert len(app.validators.cmd.cache) == 2
+
+
+def test_cmd_validator_argument_list(tmpdir, monkeypatch):
+    """
+    .. test:: GwCmdValidators argument list test
+       :tags: gwcmdvalidators
+    """
+    class My_Plugin(GwCmdValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    command = [sys.executable, "-c", "import os; print(os.getcwd(), os.environ.get('MY_VAR'))"]
+    assert plugin.validators.cmd.validate(command, search="%s my_value" % tmpdir.strpath, cwd=tmpdir.strpath,
+                                          env={"MY_VAR": "my_value"}) is True
+    assert plugin.validators.cmd.validate(command, search="None") is True
+    assert plugin.validators.cmd.validate(command, search="None", stream=True) is True
+    assert plugin.validators.cmd.validate("echo $MY_VAR", search="my_value", env={"MY_VAR": "my_value"}) is True
+    assert plugin.validators.cmd.validate_all([{"command": ["echo", "async"], "search": "async"}]) == [True]
+
+    with pytest.raises(NotAllowedReturnCode):
+        plugin.validators.cmd.validate(["UNKNOWN_COMMAND"], search="test", allowed_return_codes=[0])
+    assert plugin.validators.cmd.validate(["UNKNOWN_COMMAND"], search="", allowed_return_codes=[127]) is True
+
+    with pytest.raises(CommandTimeoutExpired):
+        plugin.validators.cmd.validate(_sleep(2).split(), search="", timeout=0.5)
+
+    if os.name == "posix":
+        # Child processes, which keep the output pipe open, get killed together with the command
+        for arguments in ({"stream": True}, {"max_duration": 5}):
+            start = time.time()
+            with pytest.raises(CommandTimeoutExpired):
+                plugin.validators.cmd.validate(["sh", "-c", "sleep 3 & sleep 3"], search="x", timeout=0.5,
+                                               **arguments)
+            assert time.time() - start < 2
+
+    if getattr(subprocess, "_USE_POSIX_SPAWN", False):
+        spawned = []
+        posix_spawn = os.posix_spawn
+
+        def count_posix_spawn(*args, **kwargs):
+            spawned.append(args[0])
+            return posix_spawn(*args, **kwargs)
+
+        monkeypatch.setattr(os, "posix_spawn", count_posix_spawn)
+        assert plugin.validators.cmd.validate(["echo", "spawned"], search="spawned") is True
+        assert len(spawned) == 1
+
+
+def test_cmd_validator_resource_usage():
+    """
+    .. test:: GwCmdValidators resource usage test
+       :tags: gwcmdvalidators
+    """
+    class My_Plugin(GwCmdValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    # Allocates ~50 MB and burns some CPU time
+    command = [sys.executable, "-c", "data = bytearray(50 * 1024 * 1024); sum(range(3000000)); print('done')"]
+    result = plugin.validators.cmd.validate(command, search="done", return_result=True)
+    assert isinstance(result, CommandResult)
+    assert result.valid is True
+    assert result.found is True
+    assert result.return_code == 0
+    assert result.exceeded == []
+    assert result.duration > 0
+    if hasattr(os, "wait4"):
+        assert result.user_time + result.system_time > 0
+        assert result.max_rss > 50 * 1024 * 1024
+
+        assert plugin.validators.cmd.validate(command, search="done", max_rss=10 * 1024 * 1024) is False
+        assert plugin.validators.cmd.validate(command, search="done", max_rss=1024 * 1024 * 1024) is True
+        assert plugin.validators.cmd.validate(command, search="done", max_cpu=0.000001) is False
+
+    result = plugin.validators.cmd.validate(_sleep(1), search="", max_duration=0.5, return_result=True)
+    assert result.valid is False
+    assert result.found is True
+    assert result.exceeded == ["max_duration"]
+    assert plugin.validators.cmd.validate(_sleep(1), search="", max_duration=5) is True
+
+    result = plugin.validators.cmd.validate("exit 3", search="", allowed_return_codes=[3], return_result=True)
+    assert result.return_code == 3
+
+
 def _sleep(seconds):
     """
     Helper functions, which generates a sleep like command depending on which operating system
@@ -1,9 +1,12 @@
 import pytest
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, event
+from sqlalchemy.dialects import mssql, mysql, oracle
+from sqlalchemy.schema import CreateTable
 
 import groundwork
 from groundwork_validation.patterns import GwDbValidatorsPattern
-from groundwork_validation.patterns.gw_db_validators_pattern.gw_db_validators_pattern import ValidationError
+from groundwork_validation.patterns.gw_db_validators_pattern.gw_db_validators_pattern import ValidationError, \
+    CompactHashStore
 
 
 def test_db_validator_init():
@@ -66,3 +69,790 @@ def test_db_validator_init():
     app = groundwork.App()
     plugin = My_Plugin(app)
     plugin.activate()
+
+
+def test_db_validator_batched_hash_requests():
+    """
+        .. test:: GbDbValidation batched hash requests
+           :tags: gwdbvalidator_pattern;
+
+           Tests that all rows of a query result are validated by a single request on the hash database.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    # Disable the hash cache, so that each validation needs to request the hash database
+    app.config.set("HASH_DB_CACHE_SIZE", 0)
+    app.config.set("VALIDATION_METRICS", True)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    plugin.validators.db.register("db_test_validator", "my db test validator", plugin.Test)
+
+    entries = [plugin.Test(name="entry_%s" % index) for index in range(20)]
+    plugin.db.session.add_all(entries)
+    plugin.db.commit()
+
+    hash_queries = []
+    hash_db = app.databases.get("hash_db")
+    event.listen(hash_db.engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: hash_queries.append(statement))
+
+    assert app.validators.get_metrics("db_test_validator.test")["counters"]["hashes_inserted"] == 20
+
+    # All entries got expired by commit, so the query refreshes all of them
+    app.validators.metrics.reset()
+    assert len(plugin.db.query(plugin.Test).all()) == 20
+    assert len(hash_queries) == 1
+
+    # Hash database metrics are collected for the validator as well
+    for name in ["hash_db", "db_test_validator.test"]:
+        counters = app.validators.get_metrics(name)["counters"]
+        assert (counters["read_queries"], counters["hashes_read"]) == (1, 20)
+
+    # Data gets manipulated without triggering the sqlalchemy events. So no hash gets updated.
+    plugin.db.engine.execute("UPDATE test SET name='not_working' WHERE id=5")
+    plugin.db.session.expire_all()
+    with pytest.raises(ValidationError):
+        plugin.db.query(plugin.Test).all()
+
+    # Hashes of algorithms, which are not available on this host, can not be validated
+    hash_model = app.validators.db.Hashes
+    hash_db.query(hash_model).filter(hash_model.hash_id == "db_test_validator.test.6").update({"hash": "unknown:00"})
+    hash_db.commit()
+    plugin.db.session.expire_all()
+    with pytest.raises(ValidationError, match="algorithm unknown"):
+        plugin.db.query(plugin.Test).filter_by(id=6).all()
+
+
+def test_db_validator_bulk_hash_writes():
+    """
+        .. test:: GbDbValidation bulk hash writes
+           :tags: gwdbvalidator_pattern;
+
+           Tests that the hashes of a flush are written together and only get committed with the outer transaction.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+    plugin.validators.db.register("db_test_validator", "my db test validator", plugin.Test)
+
+    hash_db = app.databases.get("hash_db")
+    hash_model = hash_db.classes.get("Hashes")
+    hash_statements = []
+    event.listen(hash_db.engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: hash_statements.append(statement))
+
+    entries = [plugin.Test(name="entry_%s" % index) for index in range(50)]
+    plugin.db.session.add_all(entries)
+    plugin.db.commit()
+
+    # One request for already existing hashes and one bulk insert
+    assert len(hash_statements) == 2
+    assert hash_model.query.count() == 50
+
+    # Hashes of a rolled back transaction must not be stored
+    plugin.db.add(plugin.Test(name="rolled_back"))
+    plugin.db.session.flush()
+    plugin.db.rollback()
+    assert hash_model.query.count() == 50
+
+    plugin.db.session.refresh(entries[0])
+    entries[0].name = "changed"
+    plugin.db.commit()
+    plugin.db.session.refresh(entries[0])
+    assert hash_model.query.count() == 50
+
+
+def test_db_validator_hash_cache():
+    """
+        .. test:: GbDbValidation hash cache
+           :tags: gwdbvalidator_pattern;
+
+           Tests that written hashes are cached and validations of cached rows do not request the hash database.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("HASH_DB_CACHE_SIZE", 15)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    plugin.validators.db.register("db_test_validator", "my db test validator", plugin.Test)
+    hash_cache = app.validators.db.hash_cache
+
+    entries = [plugin.Test(name="entry_%s" % index) for index in range(20)]
+    plugin.db.session.add_all(entries)
+    plugin.db.commit()
+    assert len(hash_cache) == 15
+
+    hash_queries = []
+    hash_db = app.databases.get("hash_db")
+    event.listen(hash_db.engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: hash_queries.append(statement))
+
+    # The 15 most recently written hashes are cached, only the other 5 must be requested
+    hash_cache.hits = hash_cache.misses = 0
+    plugin.db.query(plugin.Test).all()
+    assert len(hash_queries) == 1
+    assert hash_cache.hits == 15
+    assert hash_cache.misses == 5
+
+    # Manipulations are still detected, as the cache contains the hash written by ourself
+    plugin.db.engine.execute("UPDATE test SET name='not_working' WHERE id=20")
+    plugin.db.session.expire_all()
+    with pytest.raises(ValidationError):
+        plugin.db.query(plugin.Test).all()
+    plugin.db.rollback()
+
+    # Hashes of not committed transactions do not get cached
+    plugin.db.session.refresh(entries[0])
+    committed_hash = hash_cache.get("db_test_validator.test.1")
+    entries[0].name = "rolled_back"
+    plugin.db.session.flush()
+    assert hash_cache.get("db_test_validator.test.1") == committed_hash
+    plugin.db.rollback()
+    assert hash_cache.get("db_test_validator.test.1") == committed_hash
+    plugin.db.session.refresh(entries[0])
+
+    app_2 = groundwork.App()
+    app_2.config.set("HASH_DB_CACHE_SIZE", 0)
+    My_Plugin(app_2)
+    assert app_2.validators.db.hash_cache is None
+
+
+def test_db_validator_backfill(tmpdir, monkeypatch):
+    """
+        .. test:: GbDbValidation backfill
+           :tags: gwdbvalidator_pattern;
+
+           Tests the creation of hashes for already existing rows, the resumption of an interrupted backfill and
+           the hashing by worker processes.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    # Rows, which exist before the validation gets activated
+    for index in range(25):
+        plugin.db.engine.execute("INSERT INTO test (id, name) VALUES (%s, 'entry_%s')" % (index + 1, index))
+    db_validator = plugin.validators.db.register("db_test_validator", "my db test validator", plugin.Test)
+    hash_model = app.validators.db.Hashes
+
+    # Simulates an interrupted backfill, which has handled the first batch only
+    class Interrupt(Exception):
+        pass
+
+    def interrupt(state):
+        raise Interrupt()
+
+    checkpoint = tmpdir.join("backfill.json").strpath
+    with pytest.raises(Interrupt):
+        db_validator.backfill(batch_size=10, checkpoint=checkpoint, progress=interrupt)
+    assert hash_model.query.count() == 10
+    assert tmpdir.join("backfill.json").check()
+
+    states = []
+    result = db_validator.backfill(batch_size=10, checkpoint=checkpoint, progress=states.append)
+    assert [state.rows for state in states] == [10, 15]
+    assert result.rows == 15
+    assert result.inserted == 15
+    assert result.last_key == (25,)
+    assert not tmpdir.join("backfill.json").check()
+    assert hash_model.query.count() == 25
+    entries = plugin.db.query(plugin.Test).all()
+    assert len(entries) == 25
+
+    # Existing hashes are not overwritten, so manipulations stay detectable
+    plugin.db.engine.execute("UPDATE test SET name='not_working' WHERE id=3")
+    result = db_validator.backfill(batch_size=10, start_after=1, workers=2)
+    assert (result.rows, result.inserted, result.updated, result.skipped) == (24, 0, 0, 24)
+    plugin.db.session.expire_all()
+    with pytest.raises(ValidationError):
+        plugin.db.query(plugin.Test).all()
+
+    # Batches are committed by an own session, so that other hashes of the hash database session stay uncommitted
+    def shared_commit():
+        raise AssertionError("Session of the hash database must not be committed")
+
+    monkeypatch.setattr(db_validator.hash_store.db, "commit", shared_commit)
+    result = db_validator.backfill(overwrite=True)
+    assert (result.rows, result.updated) == (25, 1)
+    monkeypatch.undo()
+    plugin.db.session.expire_all()
+    assert len(plugin.db.query(plugin.Test).all()) == 25
+
+
+def test_db_validator_scan(monkeypatch):
+    """
+        .. test:: GbDbValidation integrity scan
+           :tags: gwdbvalidator_pattern;
+
+           Tests the detection of mismatched, missing and orphaned hashes by a scan of the complete table and
+           by scans of split key ranges.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("HASH_DB_CACHE_SIZE", 100)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    db_validator = plugin.validators.db.register("db_test_validator", "my db test validator", plugin.Test)
+    hash_model = app.validators.db.Hashes
+
+    for index in range(30):
+        plugin.db.add(plugin.Test(name="entry_%s" % index))
+    plugin.db.commit()
+
+    result = db_validator.scan(batch_size=7)
+    assert (result.rows, result.mismatched, result.missing, result.orphaned) == (30, [], [], [])
+
+    # Manipulations, which are done without the ORM
+    plugin.db.engine.execute("UPDATE test SET name='not_working' WHERE id=3")
+    plugin.db.engine.execute("DELETE FROM test WHERE id=7")
+    plugin.db.engine.execute("INSERT INTO test (id, name) VALUES (31, 'entry_30')")
+    # The deleted hash is still cached, but the scan reads the hash database directly
+    app.validators.db.db.query(hash_model).filter(hash_model.hash_id == "db_test_validator.test.5").delete()
+    app.validators.db.db.commit()
+
+    # Hashes are read by own sessions, so that the session of the hash database does not get rolled back
+    def shared_rollback():
+        raise AssertionError("Session of the hash database must not be rolled back")
+
+    monkeypatch.setattr(app.validators.db.db, "rollback", shared_rollback)
+    states = []
+    result = db_validator.scan(batch_size=7, max_rows_per_second=100000, progress=states.append)
+    monkeypatch.undo()
+    assert [state.rows for state in states] == [7, 14, 21, 28, 30]
+    assert result.rows == 30
+    assert result.mismatched == [(3,)]
+    assert result.missing == [(5,), (31,)]
+    assert result.orphaned == ["db_test_validator.test.7"]
+    assert result.last_key == (31,)
+
+    ranges = db_validator.split_key_ranges(3)
+    assert ranges == [(None, (11,)), ((11,), (21,)), ((21,), None)]
+    results = [db_validator.scan(start_after=start_after, end_at=end_at) for start_after, end_at in ranges]
+    assert [range_result.rows for range_result in results] == [10, 10, 10]
+    assert sum([range_result.mismatched + range_result.missing for range_result in results], []) == \
+        [(3,), (5,), (31,)]
+    assert all(not range_result.orphaned for range_result in results)
+
+
+def test_db_validator_compact_schema(tmpdir):
+    """
+        .. test:: GbDbValidation compact hash schema
+           :tags: gwdbvalidator_pattern;
+
+           Tests the storage of hashes as raw digests with a composite primary key, if HASH_DB_SCHEMA is "compact".
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("HASH_DB", "sqlite:///%s" % tmpdir.join("hash.db").strpath)
+    app.config.set("HASH_DB_SCHEMA", "compact")
+    app.config.set("HASH_DB_CACHE_SIZE", 0)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    db_validator = plugin.validators.db.register("db_test_validator", "my db test validator", plugin.Test,
+                                                 algorithm="blake2b-128")
+    assert app.validators.db.Hashes is None
+    assert isinstance(db_validator.hash_store, CompactHashStore)
+
+    entries = [plugin.Test(name="entry_%s" % index) for index in range(10)]
+    for entry in entries:
+        plugin.db.add(entry)
+    plugin.db.commit()
+
+    # Binary primary key columns need a length for some databases
+    for dialect, column_type in ((mysql, "VARBINARY(512)"), (mssql, "VARBINARY(512)"), (oracle, "RAW(512)")):
+        ddl = str(CreateTable(app.validators.db.RowHashes.__table__).compile(dialect=dialect.dialect()))
+        assert "row_key %s NOT NULL" % column_type in ddl
+
+    row_hashes = app.validators.db.RowHashes.query.all()
+    assert len(row_hashes) == 10
+    assert all(len(row_hash.digest) == 16 and row_hash.algorithm == "blake2b-128" for row_hash in row_hashes)
+    assert db_validator.hash_store.get([db_validator._get_hash_id((1,))])[(1, b"1")] == \
+        db_validator.validator.hash(entries[0])
+
+    # Updates overwrite the stored digest
+    entries[0].name = "changed"
+    plugin.db.commit()
+    assert len(plugin.db.query(plugin.Test).all()) == 10
+
+    plugin.db.engine.execute("UPDATE test SET name='not_working' WHERE id=3")
+    plugin.db.session.expire_all()
+    with pytest.raises(ValidationError):
+        plugin.db.query(plugin.Test).all()
+
+    plugin.db.engine.execute("DELETE FROM test WHERE id=7")
+    result = db_validator.scan(batch_size=4)
+    assert (result.rows, result.mismatched, result.missing) == (9, [(3,)], [])
+    assert result.orphaned == ["db_test_validator.test.7"]
+
+
+def test_db_validator_composite_keys():
+    """
+        .. test:: GbDbValidation composite primary keys
+           :tags: gwdbvalidator_pattern;
+
+           Tests the validation of models, whose primary key is not named "id" or consists of multiple columns.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Item = None
+            self.Number = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Item(self.db.Base):
+                __tablename__ = "item"
+                region = Column(String(64), primary_key=True)
+                code = Column(String(64), primary_key=True)
+                name = Column(String(512), nullable=False)
+
+            class Number(self.db.Base):
+                __tablename__ = "number"
+                number = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False)
+
+            self.Item = self.db.classes.register(Item)
+            self.Number = self.db.classes.register(Number)
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("HASH_DB_CACHE_SIZE", 0)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    item_validator = plugin.validators.db.register("item_validator", "my item validator", plugin.Item)
+    number_validator = plugin.validators.db.register("number_validator", "my number validator", plugin.Number)
+    hash_model = app.validators.db.Hashes
+
+    # Both keys would be "a.b.c" without escaping
+    items = [plugin.Item(region="a.b", code="c", name="first"),
+             plugin.Item(region="a", code="b.c", name="second"),
+             plugin.Item(region="d\\", code="e", name="third")]
+    numbers = [plugin.Number(number=index, name="number_%s" % index) for index in range(5)]
+    for entry in items + numbers:
+        plugin.db.add(entry)
+    plugin.db.commit()
+
+    hash_ids = sorted(row.hash_id for row in hash_model.query.all())
+    assert hash_ids[:3] == ["item_validator.item.a.b\\.c", "item_validator.item.a\\.b.c",
+                            "item_validator.item.d\\\\.e"]
+    assert hash_ids[3:] == ["number_validator.number.%s" % index for index in range(5)]
+    assert len(plugin.db.query(plugin.Item).all()) == 3
+    assert len(plugin.db.query(plugin.Number).all()) == 5
+
+    # Changed primary keys get a new hash
+    items[2].code = "f"
+    plugin.db.commit()
+    assert len(plugin.db.query(plugin.Item).all()) == 3
+
+    plugin.db.engine.execute("UPDATE item SET name='not_working' WHERE region='a' AND code='b.c'")
+    plugin.db.session.expire_all()
+    with pytest.raises(ValidationError):
+        plugin.db.query(plugin.Item).all()
+
+    result = item_validator.scan()
+    assert (result.rows, result.mismatched, result.missing) == (3, [("a", "b.c")], [])
+    assert result.orphaned == ["item_validator.item.d\\\\.e"]
+    assert number_validator.scan().orphaned == []
+
+
+def test_db_validator_hash_column():
+    """
+        .. test:: GbDbValidation hash column
+           :tags: gwdbvalidator_pattern;
+
+           Tests the storage of hashes inside a column of the validated model, which gets checked without any
+           request on the hash database.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Mapped = None
+            self.Added = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Mapped(self.db.Base):
+                __tablename__ = "mapped"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False)
+                row_hash = Column(String(256))
+
+            class Added(self.db.Base):
+                __tablename__ = "added"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False)
+                # Column defaults are set after the ORM events before the insert or update
+                status = Column(String(20), default="new", onupdate="changed")
+                created = Column(String(20), server_default="server")
+
+            self.Mapped = self.db.classes.register(Mapped)
+            self.Added = self.db.classes.register(Added)
+            # The column of Added gets created by create_all()
+            self.validators.db.register("added_validator", "my added validator", self.Added, hash_column="row_hash")
+            self.db.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("VALIDATION_METRICS", True)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    mapped_validator = plugin.validators.db.register("mapped_validator", "my mapped validator", plugin.Mapped,
+                                                     hash_column="row_hash")
+    assert mapped_validator.attributes == ["id", "name"]
+
+    mapped = [plugin.Mapped(name="mapped_%s" % index) for index in range(5)]
+    added = [plugin.Added(name="added_%s" % index) for index in range(5)]
+    for entry in mapped + added:
+        plugin.db.add(entry)
+    plugin.db.commit()
+
+    assert app.validators.db.Hashes.query.count() == 0
+    assert mapped[0].row_hash == mapped_validator.validator.hash(mapped[0])
+    assert added[0].row_hash is not None
+
+    # Hashes of defaulted columns are valid after insert and update
+    added[1].name = "changed"
+    plugin.db.commit()
+    plugin.db.session.expunge_all()
+    added = plugin.db.query(plugin.Added).order_by(plugin.Added.id).all()
+    assert [(entry.status, entry.created) for entry in added[:2]] == [("new", "server"), ("changed", "server")]
+
+    entry = plugin.db.query(plugin.Mapped).filter_by(id=2).first()
+    entry.name = "changed"
+    plugin.db.commit()
+    # New loaded instances get checked as well
+    plugin.db.session.expunge_all()
+    app.validators.metrics.reset()
+    assert len(plugin.db.query(plugin.Mapped).all()) == 5
+    assert len(plugin.db.query(plugin.Added).all()) == 5
+    assert app.validators.get_metrics("hash_db") == {}
+    assert app.validators.get_metrics("mapped_validator.mapped")["counters"]["checked_rows"] == 5
+
+    plugin.db.engine.execute("UPDATE mapped SET name='not_working' WHERE id=3")
+    plugin.db.session.expunge_all()
+    with pytest.raises(ValidationError):
+        plugin.db.query(plugin.Mapped).all()
+    # The primary key is part of the hash, so a row and its hash can not be copied to another row
+    plugin.db.engine.execute("UPDATE mapped SET name=(SELECT name FROM mapped WHERE id=1), "
+                             "row_hash=(SELECT row_hash FROM mapped WHERE id=1) WHERE id=4")
+    result = mapped_validator.scan()
+    assert (result.rows, result.mismatched, result.missing, result.orphaned) == (5, [(3,), (4,)], [], [])
+
+    # Rows without hash get it by a backfill
+    plugin.db.engine.execute("INSERT INTO added (id, name) VALUES (6, 'added_5')")
+    plugin.db.session.expunge_all()
+    with pytest.raises(ValidationError):
+        plugin.db.query(plugin.Added).all()
+    added_validator = plugin.validators.db.get("added_validator")
+    result = added_validator.backfill()
+    assert (result.rows, result.inserted, result.skipped) == (6, 1, 5)
+    plugin.db.session.expunge_all()
+    assert len(plugin.db.query(plugin.Added).all()) == 6
+
+
+def test_db_validator_session_isolation(tmpdir):
+    """
+        .. test:: GbDbValidation session isolation
+           :tags: gwdbvalidator_pattern;
+
+           Tests that commits and rollbacks of one validated database do not affect the hashes of another one.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db_a = None
+            self.db_b = None
+            self.TestA = None
+            self.TestB = None
+
+        def activate(self):
+            self.db_a = self.app.databases.register("test_db_a", "sqlite:///%s" % tmpdir.join("a.db").strpath,
+                                                    "database a for test values")
+            self.db_b = self.app.databases.register("test_db_b", "sqlite:///%s" % tmpdir.join("b.db").strpath,
+                                                    "database b for test values")
+
+            class TestA(self.db_a.Base):
+                __tablename__ = "t_a"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False)
+
+            class TestB(self.db_b.Base):
+                __tablename__ = "t_b"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False)
+
+            self.TestA = self.db_a.classes.register(TestA)
+            self.TestB = self.db_b.classes.register(TestB)
+            self.db_a.create_all()
+            self.db_b.create_all()
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("HASH_DB", "sqlite:///%s" % tmpdir.join("hash.db").strpath)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    plugin.validators.db.register("v_a", "validator a", plugin.TestA)
+    plugin.validators.db.register("v_b", "validator b", plugin.TestB)
+    hash_model = app.validators.db.Hashes
+
+    entry_a = plugin.TestA(name="a")
+    plugin.db_a.add(entry_a)
+    plugin.db_a.session.flush()
+    plugin.db_b.add(plugin.TestB(name="b"))
+    plugin.db_b.session.flush()
+    # Not committed hashes are used for validations of the same session
+    plugin.db_a.session.refresh(entry_a)
+    plugin.db_b.rollback()
+    plugin.db_a.commit()
+
+    hash_ids = [row.hash_id for row in hash_model.query.all()]
+    assert hash_ids == ["v_a.t_a.1"]
+    assert len(plugin.db_a.query(plugin.TestA).all()) == 1
+
+    # Hashes of a closed session are discarded together with its transaction
+    plugin.db_b.add(plugin.TestB(id=7, name="closed"))
+    plugin.db_b.session.flush()
+    plugin.db_b.session.close()
+    plugin.db_b.add(plugin.TestB(id=1, name="b"))
+    plugin.db_b.commit()
+    hash_ids = [row.hash_id for row in hash_model.query.all()]
+    assert hash_ids == ["v_a.t_a.1", "v_b.t_b.1"]
+
+    # Validating reads do not keep a read transaction of the hash database open, so hashes committed later on are
+    # visible, even if the hash database uses snapshots for its transactions (like SQLite in WAL mode)
+    hash_engine = app.validators.db.db.engine
+    hash_engine.execute("PRAGMA journal_mode=WAL")
+    event.listen(hash_engine, "connect", lambda connection, record: setattr(connection, "isolation_level", None))
+    event.listen(hash_engine, "begin", lambda connection: connection.execute("BEGIN"))
+    # The connection of the hash model queries above was opened before the listeners were added
+    app.validators.db.db.session.close()
+    plugin.db_a.session.expire_all()
+    assert len(plugin.db_a.query(plugin.TestA).all()) == 1
+    new_entry = plugin.TestA(name="new")
+    plugin.db_a.add(new_entry)
+    plugin.db_a.commit()
+    plugin.db_a.session.expire_all()
+    assert len(plugin.db_a.query(plugin.TestA).all()) == 2
+
+
+def test_db_validator_shared_hash_db(tmpdir):
+    """
+        .. test:: GbDbValidation shared hash database
+           :tags: gwdbvalidator_pattern;
+
+           Tests that updates of another application do not cause validation errors because of cached hashes.
+        """
+
+    class My_Plugin(GwDbValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite:///%s" % tmpdir.join("test.db").strpath,
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+            self.validators.db.register("db_test_validator", "my db test validator", self.Test)
+
+        def deactivate(self):
+            pass
+
+    plugins = []
+    for cache_size in [0, 100]:
+        app = groundwork.App()
+        app.config.set("HASH_DB", "sqlite:///%s" % tmpdir.join("hash.db").strpath)
+        if cache_size:
+            app.config.set("HASH_DB_CACHE_SIZE", cache_size)
+        plugin = My_Plugin(app)
+        plugin.activate()
+        plugins.append(plugin)
+    assert plugins[0].app.validators.db.hash_cache is None
+    plugin_1, plugin_2 = plugins[1], plugins[0]
+
+    entry_1 = plugin_1.Test(name="entry")
+    plugin_1.db.add(entry_1)
+    plugin_1.db.commit()
+    assert plugin_1.app.validators.db.hash_cache.get("db_test_validator.test.1") is not None
+
+    entry_2 = plugin_2.db.query(plugin_2.Test).first()
+    entry_2.name = "updated"
+    plugin_2.db.commit()
+
+    # The cached hash is outdated, so it gets requested again
+    plugin_1.db.session.refresh(entry_1)
+    assert entry_1.name == "updated"
+
+    plugin_2.db.engine.execute("UPDATE test SET name='not_working' WHERE id=1")
+    with pytest.raises(ValidationError):
+        plugin_1.db.session.refresh(entry_1)
@@ -1,3 +1,6 @@
+import hashlib
+import os
+import pickle
 import pytest
 import sys
 import groundwork
@@ -153,3 +156,335 @@ def test_file_validator_validate_errors(tmpdir):
     else:
         with pytest.raises(FileNotFoundError):
             plugin.validators.file.validate(test_file_1.strpath, hash_file="NoFilePath")
+
+
+def test_file_validator_hash_many(tmpdir):
+    """
+    .. test:: GwFileValidator parallel hashing test
+       :tags: gwfilevalidators
+
+       Tests the parallel hashing and validation of multiple files.
+    """
+    files = []
+    for index in range(20):
+        test_file = tmpdir.join("test_%s.txt" % index)
+        test_file.write("content_%s" % index)
+        files.append(test_file.strpath)
+    missing_file = tmpdir.join("missing.txt").strpath
+
+    class My_Plugin(GwFileValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    results = {result.file: result for result in plugin.validators.file.hash_many(files + [missing_file], workers=3)}
+    assert len(results) == 21
+    for file in files:
+        assert results[file].error is None
+        assert results[file].hash == plugin.validators.file.hash(file)
+    assert results[missing_file].hash is None
+    assert isinstance(results[missing_file].error, (IOError, OSError))
+
+    expected_hashes = {file: results[file].hash for file in files}
+    expected_hashes[files[0]] = "NoWay"
+    expected_hashes[missing_file] = "NoWay"
+    results = {result.file: result for result in plugin.validators.file.validate_many(expected_hashes)}
+    assert results[files[0]].valid is False
+    assert results[missing_file].valid is False
+    assert results[missing_file].error is not None
+    assert all(results[file].valid for file in files[1:])
+
+
+def test_file_validator_hash_paths(tmpdir):
+    """
+    .. test:: GwFileValidator read and mmap hashing test
+       :tags: gwfilevalidators
+
+       Tests that all reading strategies and block sizes result in the plain sha256 digest of the file content.
+    """
+    content = b"".join([bytes([index % 256]) for index in range(300000)])
+    test_file = tmpdir.join("test.bin")
+    test_file.write_binary(content)
+    empty_file = tmpdir.join("empty.bin")
+    empty_file.write_binary(b"")
+
+    class My_Plugin(GwFileValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    for file, file_content in ((test_file.strpath, content), (empty_file.strpath, b"")):
+        expected_hash = hashlib.sha256(file_content).hexdigest()
+        assert plugin.validators.file.hash(file) == expected_hash
+        assert plugin.validators.file.hash(file, use_mmap=True) == expected_hash
+        assert plugin.validators.file.hash(file, blocksize=1000) == expected_hash
+        assert plugin.validators.file.hash(file, blocksize=1000, use_mmap=True) == expected_hash
+        assert plugin.validators.file.validate(file, expected_hash, use_mmap=True)
+
+    # Validators with the legacy pickle encoder hash each pickled block
+    legacy_validator = plugin.validators.register("legacy", "legacy file validator", encoder="pickle")
+    legacy_hash = hashlib.sha256()
+    for start in range(0, len(content), 65536):
+        legacy_hash.update(pickle.dumps(content[start:start + 65536]))
+    assert plugin.validators.file.hash(test_file.strpath, validator=legacy_validator) == legacy_hash.hexdigest()
+
+
+def test_file_validator_hash_cache(tmpdir):
+    """
+    .. test:: GwFileValidator persistent hash cache test
+       :tags: gwfilevalidators
+
+       Tests that stored hashes are reused for unchanged files and ignored for changed or recently modified files.
+    """
+    test_file = tmpdir.join("test.txt")
+    test_file.write("content")
+    os.utime(test_file.strpath, (1000000000, 1000000000))
+
+    class My_Plugin(GwFileValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("VALIDATION_FILE_CACHE", tmpdir.join("cache.db").strpath)
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    cache = app.validators.file.cache
+    content_hash = hashlib.sha256(b"content").hexdigest()
+    assert plugin.validators.file.hash(test_file.strpath) == content_hash
+    assert len(cache) == 1
+
+    # Same size and same mtime: The file is not read again, so the stored hash is returned
+    test_file.write("CONTENT")
+    os.utime(test_file.strpath, (1000000000, 1000000000))
+    assert plugin.validators.file.hash(test_file.strpath) == content_hash
+    assert plugin.validators.file.validate(test_file.strpath, content_hash)
+
+    # Validations can bypass the stored hash as well
+    results = list(plugin.validators.file.validate_many({test_file.strpath: content_hash}, rehash=True))
+    assert not results[0].valid
+    assert not plugin.validators.file.validate(test_file.strpath, content_hash, rehash=True)
+
+    # Forced rehash updates the stored hash
+    assert plugin.validators.file.hash(test_file.strpath, rehash=True) == hashlib.sha256(b"CONTENT").hexdigest()
+    assert plugin.validators.file.hash(test_file.strpath) == hashlib.sha256(b"CONTENT").hexdigest()
+
+    # Changed mtime
+    os.utime(test_file.strpath, (1000000010, 1000000010))
+    test_file.write("content")
+    os.utime(test_file.strpath, (1000000010, 1000000010))
+    assert plugin.validators.file.hash(test_file.strpath) == content_hash
+
+    # Recently modified files are not stored
+    racy_file = tmpdir.join("racy.txt")
+    racy_file.write("content")
+    assert plugin.validators.file.hash(racy_file.strpath) == content_hash
+    assert len(cache) == 1
+
+    # The cache is persistent
+    app_2 = groundwork.App()
+    app_2.config.set("VALIDATION_FILE_CACHE", tmpdir.join("cache.db").strpath)
+    plugin_2 = My_Plugin(app_2)
+    assert len(app_2.validators.file.cache) == 1
+    assert plugin_2.validators.file.hash(test_file.strpath) == content_hash
+
+
+@pytest.mark.parametrize("manifest_format", ["sha256sum", "json"])
+def test_file_validator_hash_tree(tmpdir, manifest_format):
+    """
+    .. test:: GwFileValidator directory tree manifest test
+       :tags: gwfilevalidators
+
+       Tests the creation of a manifest for a directory tree and the detection of added, removed and modified files.
+    """
+    root = tmpdir.mkdir("root")
+    root.join("a.txt").write("a")
+    root.mkdir("sub").join("b.txt").write("b")
+    root.join("sub").join("back\\slash.txt").write("c")
+    root.join("ignored.log").write("log")
+    root.mkdir("tmp").join("c.txt").write("c")
+    manifest = root.join("manifest.%s" % manifest_format).strpath
+
+    class My_Plugin(GwFileValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    exclude = ["*.log", "tmp"]
+    hashes = plugin.validators.file.hash_tree(root.strpath, exclude=exclude, manifest=manifest, format=manifest_format)
+    assert sorted(hashes.keys()) == ["a.txt", "sub/b.txt", "sub/back\\slash.txt"]
+    assert hashes["sub/b.txt"] == hashlib.sha256(b"b").hexdigest()
+    if manifest_format == "sha256sum":
+        with open(manifest) as manifest_file:
+            assert "%s  a.txt\n" % hashlib.sha256(b"a").hexdigest() in manifest_file.read()
+
+    result = plugin.validators.file.verify_tree(root.strpath, manifest, exclude=exclude)
+    assert result == ([], [], [])
+
+    root.join("a.txt").write("changed")
+    root.join("sub").join("b.txt").remove()
+    root.join("new.txt").write("new")
+    root.join("tmp").join("d.txt").write("d")
+    result = plugin.validators.file.verify_tree(root.strpath, manifest, exclude=exclude)
+    assert result.added == ["new.txt"]
+    assert result.removed == ["sub/b.txt"]
+    assert result.modified == ["a.txt"]
+
+    assert sorted(plugin.validators.file.hash_tree(root.strpath, include="sub/*").keys()) == ["sub/back\\slash.txt"]
+    with pytest.raises(ValueError):
+        plugin.validators.file.hash_tree(root.strpath, format="unknown")
+
+
+def test_file_validator_hash_chunked(tmpdir):
+    """
+    .. test:: GwFileValidator Merkle tree test
+       :tags: gwfilevalidators
+
+       Tests the chunked hashing of a file, the detection of changed byte ranges and the incremental rehashing.
+    """
+    content = bytearray(b"".join([bytes([index % 256]) for index in range(10000)]))
+    test_file = tmpdir.join("test.bin")
+    test_file.write_binary(bytes(content))
+
+    class My_Plugin(GwFileValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    tree = plugin.validators.file.hash_chunked(test_file.strpath, chunk_size=1000, workers=4)
+    assert len(tree.leaves) == 10
+    assert tree.leaves[0] == hashlib.sha256(b"\x00" + bytes(content[:1000])).hexdigest()
+    assert tmpdir.join("test.bin.merkle").check()
+    assert plugin.validators.file.verify_chunked(test_file.strpath) == (True, [])
+
+    content[1500] ^= 0xFF
+    content[2500] ^= 0xFF
+    content[7000] ^= 0xFF
+    test_file.write_binary(bytes(content))
+    result = plugin.validators.file.verify_chunked(test_file.strpath, stop_early=False)
+    assert result.valid is False
+    assert result.changed == [(1000, 3000), (7000, 8000)]
+    result = plugin.validators.file.verify_chunked(test_file.strpath, workers=1)
+    assert result.valid is False
+    assert len(result.changed) == 1
+
+    new_tree = plugin.validators.file.rehash_chunked(test_file.strpath)
+    assert new_tree == plugin.validators.file.hash_chunked(test_file.strpath, chunk_size=1000, tree_file=False)
+    assert new_tree.root != tree.root
+    assert plugin.validators.file.verify_chunked(test_file.strpath).valid is True
+
+    # Appended data
+    test_file.write_binary(bytes(content) + b"appended")
+    assert plugin.validators.file.verify_chunked(test_file.strpath).changed == [(10000, 10008)]
+    new_tree = plugin.validators.file.rehash_chunked(test_file.strpath, chunks=[])
+    assert new_tree == plugin.validators.file.hash_chunked(test_file.strpath, chunk_size=1000, tree_file=False)
+
+    # Truncated data
+    test_file.write_binary(bytes(content[:4500]))
+    assert plugin.validators.file.verify_chunked(test_file.strpath, stop_early=False).changed == [(4000, 10008)]
+    new_tree = plugin.validators.file.rehash_chunked(test_file.strpath)
+    assert len(new_tree.leaves) == 5
+    assert new_tree == plugin.validators.file.hash_chunked(test_file.strpath, chunk_size=1000, tree_file=False)
+
+
+def test_file_validator_algorithms(tmpdir):
+    """
+    .. test:: GwFileValidator hash algorithm test
+       :tags: gwfilevalidators
+
+       Tests hashing of files with other algorithms than sha256 and the validation of hashes of mixed algorithms.
+    """
+    test_file = tmpdir.join("test.txt")
+    test_file.write_binary(b"content")
+
+    class My_Plugin(GwFileValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    app.config.set("VALIDATION_FILE_CACHE", tmpdir.join("cache.db").strpath)
+    plugin = My_Plugin(app)
+    plugin.activate()
+    blake_validator = plugin.validators.register("blake_validator", "test validator", algorithm="blake2s-128")
+
+    sha_hash = plugin.validators.file.hash(test_file.strpath)
+    blake_hash = plugin.validators.file.hash(test_file.strpath, validator=blake_validator)
+    assert blake_hash == "blake2s-128:%s" % hashlib.blake2s(b"content", digest_size=16).hexdigest()
+    # The file hash cache stores hashes per algorithm
+    assert plugin.validators.file.hash(test_file.strpath) == sha_hash
+
+    assert plugin.validators.file.validate(test_file.strpath, blake_hash) is True
+    assert plugin.validators.file.validate(test_file.strpath, sha_hash, validator=blake_validator) is True
+    assert plugin.validators.file.validate(test_file.strpath, "unknown:%s" % sha_hash) is False
+    results = plugin.validators.file.validate_many({test_file.strpath: blake_hash})
+    assert [result.valid for result in results] == [True]
+
+    tree = plugin.validators.file.hash_chunked(test_file.strpath, chunk_size=4, validator=blake_validator)
+    assert tree.algorithm == "blake2s-128"
+    assert plugin.validators.file.verify_chunked(test_file.strpath).valid is True
+
+    # Checksum manifests contain plain hexdigests, like the ones of b2sum
+    manifest = tmpdir.join("manifest.b2")
+    b2_validator = plugin.validators.register("b2_validator", "test validator", algorithm="blake2b")
+    plugin.validators.file.hash_tree(tmpdir.strpath, include="*.txt", manifest=manifest.strpath,
+                                     validator=b2_validator)
+    assert manifest.read() == "%s  test.txt\n" % hashlib.blake2b(b"content").hexdigest()
+    result = plugin.validators.file.verify_tree(tmpdir.strpath, manifest.strpath, include="*.txt",
+                                                validator=b2_validator)
+    assert result == ([], [], [])
+    result = plugin.validators.file.verify_tree(tmpdir.strpath, manifest.strpath, include="*.txt")
+    assert result.modified == ["test.txt"]
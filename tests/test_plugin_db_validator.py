@@ -1,4 +1,5 @@
 import pytest
+from click.testing import CliRunner
 from sqlalchemy import Column, String, Integer
 
 import groundwork
@@ -89,3 +90,52 @@ def test_validation():
     test_plugin.db.add(test_entry_1)
     test_plugin.db.commit()
     test_plugin.db.session.refresh(test_entry_1)
+
+
+def test_backfill_command():
+    """
+    .. test:: Backfill of existing rows
+       :tags: gwdbvalidator_plugin;
+
+       Tests the command validation_backfill, which creates hashes for rows, which existed before the validation
+       was activated.
+    """
+    app = groundwork.App()
+
+    class My_Plugin(GwSqlPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+            self.db = None
+            self.Test = None
+
+        def activate(self):
+            self.db = self.app.databases.register("test_db",
+                                                  "sqlite://",
+                                                  "database for test values")
+
+            class Test(self.db.Base):
+                __tablename__ = "test"
+                id = Column(Integer, primary_key=True)
+                name = Column(String(512), nullable=False, unique=True)
+
+            self.Test = self.db.classes.register(Test)
+            self.db.create_all()
+
+    test_plugin = My_Plugin(app)
+    test_plugin.activate()
+    test_plugin.db.engine.execute("INSERT INTO test (id, name) VALUES (1, 'blub')")
+
+    validator_plugin = GwDbValidator(app)
+    validator_plugin.activate()
+    hash_db_model = app.databases.get("hash_db").classes.get("Hashes")
+    assert hash_db_model.query.count() == 0
+
+    command = app.commands.get("validation_backfill")
+    result = CliRunner().invoke(command.click_command, ["--batch-size", "10"])
+    assert result.exit_code == 0
+    assert "1 hashes added" in result.output
+    assert hash_db_model.query.count() == 1
+
+    result = CliRunner().invoke(command.click_command, ["--validator", "unknown"])
+    assert "does not exist" in result.output
@@ -1,3 +1,13 @@
+import datetime
+import hashlib
+import pickle
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
 import groundwork
 from groundwork_validation.patterns import GwValidatorsPattern
 
@@ -47,3 +57,262 @@ def test_validator_init():
     app = groundwork.App()
     plugin = My_Plugin(app)
     plugin.activate()
+
+
+def test_validator_encoders():
+    """
+    .. test:: gwvalidator encoder tests
+       :tags: gwvalidator
+
+       Tests the stable output of the canonical encoder and the legacy pickle encoder.
+    """
+
+    class My_Plugin(GwValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    validator = plugin.validators.register("canonical_validator", "test validator")
+    data = {"a": [1, 2.5, None, True], "b": ("x", b"y")}
+    # The canonical representation must not change between python versions
+    assert validator.hash(data) == "8069f23fb35ba339f822d8d8a46b94ba79765050e702f4c8f84a39e90e377dbd"
+    assert validator.hash({"b": ("x", b"y"), "a": [1, 2.5, None, True]}) == validator.hash(data)
+    assert validator.hash([1]) != validator.hash((1,))
+    assert validator.hash("1") != validator.hash(1)
+    assert validator.hash(["ab", "c"]) != validator.hash(["a", "bc"])
+
+    complex_data = [Decimal("1.50"), datetime.datetime(2017, 1, 2, 3, 4, 5), datetime.date(2017, 1, 2),
+                    uuid.UUID(int=5), {1, 2, 3}, OrderedDict(a=1), object]
+    assert validator.validate(complex_data, validator.hash(complex_data)) is True
+
+    pickle_validator = plugin.validators.register("pickle_validator", "test validator", encoder="pickle")
+    assert pickle_validator.hash(data) == hashlib.sha256(pickle.dumps(data)).hexdigest()
+
+    with pytest.raises(KeyError):
+        plugin.validators.register("unknown_validator", "test validator", encoder="unknown")
+
+
+def test_validator_attributes():
+    """
+    .. test:: gwvalidator attribute tests
+       :tags: gwvalidator
+
+       Tests the hashing of configured attributes only.
+    """
+
+    class My_Plugin(GwValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    class Data:
+        def __init__(self, **kwargs):
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin.activate()
+
+    validator = plugin.validators.register("attr_validator", "test validator", attributes=["a", "b"])
+    data = Data(a=1, b="test", c="ignored")
+    my_hash = validator.hash(data)
+    assert my_hash == validator.hash(Data(a=1, b="test", c="other"))
+    assert my_hash == validator.hash_values((1, "test"))
+    assert my_hash != validator.hash(Data(a=2, b="test"))
+
+    # Missing attributes are hashed as None
+    assert validator.hash(Data(a=1)) == validator.hash_values((1, None))
+    with pytest.raises(AttributeError):
+        validator.hash(Data(a=1), strict=True)
+
+    single_validator = plugin.validators.register("single_validator", "test validator", attributes=["a"])
+    assert single_validator.hash(data) == single_validator.hash_values((1,))
+
+
+def test_validator_registry():
+    """
+    .. test:: gwvalidator registry tests
+       :tags: gwvalidator
+
+       Tests the lookup of validators by name and plugin and the registration from multiple threads.
+    """
+    class My_Plugin(GwValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    class My_Plugin_2(My_Plugin):
+        def __init__(self, app, **kwargs):
+            super(My_Plugin_2, self).__init__(app, **kwargs)
+            self.name = "My_Plugin_2"
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    plugin_2 = My_Plugin_2(app)
+
+    validator = plugin.validators.register("my_validator", "test validator")
+    validator_2 = plugin_2.validators.register("my_validator_2", "test validator")
+
+    assert plugin.validators.get("my_validator") is validator
+    assert plugin.validators.get("my_validator_2") is None
+    assert plugin.validators.get() == {"my_validator": validator}
+    assert plugin_2.validators.get() == {"my_validator_2": validator_2}
+    assert app.validators.get("my_validator_2") is validator_2
+    assert app.validators.get() == {"my_validator": validator, "my_validator_2": validator_2}
+
+    with pytest.raises(KeyError):
+        plugin_2.validators.register("my_validator", "test validator")
+
+    def register(index):
+        return plugin.validators.register("thread_validator_%s" % index, "test validator")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        validators = list(executor.map(register, range(200)))
+    assert len(plugin.validators.get()) == 201
+    assert plugin.validators.get("thread_validator_199") is validators[199]
+
+    plugin.validators.unregister("my_validator")
+    assert plugin.validators.get("my_validator") is None
+    assert "my_validator" not in plugin.validators.get()
+    with pytest.raises(KeyError):
+        plugin.validators.unregister("my_validator")
+
+
+def test_validator_metrics():
+    """
+    .. test:: gwvalidator metrics tests
+       :tags: gwvalidator
+
+       Tests the collection of counters and histograms, if VALIDATION_METRICS is activated.
+    """
+    class My_Plugin(GwValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    validator = plugin.validators.register("my_validator", "test validator")
+    my_hash = validator.hash("test this")
+    assert app.validators.metrics is None
+    assert plugin.validators.get_metrics() == {}
+
+    app = groundwork.App()
+    app.config.set("VALIDATION_METRICS", True)
+    plugin = My_Plugin(app)
+    validator = plugin.validators.register("my_validator", "test validator")
+    assert validator.hash("test this") == my_hash
+    assert validator.validate("test this", my_hash) is True
+    assert validator.validate("test that", my_hash) is False
+
+    metrics = plugin.validators.get_metrics("my_validator")
+    assert metrics["counters"]["hash_calls"] == 3
+    assert metrics["counters"]["bytes_hashed"] > 0
+    assert metrics["counters"]["failed_validations"] == 1
+    histogram = metrics["histograms"]["hash_seconds"]
+    assert histogram["count"] == 3
+    assert sum(count for upper_bound, count in histogram["buckets"]) == 3
+    assert histogram["min"] <= histogram["max"] <= histogram["sum"]
+    assert plugin.validators.get_metrics("unknown") == {}
+
+    reports = []
+    app.signals.connect("metrics_receiver", "validation_metrics", lambda plugin, **kwargs: reports.append(kwargs),
+                        plugin, "Receives metrics")
+    app.validators.metrics.report()
+    assert reports[0]["metrics"]["my_validator"]["counters"]["hash_calls"] == 3
+
+    app.validators.metrics.reset()
+    assert plugin.validators.get_metrics() == {}
+
+
+def test_validator_algorithms():
+    """
+    .. test:: gwvalidator algorithm tests
+       :tags: gwvalidator
+
+       Tests the selection of hash algorithms by name and the validation of hashes with mixed algorithms.
+    """
+    class My_Plugin(GwValidatorsPattern):
+        def __init__(self, app, **kwargs):
+            self.name = "My_Plugin"
+            super(My_Plugin, self).__init__(app, **kwargs)
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    app = groundwork.App()
+    plugin = My_Plugin(app)
+    data = {"a": [1, 2, 3]}
+
+    sha_validator = plugin.validators.register("sha_validator", "test validator")
+    sha_hash = sha_validator.hash(data)
+    assert ":" not in sha_hash
+    assert sha_hash == plugin.validators.register("sha_function_validator", "test validator",
+                                                  algorithm=hashlib.sha256).hash(data)
+
+    blake_validator = plugin.validators.register("blake_validator", "test validator", algorithm="BLAKE2b-128")
+    blake_hash = blake_validator.hash(data)
+    assert blake_hash.startswith("blake2b-128:")
+    assert len(blake_hash.split(":")[1]) == 32
+    assert blake_validator.validate(data, blake_hash) is True
+    assert blake_validator.validate({"a": [1, 2]}, blake_hash) is False
+
+    # Hashes of other algorithms are validated by their own algorithm. Hashes without prefix are sha256 hashes.
+    assert sha_validator.validate(data, blake_hash) is True
+    assert blake_validator.validate(data, sha_hash) is True
+    assert blake_validator.validate(data, "sha256:%s" % sha_hash) is True
+    assert plugin.validators.register("blake_512_validator", "test validator",
+                                      algorithm="blake2b-512").hash(data).startswith("blake2b:")
+
+    crc_validator = plugin.validators.register("crc_validator", "test validator", algorithm="crc32")
+    crc_hash = crc_validator.hash(b"content", no_pickle=True)
+    assert crc_hash == "crc32:%08x" % zlib.crc32(b"content")
+    fast_validator = plugin.validators.register("fast_validator", "test validator", algorithm="fast")
+    assert fast_validator.algorithm_name in ["xxh3_64", "xxh64", "crc32"]
+    assert fast_validator.validate(data, fast_validator.hash(data)) is True
+    # Hashes of algorithms, which are not available on this host, are not valid
+    assert sha_validator.validate(data, "unknown:%s" % sha_hash) is False
+
+    with pytest.raises(KeyError):
+        plugin.validators.register("unknown_validator", "test validator", algorithm="unknown")
+    with pytest.raises(KeyError):
+        plugin.validators.register("blake_100_validator", "test validator", algorithm="blake2b-100")
+
+    app = groundwork.App()
+    app.config.set("VALIDATION_DEFAULT_ALGORITHM", "blake2s")
+    plugin = My_Plugin(app)
+    validator = plugin.validators.register("my_validator", "test validator")
+    assert validator.hash(data).startswith("blake2s:")
+    assert validator.validate(data, sha_hash) is True